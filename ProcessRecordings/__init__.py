@@ -1,42 +1,60 @@
 import azure.functions as func
 import logging
 import json
-from ringcentral import SDK
 import os
-from datetime import datetime, timedelta
-from office365.runtime.auth.client_credential import ClientCredential
-from office365.sharepoint.client_context import ClientContext
-from office365.sharepoint.files.file import File
+import time
+import base64
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from call_log_sync import CallLogSync
+from call_fields import call_field_values
+from client_holder import get_client, get_sharepoint_context
+from sharepoint_io import upload_content
+from transcript_format import dumps_transcript, transcript_extension
+import metrics
+
+# Leads processed at the same time within one batch request
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '8'))
+
+# No new leads are started after this many seconds, leaving room under the
+# 10-minute functionTimeout in host.json for the ones already running
+BATCH_TIME_BUDGET_SECONDS = int(os.getenv('BATCH_TIME_BUDGET_SECONDS', '420'))
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request.')
 
     try:
-        # Get request body
+        # Get request body: either one phone_number/folder_path pair or a
+        # batch of them under "leads", optionally resumed with a continuation_token
         req_body = req.get_json()
-        phone_number = req_body.get('phone_number')
-        folder_path = req_body.get('folder_path')
+        leads = req_body.get('leads')
+        batch = leads is not None
+        if not batch:
+            leads = [{
+                'phone_number': req_body.get('phone_number'),
+                'folder_path': req_body.get('folder_path')
+            }]
 
-        if not phone_number or not folder_path:
+        if not leads or not all(
+            isinstance(lead, dict) and lead.get('phone_number') and lead.get('folder_path') for lead in leads
+        ):
             return func.HttpResponse(
-                "Please pass phone_number and folder_path in the request body",
+                "Please pass phone_number and folder_path in the request body, "
+                "or a list of them as leads",
                 status_code=400
             )
 
-        # Initialize RingCentral SDK
-        rcsdk = SDK(
-            os.environ["RC_CLIENT_ID"],
-            os.environ["RC_CLIENT_SECRET"],
-            os.environ["RC_SERVER_URL"]
-        )
-        platform = rcsdk.platform()
-        
-        # Authenticate using JWT
         try:
-            platform.auth().set_data({
-                'grant_type': 'urn:ietf:params:oauth:grant-type:jwt-bearer',
-                'assertion': os.environ["RC_JWT_TOKEN"]
-            })
+            offset = decode_continuation_token(req_body.get('continuation_token'), leads)
+        except ValueError as token_error:
+            return func.HttpResponse(str(token_error), status_code=400)
+
+        # Clients and tokens live at module level, so warm invocations reuse
+        # them and only authenticate again shortly before a token expires
+        try:
+            platform = get_client()
+            platform.token_provider()
         except Exception as auth_error:
             logging.error(f"RingCentral authentication error: {str(auth_error)}")
             return func.HttpResponse(
@@ -44,12 +62,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=401
             )
 
-        # Initialize SharePoint client
         try:
-            ctx = ClientContext(os.environ["SHAREPOINT_SITE_URL"]).with_client_credentials(
-                os.environ["SHAREPOINT_CLIENT_ID"],
-                os.environ["SHAREPOINT_CLIENT_SECRET"]
-            )
+            get_sharepoint_context()
         except Exception as sp_error:
             logging.error(f"SharePoint authentication error: {str(sp_error)}")
             return func.HttpResponse(
@@ -57,22 +71,89 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=401
             )
 
+        # One call-log sync serves every lead in the request
+        call_log = CallLogSync(platform)
+        call_log.sync()
+
+        results, next_offset = process_leads(platform, call_log, leads, offset)
+
+        if not batch:
+            if results[0]['status'] == 'error':
+                raise Exception(results[0]['error'])
+            return func.HttpResponse(
+                json.dumps({
+                    'status': 'success',
+                    'processed_recordings': results[0]['processed_recordings']
+                }),
+                mimetype="application/json"
+            )
+
+        done = next_offset >= len(leads)
+        return func.HttpResponse(
+            json.dumps({
+                'status': 'success' if done else 'partial',
+                'results': results,
+                'continuation_token': None if done else encode_continuation_token(next_offset, leads)
+            }),
+            mimetype="application/json"
+        )
+
+    except Exception as e:
+        logging.error(f'Error: {str(e)}')
+        metrics.stage_error('function.process_recordings')
+        return func.HttpResponse(
+            f"An error occurred: {str(e)}",
+            status_code=500
+        )
+
+    finally:
+        # Totals since the instance started, so warm invocations add up like counters
+        metrics.log_snapshot('process_recordings_metrics')
+
+def process_leads(platform, call_log, leads, offset=0):
+    """Process leads from offset with bounded concurrency until the time budget runs out
+
+    Leads are started in order, so everything before the returned offset has
+    finished and a follow-up request can resume from there.
+    """
+    deadline = time.monotonic() + BATCH_TIME_BUDGET_SECONDS
+    results = {}
+    next_offset = offset
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+        running = {}
+        while next_offset < len(leads) or running:
+            while (next_offset < len(leads) and len(running) < BATCH_WORKERS
+                   and time.monotonic() < deadline):
+                lead = leads[next_offset]
+                future = pool.submit(process_lead, platform, call_log, lead['phone_number'], lead['folder_path'])
+                running[future] = next_offset
+                next_offset += 1
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                results[running.pop(future)] = future.result()
+
+    return [results[index] for index in sorted(results)], next_offset
+
+@metrics.timed('function.process_lead')
+def process_lead(platform, call_log, phone_number, folder_path):
+    """Save RingSense transcripts for one lead's calls; returns the lead's result"""
+    result = {
+        'phone_number': phone_number,
+        'folder_path': folder_path,
+        'status': 'success',
+        'processed_recordings': []
+    }
+    try:
+        ctx = get_sharepoint_context()
+
         # Format phone number
         formatted_phone = format_phone_number(phone_number)
-        
-        # Get call recordings
-        response = platform.get('/restapi/v1.0/account/~/call-log', {
-            'type': 'Voice',
-            'phoneNumber': formatted_phone,
-            'view': 'Detailed',
-            'dateFrom': (datetime.now() - timedelta(days=30)).isoformat() + 'Z'
-        })
-        
-        calls = response.json().get('records', [])
+        calls = call_log.calls_for_phone(formatted_phone)
+
         logging.info(f'Found {len(calls)} calls for {phone_number}')
-        
-        processed_recordings = []
-        
+
         for call in calls:
             # Check if call has recording
             if call.get('recording') and call.get('recording').get('id'):
@@ -83,7 +164,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                         f'/restapi/v1.0/account/~/call-recordings/{recording_id}/ringsense'
                     )
                     transcript_data = transcript_response.json()
-                    
+
                     # Prepare transcript with metadata
                     transcript = {
                         'recording_id': recording_id,
@@ -97,47 +178,61 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                         },
                         'transcript': transcript_data
                     }
-                    
+
                     # Generate filename
                     timestamp = datetime.fromisoformat(
                         call['startTime'].replace('Z', '+00:00')
                     ).strftime('%Y%m%d_%H%M%S')
-                    
-                    filename = f"transcript_{timestamp}_{recording_id}.json"
+
+                    filename = f"transcript_{timestamp}_{recording_id}{transcript_extension()}"
                     file_path = f"{folder_path}/Transcripts_JSON/{filename}"
-                    
+
                     # Save to SharePoint
-                    File.save_content(
-                        ctx,
-                        file_path,
-                        json.dumps(transcript, indent=2)
-                    )
-                    
-                    processed_recordings.append({
+                    upload_content(ctx, file_path, dumps_transcript(transcript),
+                                   fields=call_field_values(transcript['call_metadata'], recording_id))
+                    metrics.record_transcript_saved('function', transcript['call_metadata'])
+
+                    result['processed_recordings'].append({
                         'recording_id': recording_id,
                         'transcript_path': file_path
                     })
-                    
+
                     logging.info(f'Processed recording {recording_id}')
-                    
+
                 except Exception as e:
                     logging.error(f'Error processing recording {recording_id}: {str(e)}')
+                    metrics.stage_error('function.process_lead')
                     continue
-        
-        return func.HttpResponse(
-            json.dumps({
-                'status': 'success',
-                'processed_recordings': processed_recordings
-            }),
-            mimetype="application/json"
-        )
-        
+
     except Exception as e:
-        logging.error(f'Error: {str(e)}')
-        return func.HttpResponse(
-            f"An error occurred: {str(e)}",
-            status_code=500
-        )
+        logging.error(f'Error processing lead {phone_number}: {str(e)}')
+        metrics.stage_error('function.process_lead')
+        result['status'] = 'error'
+        result['error'] = str(e)
+
+    return result
+
+def batch_fingerprint(leads):
+    """Identify a batch so a continuation token is only accepted for the same leads"""
+    material = json.dumps([[lead['phone_number'], lead['folder_path']] for lead in leads])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()[:16]
+
+def encode_continuation_token(offset, leads):
+    state = json.dumps({'offset': offset, 'batch': batch_fingerprint(leads)})
+    return base64.urlsafe_b64encode(state.encode('utf-8')).decode('ascii')
+
+def decode_continuation_token(token, leads):
+    """Offset to resume a batch from; 0 without a token"""
+    if not token:
+        return 0
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        offset = int(state['offset'])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid continuation_token")
+    if state.get('batch') != batch_fingerprint(leads) or not 0 <= offset <= len(leads):
+        raise ValueError("continuation_token does not belong to this batch of leads")
+    return offset
 
 def format_phone_number(phone):
     """Format phone number to E.164 format"""
@@ -146,4 +241,4 @@ def format_phone_number(phone):
         return f"+1{digits}"
     elif len(digits) == 11 and digits.startswith('1'):
         return f"+{digits}"
-    return f"+{digits}" 
\ No newline at end of file
+    return f"+{digits}"
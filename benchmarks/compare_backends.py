@@ -0,0 +1,202 @@
+"""Real-time factor and memory of each transcription backend on the benchmark recordings
+
+Each backend runs in its own spawned process, so peak memory is that
+backend's alone. The report has, per backend: model load time, the time
+and real-time factor (processing seconds per second of audio) of every
+recording and overall, peak RSS after loading and after transcribing,
+whether the result has Whisper's text/segments/language shape, and how
+closely its text agrees with the first backend's.
+
+    python -m benchmarks.compare_backends --model base --recordings 3 \\
+        --audio-seconds 120 --output backends.json
+
+Recordings are the synthetic fixtures the workflow benchmarks use unless
+--audio names real ones; transcript agreement only means something on
+real speech.
+"""
+import os
+import sys
+import json
+import time
+import difflib
+import argparse
+import resource
+import traceback
+import multiprocessing
+from datetime import datetime
+from benchmarks.fixtures import SAMPLE_RATE, synthetic_speech
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BACKENDS = ['whisper', 'faster-whisper']
+
+SEGMENT_KEYS = ('id', 'seek', 'start', 'end', 'text', 'tokens', 'temperature', 'avg_logprob',
+                'compression_ratio', 'no_speech_prob')
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+
+
+def has_whisper_shape(result):
+    return (
+        set(result) >= {'text', 'segments', 'language'}
+        and all(set(segment) >= set(SEGMENT_KEYS) for segment in result['segments'])
+    )
+
+
+def run_backend(name, model_name, recordings, options, results):
+    """Child process: load one backend's model and transcribe every recording with it"""
+    os.environ['TRANSCRIBE_BACKEND'] = name
+    sys.path.insert(0, REPO_ROOT)
+    try:
+        from transcription_backends import get_backend
+        backend = get_backend(name)
+    except ImportError as e:
+        results.put({'skipped': f"missing dependency: {str(e)}"})
+        return
+
+    try:
+        # Decoded up front, outside the timings, so only the engines are compared
+        audio = [
+            (label, backend.load_audio(source) if isinstance(source, str) else synthetic_speech(*source))
+            for label, source in recordings
+        ]
+        rss_before_load = peak_rss_mb()
+
+        started = time.perf_counter()
+        model = backend.load_model(model_name)
+        load_seconds = time.perf_counter() - started
+        rss_after_load = peak_rss_mb()
+
+        transcripts = []
+        for label, pcm in audio:
+            started = time.perf_counter()
+            result = backend.transcribe(model, pcm, **options)
+            seconds = time.perf_counter() - started
+            audio_seconds = len(pcm) / SAMPLE_RATE
+            transcripts.append({
+                'recording': label,
+                'audio_seconds': round(audio_seconds, 2),
+                'seconds': round(seconds, 4),
+                'rtf': round(seconds / audio_seconds, 4) if audio_seconds else None,
+                'language': result['language'],
+                'segments': len(result['segments']),
+                'whisper_shape': has_whisper_shape(result),
+                'text': result['text']
+            })
+
+        total_audio = sum(item['audio_seconds'] for item in transcripts)
+        total_seconds = sum(item['seconds'] for item in transcripts)
+        results.put({
+            'load_seconds': round(load_seconds, 3),
+            'model_size_mb': round(backend.model_size(model, model_name) / 2 ** 20, 1),
+            'rtf': round(total_seconds / total_audio, 4) if total_audio else None,
+            'transcribe_seconds': round(total_seconds, 3),
+            'audio_seconds': round(total_audio, 2),
+            'rss_before_load_mb': rss_before_load,
+            'peak_rss_after_load_mb': rss_after_load,
+            'peak_rss_mb': peak_rss_mb(),
+            'recordings': transcripts
+        })
+
+    except Exception:
+        results.put({'skipped': traceback.format_exc(limit=3)})
+
+
+def parse_option(value):
+    """NAME=value with value read as JSON when it parses (numbers, booleans), else as a string"""
+    name, value = value.split('=', 1)
+    try:
+        return name, json.loads(value)
+    except ValueError:
+        return name, value
+
+
+def agreement(text, reference):
+    """Share of words two transcripts have in common, in order (1.0 is identical)"""
+    return round(difflib.SequenceMatcher(None, text.split(), reference.split()).ratio(), 3)
+
+
+def compare_backends(args):
+    if args.audio:
+        recordings = [(os.path.basename(path), os.path.abspath(path)) for path in args.audio]
+    else:
+        recordings = [
+            (f"synthetic_{index}", (args.audio_seconds, index, args.speech_ratio))
+            for index in range(args.recordings)
+        ]
+    options = dict(parse_option(value) for value in args.option or [])
+
+    report = {
+        'started_at': datetime.now().isoformat(),
+        'model': args.model,
+        'recordings': [label for label, _ in recordings],
+        'options': options,
+        'backends': {}
+    }
+
+    context = multiprocessing.get_context('spawn')
+    for name in args.backend or BACKENDS:
+        results = context.Queue()
+        process = context.Process(target=run_backend, args=(name, args.model, recordings, options, results))
+        process.start()
+        try:
+            result = results.get(timeout=args.timeout)
+        except Exception:
+            result = {'skipped': f"no result within {args.timeout}s"}
+        process.join(5)
+        if process.is_alive():
+            process.terminate()
+        report['backends'][name] = result
+
+    # Agreement with the first backend that ran, recording by recording
+    finished = [result for result in report['backends'].values() if 'skipped' not in result]
+    if finished:
+        reference = {item['recording']: item['text'] for item in finished[0]['recordings']}
+        for result in finished:
+            for item in result['recordings']:
+                item['agreement'] = agreement(item['text'], reference.get(item['recording'], ''))
+
+    for name, result in report['backends'].items():
+        print_result(name, result)
+    return report
+
+
+def print_result(name, result):
+    print(f"\n== {name}")
+    if 'skipped' in result:
+        print(f"   skipped: {result['skipped']}")
+        return
+    print(f"   rtf {result['rtf']} over {result['audio_seconds']}s of audio "
+          f"({result['transcribe_seconds']}s), model load {result['load_seconds']}s")
+    print(f"   peak rss {result['peak_rss_after_load_mb']} MB after load, {result['peak_rss_mb']} MB after "
+          f"transcribing (weights ~{result['model_size_mb']} MB)")
+    for item in result['recordings']:
+        print(f"   {item['recording']:<24} rtf={item['rtf']:<8} segments={item['segments']:<4} "
+              f"language={str(item['language']):<4} shape={'ok' if item['whisper_shape'] else 'DIFFERENT'} "
+              f"agreement={item.get('agreement')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--backend', action='append', choices=BACKENDS, help="run only these (repeatable)")
+    parser.add_argument('--model', default='base', help="Whisper model name")
+    parser.add_argument('--audio', action='append', help="recording to transcribe instead of the fixtures (repeatable)")
+    parser.add_argument('--recordings', type=int, default=3, help="synthetic recordings when no --audio is given")
+    parser.add_argument('--audio-seconds', type=float, default=60)
+    parser.add_argument('--speech-ratio', type=float, default=0.6, help="share of each recording that is speech")
+    parser.add_argument('--option', action='append', help="transcribe option NAME=value, e.g. language=en")
+    parser.add_argument('--timeout', type=float, default=3600, help="seconds allowed per backend")
+    parser.add_argument('--output', help="write the report as JSON")
+    args = parser.parse_args()
+
+    report = compare_backends(args)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,654 @@
+"""Local stand-ins for the RingCentral and SharePoint REST endpoints the processors use
+
+Both servers add a configurable latency to every request. The RingCentral
+server enforces per-group rate limits, answering 429 with Retry-After and
+reporting X-Rate-Limit-* headers like the real API. The SharePoint server
+keeps an in-memory document library and speaks the verbose OData dialect
+the office365 client expects. Each server counts requests and bytes per
+endpoint; the counts are served at /_bench/stats and reset with
+POST /_bench/reset.
+
+Run on its own with: python -m benchmarks.fake_services
+"""
+import re
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from email import message_from_bytes
+from urllib.parse import urlsplit, parse_qs, unquote, urlencode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from benchmarks.fixtures import Scenario, synthetic_wav, ringsense_insights
+
+SITE_PATH = '/sites/bench'
+LIBRARY = 'Shared Documents'
+LEADS_ROOT = f"{LIBRARY}/ProjectLeads"
+
+LIST_ID = '8f6b1b9e-0c1c-4c53-9a6e-3f1d2a7b5c10'
+
+# SPChangeType values the library logs
+CHANGE_ADD = 1
+CHANGE_UPDATE = 2
+
+# List-item columns the processors tag uploads with (see call_fields.py)
+CALL_COLUMNS = ('CallFrom', 'CallTo', 'RecordingId', 'CallStartTime', 'CallDirection', 'CallDuration')
+
+# Requests per window for each rate-limit group, as (limit, window seconds)
+DEFAULT_RATE_LIMITS = {
+    'Heavy': (600, 60),
+    'Medium': (1200, 60),
+    'Light': (3000, 60),
+    'Auth': (60, 60)
+}
+
+
+class Stats:
+    """Request counters per service and endpoint template"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.throttled = 0
+
+    def record(self, service, method, path, bytes_in, bytes_out, status):
+        path = re.sub(r"'[^']*'", "'{}'", path.split('?', 1)[0].replace('\\', ''))
+        template = method + ' ' + re.sub(r'=\d+', '={}', re.sub(r'/\d{3,}', '/{id}', path))
+        with self.lock:
+            key = f"{service} {template}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            if status == 429:
+                self.throttled += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'total_requests': sum(self.requests.values()),
+                'requests': dict(sorted(self.requests.items())),
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'throttled': self.throttled
+            }
+
+
+class FixedWindow:
+    """Server-side rate limit for one group"""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.started = time.monotonic()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        """(allowed, remaining, seconds until the window resets)"""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.started >= self.window:
+                self.started, self.used = now, 0
+            reset = self.window - (now - self.started)
+            if self.used >= self.limit:
+                return False, 0, reset
+            self.used += 1
+            return True, self.limit - self.used, reset
+
+
+class BenchHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    service = None
+
+    def log_message(self, *args):
+        pass
+
+    def handle_any(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        # Only the path is decoded here; query strings are decoded once, by parse_qs
+        parts = urlsplit(self.path)
+        path = unquote(parts.path) + (f"?{parts.query}" if parts.query else '')
+
+        if path.startswith('/_bench/'):
+            if path.startswith('/_bench/reset'):
+                self.server.stats.reset()
+            return self.reply(200, json.dumps(self.server.stats.snapshot()).encode('utf-8'))
+
+        latency = self.server.latency
+        if latency:
+            time.sleep(max(0.0, random.gauss(latency, latency * self.server.jitter)))
+
+        status, headers, content = self.route(self.command, path, body)
+        self.server.stats.record(self.service, self.command, path, len(body), len(content), status)
+        self.reply(status, content, headers)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_MERGE = handle_any
+
+    def reply(self, status, content, headers=None):
+        self.send_response(status)
+        headers = dict(headers or {})
+        headers.setdefault('Content-Type', 'application/json')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(content)
+
+    def route(self, method, path, body):
+        raise NotImplementedError
+
+
+class RingCentralHandler(BenchHandler):
+    service = 'ringcentral'
+
+    def route(self, method, path, body):
+        url = urlsplit(path)
+        group = self.group(method, url.path)
+        allowed, remaining, reset = self.server.windows[group].take()
+        window = self.server.windows[group]
+        headers = {
+            'X-Rate-Limit-Group': group,
+            'X-Rate-Limit-Limit': str(window.limit),
+            'X-Rate-Limit-Remaining': str(remaining),
+            'X-Rate-Limit-Window': str(window.window)
+        }
+        if not allowed:
+            headers['Retry-After'] = str(max(1, int(reset + 0.999)))
+            return 429, headers, b'{"errorCode":"CMN-301","message":"Request rate exceeded"}'
+
+        status, content, content_type = self.dispatch(method, url)
+        headers['Content-Type'] = content_type
+        return status, headers, content
+
+    @staticmethod
+    def group(method, path):
+        if path.startswith('/restapi/oauth'):
+            return 'Auth'
+        if path.endswith('/call-log') or path.endswith('/content'):
+            return 'Heavy'
+        return 'Light' if method == 'GET' else 'Medium'
+
+    def dispatch(self, method, url):
+        data = self.server.data
+        path = url.path
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if path == '/restapi/oauth/token':
+            return self.json({'access_token': uuid.uuid4().hex, 'token_type': 'bearer', 'expires_in': 3600})
+
+        if path == '/restapi/v1.0/account/~/call-log':
+            records = [
+                record for record in data['calls']
+                if record['startTime'] >= query.get('dateFrom', '')
+            ]
+            per_page = int(query.get('perPage', 100))
+            page = int(query.get('page', 1))
+            result = {
+                'records': records[(page - 1) * per_page:page * per_page],
+                'paging': {'page': page, 'perPage': per_page},
+                'navigation': {}
+            }
+            if page * per_page < len(records):
+                next_query = dict(query, page=page + 1)
+                result['navigation']['nextPage'] = {
+                    'uri': f"{self.server.base_url}{path}?{urlencode(next_query)}"
+                }
+            return self.json(result)
+
+        match = re.fullmatch(r'/restapi/v1\.0/account/~/recording/(\w+)(/content)?', path)
+        if match:
+            recording_id, content = match.groups()
+            call = data['recordings'].get(recording_id)
+            if call is None:
+                return self.json({'errorCode': 'CMN-102'}, 404)
+            if content:
+                audio = synthetic_wav(self.server.scenario.audio_seconds, int(recording_id),
+                                      self.server.scenario.speech_ratio)
+                return 200, audio, 'audio/wav'
+            return self.json({
+                'id': recording_id,
+                'status': 'Available',
+                'duration': call['duration'],
+                'contentType': 'audio/wav',
+                'contentUri': f"{self.server.base_url}/restapi/v1.0/account/~/recording/{recording_id}/content"
+            })
+
+        match = re.fullmatch(r'/restapi/v1\.0/account/~/call-recordings/(\w+)(/ringsense)?', path)
+        if match:
+            recording_id, ringsense = match.groups()
+            call = data['recordings'].get(recording_id)
+            if call is None:
+                return self.json({'errorCode': 'CMN-102'}, 404)
+            if ringsense:
+                return self.json(ringsense_insights(recording_id, call['duration'], call['from']['phoneNumber']))
+            return self.json(dict(call, status='Available'))
+
+        return self.json({'errorCode': 'CMN-404', 'message': f"No fake for {method} {path}"}, 404)
+
+    @staticmethod
+    def json(payload, status=200):
+        return status, json.dumps(payload).encode('utf-8'), 'application/json'
+
+
+def change_token(number):
+    """A list change token in SharePoint's format, ending in the change number"""
+    return f"1;3;{LIST_ID};{number};{number}"
+
+
+class SharePointLibrary:
+    """In-memory folders and files keyed by server-relative URL"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.folders = {SITE_PATH, f"{SITE_PATH}/{LIBRARY}"}
+        self.files = {}
+        self.uploads = {}
+        # List-item column values per file, and the columns the library has
+        self.item_fields = {}
+        self.columns = set()
+        # List-item ids per folder and file URL, and the change log as (change number, item id, change type)
+        self.item_ids = {}
+        self.changes = []
+
+    @staticmethod
+    def absolute(url):
+        url = '/' + url.strip('/')
+        return url if url.startswith(SITE_PATH + '/') or url == SITE_PATH else SITE_PATH + url
+
+    def add_folder(self, url):
+        url = self.absolute(url)
+        with self.lock:
+            parts = url.split('/')
+            for end in range(3, len(parts) + 1):
+                folder = '/'.join(parts[:end])
+                if folder not in self.folders:
+                    self.folders.add(folder)
+                    self.log_change(folder, CHANGE_ADD)
+        return url
+
+    def add_file(self, url, content):
+        url = self.absolute(url)
+        self.add_folder(url.rsplit('/', 1)[0])
+        with self.lock:
+            self.log_change(url, CHANGE_UPDATE if url in self.files else CHANGE_ADD)
+            self.files[url] = content
+        return url
+
+    def set_fields(self, url, fields):
+        url = self.absolute(url)
+        with self.lock:
+            self.item_fields.setdefault(url, {}).update(fields)
+            self.log_change(url, CHANGE_UPDATE)
+
+    def log_change(self, url, change_type):
+        """Give url an item id if it has none and append a change for it; called with the lock held"""
+        if not url.startswith(f"{SITE_PATH}/{LIBRARY}/"):
+            return
+        item_id = self.item_ids.setdefault(url, len(self.item_ids) + 1)
+        self.changes.append((len(self.changes) + 1, item_id, change_type))
+
+    @property
+    def change_token(self):
+        with self.lock:
+            return change_token(len(self.changes))
+
+    def changes_since(self, token, limit):
+        """Up to limit changes after the one a token points at"""
+        number = int(token.rsplit(';', 1)[-1])
+        with self.lock:
+            return self.changes[number:number + limit]
+
+    def query_items(self, expression):
+        """Items matching an OData filter of "Column eq 'value'" and "ID eq n" clauses joined by or
+
+        Without a filter every folder and file is returned, as (url, id,
+        is folder, column values).
+        """
+        clauses = re.findall(r"(\w+) eq '([^']*)'", expression or '')
+        ids = {int(item_id) for item_id in re.findall(r"\bID eq (\d+)", expression or '')}
+        with self.lock:
+            return sorted(
+                (url, item_id, url in self.folders, dict(self.item_fields.get(url, {})))
+                for url, item_id in self.item_ids.items()
+                if (url in self.files or url in self.folders) and (
+                    (not clauses and not ids) or item_id in ids
+                    or any(self.item_fields.get(url, {}).get(name) == value for name, value in clauses)
+                )
+            )
+
+    def children(self, url, files):
+        url = self.absolute(url)
+        with self.lock:
+            source = self.files if files else self.folders
+            return sorted(item for item in source if item.rsplit('/', 1)[0] == url and item != url)
+
+
+class SharePointHandler(BenchHandler):
+    service = 'sharepoint'
+
+    FOLDER = re.compile(r"/Web/getFolderByServerRelative(?:Url\('(.*?)'\)|Path\(DecodedUrl='(.*?)'\))", re.I)
+    FILE = re.compile(r"/Web/getFileByServerRelative(?:Url\('(.*?)'\)|Path\(DecodedUrl='(.*?)'\))", re.I)
+    LIST = re.compile(r"/Web/lists/GetByTitle\('(.*?)'\)", re.I)
+    ROOT_FOLDERS = re.compile(r"/Web/RootFolder((?:/Folders\('[^']*'\))*)/Folders/Add\('(.*?)'\)", re.I)
+
+    def route(self, method, path, body):
+        status, payload = self.dispatch(method, path, body, self.headers)
+        if isinstance(payload, tuple):
+            # A $batch answer: (multipart content type, body)
+            return status, {'Content-Type': payload[0]}, payload[1]
+        if isinstance(payload, bytes):
+            return status, {'Content-Type': 'application/octet-stream'}, payload
+        return status, {'Content-Type': 'application/json;odata=verbose'}, json.dumps(payload).encode('utf-8')
+
+    def dispatch(self, method, path, body, headers):
+        library = self.server.library
+        api = path.split('/_api', 1)[-1]
+        url = api.split('?', 1)[0]
+
+        if url.lower() == '/contextinfo':
+            return 200, {'d': {'GetContextWebInformation': {
+                'FormDigestValue': uuid.uuid4().hex, 'FormDigestTimeoutSeconds': 1800
+            }}}
+
+        if url == '/$batch':
+            return self.batch(body, headers)
+
+        match = self.LIST.match(url)
+        if match:
+            return self.list_operation(method, url[match.end():], parse_qs(urlsplit(api).query), body)
+
+        match = self.ROOT_FOLDERS.match(url)
+        if match:
+            parents = re.findall(r"Folders\('([^']*)'\)", match.group(1))
+            return 200, self.folder_entity(library.add_folder('/'.join(parents + [match.group(2)])))
+
+        match = re.match(r"/Web/Folders/add\('(.*?)'\)", url, re.I)
+        if match:
+            return 200, self.folder_entity(library.add_folder(match.group(1)))
+
+        match = self.FOLDER.match(url)
+        if match:
+            folder = library.absolute(match.group(1) or match.group(2))
+            rest = url[match.end():]
+            if folder not in library.folders:
+                return self.not_found(folder)
+            if rest == '':
+                return 200, self.folder_entity(folder)
+            if rest.lower() == '/files':
+                return 200, {'d': {'results': [self.file_entity(item)['d'] for item in library.children(folder, True)]}}
+            if rest.lower() == '/folders':
+                return 200, {'d': {'results': [self.folder_entity(item)['d'] for item in library.children(folder, False)]}}
+            add = re.match(r"/Files/add\((.*)\)", rest, re.I)
+            if add:
+                name = re.search(r"url='(.*?)'", add.group(1)).group(1)
+                return 200, self.file_entity(library.add_file(f"{folder}/{name}", body))
+
+        match = self.FILE.match(url)
+        if match:
+            file_url = library.absolute(match.group(1) or match.group(2))
+            rest = url[match.end():].replace('\\', '')
+            return self.file_operation(method, file_url, rest, body, headers)
+
+        return 404, {'error': {'message': {'value': f"No fake for {method} {url}"}}}
+
+    def file_operation(self, method, file_url, rest, body, headers):
+        library = self.server.library
+        operation = re.match(r"/(\w+)\((.*)\)$", rest)
+        name = operation.group(1).lower() if operation else None
+
+        if name in ('startupload', 'continueupload', 'finishupload'):
+            upload_id = re.search(r"uploadID='?([^',]+)", operation.group(2), re.I).group(1)
+            with library.lock:
+                if name == 'startupload':
+                    library.uploads[upload_id] = bytearray()
+                library.uploads[upload_id] += body
+            if name == 'finishupload':
+                library.add_file(file_url, bytes(library.uploads.pop(upload_id)))
+                return 200, self.file_entity(file_url)
+            return 200, {'d': {name[0].upper() + name[1:]: len(library.uploads[upload_id])}}
+
+        if file_url not in library.files:
+            return self.not_found(file_url)
+
+        if rest == '' or rest.startswith('?'):
+            return 200, self.file_entity(file_url)
+
+        if rest == '/$value':
+            content = library.files[file_url]
+            ranged = re.match(r'bytes=(\d+)-(\d*)', headers.get('Range') or '')
+            if ranged:
+                start = int(ranged.group(1))
+                end = int(ranged.group(2)) + 1 if ranged.group(2) else len(content)
+                return 206, content[start:end]
+            return 200, content
+
+        if name == 'copyto':
+            target = re.search(r"strNewUrl='(.*?)'", operation.group(2)).group(1)
+            library.add_file(target, library.files[file_url])
+            library.set_fields(target, library.item_fields.get(file_url, {}))
+            return 200, {'d': {}}
+
+        if rest.lower() == '/listitemallfields/validateupdatelistitem':
+            values = json.loads(body or b'{}').get('formValues', [])
+            library.set_fields(file_url, {value['FieldName']: value['FieldValue'] for value in values})
+            return 200, {'d': {'ValidateUpdateListItem': {'results': [
+                dict(value, HasException=False, ErrorMessage=None) for value in values
+            ]}}}
+
+        return 404, {'error': {'message': {'value': f"No fake for {method} {rest}"}}}
+
+    def list_operation(self, method, rest, query, body):
+        """The document library as a list: its items (filterable by call columns) and columns"""
+        library = self.server.library
+        if rest == '' and method == 'GET':
+            return 200, {'d': {
+                '__metadata': {'type': 'SP.List'},
+                'CurrentChangeToken': {'__metadata': {'type': 'SP.ChangeToken'}, 'StringValue': library.change_token}
+            }}
+        if rest.lower() == '/items' and method == 'GET':
+            items = []
+            for url, item_id, is_folder, fields in library.query_items(query.get('$filter', [''])[0]):
+                items.append(dict(
+                    fields,
+                    __metadata={'type': 'SP.Data.Shared_x0020_DocumentsItem'},
+                    ID=item_id,
+                    Id=item_id,
+                    FSObjType='1' if is_folder else '0',
+                    FileRef=url,
+                    FileLeafRef=url.rsplit('/', 1)[-1],
+                    FileDirRef=url.rsplit('/', 1)[0]
+                ))
+            return 200, {'d': {'results': items}}
+        if rest.lower() == '/getchanges' and method == 'POST':
+            change_query = json.loads(body)['query']
+            limit = int(change_query.get('FetchLimit') or 1000)
+            changes = library.changes_since(change_query['ChangeTokenStart']['StringValue'], limit)
+            return 200, {'d': {'results': [
+                {'__metadata': {'type': 'SP.ChangeItem'}, 'ItemId': item_id, 'ChangeType': change_type,
+                 'ChangeToken': {'__metadata': {'type': 'SP.ChangeToken'}, 'StringValue': change_token(number)}}
+                for number, item_id, change_type in changes
+            ]}}
+        if rest.lower() == '/fields' and method == 'GET':
+            return 200, {'d': {'results': [
+                {'__metadata': {'type': 'SP.Field'}, 'InternalName': name} for name in sorted(library.columns)
+            ]}}
+        if rest.lower() == '/fields/createfieldasxml':
+            schema = json.loads(body)['parameters']['SchemaXml']
+            name = re.search(r'Name="(\w+)"', schema).group(1)
+            with library.lock:
+                library.columns.add(name)
+            return 200, {'d': {'__metadata': {'type': 'SP.Field'}, 'InternalName': name}}
+        return 404, {'error': {'message': {'value': f"No fake for {method} list {rest}"}}}
+
+    def batch(self, body, headers):
+        """Run each part of an OData $batch and answer with one application/http part per request"""
+        message = message_from_bytes(
+            b'Content-Type: ' + headers['Content-Type'].encode('ascii') + b'\r\n\r\n' + body
+        )
+        boundary = f"batchresponse_{uuid.uuid4()}"
+        parts = []
+        for part in message.walk():
+            if part.get_content_type() != 'application/http':
+                continue
+            raw = part.get_payload(decode=True).decode('utf-8')
+            method, url = re.match(r'(\w+) (.*) HTTP/1\.\d', raw.strip().split('\r\n', 1)[0]).groups()
+            sub_body = raw.split('\r\n\r\n', 1)[1].strip().encode('utf-8') if '\r\n\r\n' in raw else b''
+            status, payload = self.dispatch(method, unquote(urlsplit(url).path), sub_body, {})
+            self.server.stats.record(self.service, method, '$batch:' + unquote(urlsplit(url).path), 0, 0, status)
+            content = json.dumps(payload) if not isinstance(payload, bytes) else ''
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-Transfer-Encoding: binary\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                f"Content-Type: application/json;odata=verbose;charset=utf-8\r\n\r\n{content}\r\n"
+            )
+        content = (''.join(parts) + f"--{boundary}--\r\n").encode('utf-8')
+        return 200, (f"multipart/mixed; boundary={boundary}", content)
+
+    @staticmethod
+    def folder_entity(url):
+        return {'d': {
+            '__metadata': {'type': 'SP.Folder'},
+            'Name': url.rsplit('/', 1)[-1],
+            'ServerRelativeUrl': url,
+            'ServerRelativePath': {'DecodedUrl': url},
+            'Exists': True,
+            'ItemCount': 0
+        }}
+
+    def file_entity(self, url):
+        content = self.server.library.files.get(url, b'')
+        return {'d': {
+            '__metadata': {'type': 'SP.File'},
+            'Name': url.rsplit('/', 1)[-1],
+            'ServerRelativeUrl': url,
+            'ServerRelativePath': {'DecodedUrl': url},
+            'Length': str(len(content)),
+            'Exists': True,
+            'TimeLastModified': '2024-01-01T00:00:00Z'
+        }}
+
+    @staticmethod
+    def not_found(url):
+        return 404, {'error': {'code': '-2147024894, System.IO.FileNotFoundException',
+                               'message': {'value': f"File Not Found: {url}"}}}
+
+
+class FakeServices:
+    """Both fake servers, seeded from a scenario and run on background threads"""
+
+    def __init__(self, scenario=None, latency_ms=0, jitter=0.2, rate_limits=None, host='127.0.0.1'):
+        self.scenario = scenario or Scenario()
+        self.stats = Stats()
+
+        calls = self.scenario.calls()
+        rc_data = {
+            'calls': calls,
+            'recordings': {call['recording']['id']: call for call in calls}
+        }
+        limits = dict(DEFAULT_RATE_LIMITS, **(rate_limits or {}))
+
+        self.ringcentral = self.create_server(RingCentralHandler, host, latency_ms / 1000.0, jitter)
+        self.ringcentral.data = rc_data
+        self.ringcentral.windows = {group: FixedWindow(*limit) for group, limit in limits.items()}
+
+        self.sharepoint = self.create_server(SharePointHandler, host, latency_ms / 1000.0, jitter)
+        self.sharepoint.library = SharePointLibrary()
+        self.seed_sharepoint()
+
+    def create_server(self, handler, host, latency, jitter):
+        server = ThreadingHTTPServer((host, 0), handler)
+        server.daemon_threads = True
+        server.latency = latency
+        server.jitter = jitter
+        server.stats = self.stats
+        server.scenario = self.scenario
+        server.base_url = f"http://{host}:{server.server_address[1]}"
+        return server
+
+    def seed_sharepoint(self):
+        """Existing recordings, their metadata and transcripts under other leads' folders"""
+        library = self.sharepoint.library
+        library.add_folder(LEADS_ROOT)
+        library.columns.update(CALL_COLUMNS)
+        for folder, name, metadata in self.scenario.existing_recordings():
+            base = f"{LEADS_ROOT}/{folder}"
+            # Tagged with the call columns, as if uploaded by this version
+            fields = {
+                'CallFrom': metadata['from'],
+                'CallTo': metadata['to'],
+                'RecordingId': metadata['recording_id'],
+                'CallStartTime': metadata['start_time'],
+                'CallDirection': metadata['direction'],
+                'CallDuration': str(metadata['duration'])
+            }
+            library.add_file(f"{base}/Sources/RingCentral/{name}", b'RIFF' + b'\0' * 1024)
+            library.set_fields(f"{base}/Sources/RingCentral/{name}", fields)
+            transcript = {
+                'recording_id': metadata['recording_id'],
+                'call_metadata': metadata,
+                'transcript': {'text': ' Existing transcript.', 'segments': [], 'language': 'en'}
+            }
+            transcript_url = library.add_file(
+                f"{base}/Transcripts_JSON/transcript_20240101_120000_{metadata['recording_id']}.json",
+                json.dumps(transcript).encode('utf-8')
+            )
+            library.set_fields(transcript_url, fields)
+
+    @property
+    def ringcentral_url(self):
+        return self.ringcentral.base_url
+
+    @property
+    def sharepoint_site_url(self):
+        return self.sharepoint.base_url + SITE_PATH
+
+    def start(self):
+        for server in (self.ringcentral, self.sharepoint):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for server in (self.ringcentral, self.sharepoint):
+            server.shutdown()
+            server.server_close()
+
+
+def parse_rate_limits(values):
+    """['Heavy=10/60', ...] -> {'Heavy': (10, 60), ...}"""
+    limits = {}
+    for value in values or []:
+        group, _, spec = value.partition('=')
+        limit, _, window = spec.partition('/')
+        limits[group] = (int(limit), int(window or 60))
+    return limits
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--leads', type=int, default=5)
+    parser.add_argument('--calls-per-lead', type=int, default=4)
+    parser.add_argument('--audio-seconds', type=float, default=60)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--rate-limit', action='append', help="e.g. Heavy=10/60")
+    args = parser.parse_args()
+
+    services = FakeServices(
+        Scenario(args.leads, args.calls_per_lead, args.audio_seconds),
+        latency_ms=args.latency_ms,
+        rate_limits=parse_rate_limits(args.rate_limit)
+    ).start()
+    print(f"RC_SERVER_URL={services.ringcentral_url}")
+    print(f"SHAREPOINT_SITE_URL={services.sharepoint_site_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        services.stop()
@@ -0,0 +1,126 @@
+import io
+import wave
+import numpy as np
+from datetime import datetime, timedelta, timezone
+
+SAMPLE_RATE = 16000
+COMPANY_NUMBER = '+16505550100'
+
+
+class Scenario:
+    """Data volume of a benchmark run: leads, their calls and recordings, and existing SharePoint content"""
+
+    def __init__(self, leads=5, calls_per_lead=4, audio_seconds=60, existing_per_lead=2,
+                 speech_ratio=0.6, seed=1):
+        self.leads = leads
+        self.calls_per_lead = calls_per_lead
+        self.audio_seconds = audio_seconds
+        self.existing_per_lead = existing_per_lead
+        self.speech_ratio = speech_ratio
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    def lead(self, index):
+        """Name and phone number of lead index"""
+        return {'last_name': f"Lead{index:04d}", 'phone': f"+1555{index:07d}"}
+
+    def calls(self):
+        """Call-log records for every lead, newest first like the RingCentral API"""
+        now = datetime.now(timezone.utc)
+        records = []
+        for index in range(self.leads):
+            phone = self.lead(index)['phone']
+            for call in range(self.calls_per_lead):
+                recording_id = f"{(index + 1) * 1000 + call}"
+                start = now - timedelta(days=call + 1, minutes=index)
+                inbound = call % 2 == 0
+                records.append({
+                    'id': f"call-{recording_id}",
+                    'sessionId': recording_id,
+                    'startTime': start.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                    'duration': self.audio_seconds,
+                    'direction': 'Inbound' if inbound else 'Outbound',
+                    'from': {'phoneNumber': phone if inbound else COMPANY_NUMBER},
+                    'to': {'phoneNumber': COMPANY_NUMBER if inbound else phone},
+                    'recording': {'id': recording_id, 'type': 'Automatic'}
+                })
+        records.sort(key=lambda record: record['startTime'], reverse=True)
+        return records
+
+    def existing_recordings(self):
+        """Recordings already filed under other leads, as (folder, file name, metadata)"""
+        recordings = []
+        for index in range(self.leads):
+            phone = self.lead(index)['phone']
+            for number in range(self.existing_per_lead):
+                recording_id = f"{900000 + index * 100 + number}"
+                recordings.append((
+                    f"Existing{index:04d}",
+                    f"call_2024010{number % 9 + 1}_120000_{recording_id}.mp3",
+                    {
+                        'recording_id': recording_id,
+                        'from': phone,
+                        'to': COMPANY_NUMBER,
+                        'direction': 'Inbound',
+                        'duration': self.audio_seconds,
+                        'start_time': '2024-01-01T12:00:00.000Z'
+                    }
+                ))
+        return recordings
+
+
+def synthetic_speech(seconds, seed=0, speech_ratio=0.6, sample_rate=SAMPLE_RATE):
+    """Speech-like float32 PCM: syllable-rate modulated harmonics in bursts, separated by quiet gaps"""
+    rng = np.random.default_rng(seed)
+    samples = int(seconds * sample_rate)
+    t = np.arange(samples, dtype=np.float32) / sample_rate
+
+    pitch = 110 + 60 * rng.random()
+    voice = sum(np.sin(2 * np.pi * pitch * harmonic * t) / harmonic for harmonic in range(1, 6))
+    syllables = 0.5 * (1 + np.sin(2 * np.pi * 4 * t + rng.random() * 6))
+
+    # Alternate talk spurts and pauses so VAD and chunking have something to find
+    active = np.zeros(samples, dtype=bool)
+    position = 0
+    while position < samples:
+        burst = int(rng.uniform(2, 8) * sample_rate)
+        pause = int(burst * (1 - speech_ratio) / max(speech_ratio, 0.05))
+        active[position:position + burst] = True
+        position += burst + pause
+
+    audio = 0.2 * voice * syllables * active + rng.normal(0, 0.002, samples)
+    return audio.astype(np.float32)
+
+
+def synthetic_wav(seconds, seed=0, speech_ratio=0.6, sample_rate=SAMPLE_RATE):
+    """16-bit mono WAV bytes of synthetic_speech"""
+    pcm = np.clip(synthetic_speech(seconds, seed, speech_ratio, sample_rate), -1, 1)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes((pcm * 32767).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+def ringsense_insights(recording_id, seconds, phone):
+    """A RingSense response of roughly realistic size for a call"""
+    utterances = []
+    for start in range(0, int(seconds), 6):
+        utterances.append({
+            'start': start,
+            'end': min(start + 5, seconds),
+            'speakerId': str(start // 6 % 2),
+            'text': f"Synthetic utterance {start // 6} of recording {recording_id}.",
+            'confidence': 0.9
+        })
+    return {
+        'recordingId': recording_id,
+        'insights': {
+            'Transcript': utterances,
+            'Summary': [{'text': f"Call with {phone} about a project estimate."}]
+        }
+    }
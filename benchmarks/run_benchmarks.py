@@ -0,0 +1,341 @@
+"""End-to-end benchmarks of the lead workflows against local RingCentral and SharePoint fakes
+
+Each workflow runs in its own process against fake servers started by this
+script, so nothing touches a production tenant and peak memory belongs to
+the workflow alone. The report has, per workflow: wall time, per-lead
+latency, time spent in each stage, requests issued per endpoint, bytes
+transferred, 429s received, peak memory and the workflow's own metrics
+(see metrics.py). Pass --baseline with an earlier --output file to see the
+change against it.
+
+    python -m benchmarks.run_benchmarks --leads 20 --calls-per-lead 5 \\
+        --audio-seconds 120 --latency-ms 80 --output results.json
+
+Workflows that transcribe need Whisper and ffmpeg installed, like production,
+or faster-whisper with --env TRANSCRIBE_BACKEND=faster-whisper. To compare
+the backends themselves, use benchmarks.compare_backends.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import shutil
+import tempfile
+import functools
+import threading
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.fixtures import Scenario
+from benchmarks.fake_services import FakeServices, LEADS_ROOT, parse_rate_limits
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKFLOWS = ['process_new_lead', 'process_lead_recordings', 'process_existing_lead_recordings',
+             'backfill_existing_recordings', 'handle_new_recording']
+
+# Workflows that may transcribe, and so need the configured backend installed
+TRANSCRIBING_WORKFLOWS = ('process_lead_recordings', 'process_existing_lead_recordings',
+                          'backfill_existing_recordings')
+
+# Functions timed as stages: (module, attribute path, label); a label of None
+# means the label comes from the instance (pipeline stages use their name)
+STAGES = [
+    ('call_log_sync', 'CallLogSync.sync', 'call_log.sync'),
+    ('phone_index', 'PhoneIndex.rebuild', 'phone_index.rebuild'),
+    ('lead_manifest', 'LeadManifest.sync', 'manifest.sync'),
+    ('recording_pipeline', 'Stage.run', None),
+    ('lead_processor', 'LeadProcessor.create_folder_structure', 'lead.create_folders'),
+    ('lead_processor', 'LeadProcessor.get_ringsense_transcripts', 'lead.get_ringsense_transcripts'),
+    ('lead_processor', 'LeadProcessor.save_transcripts', 'lead.save_transcripts'),
+    ('process_existing_recordings', 'ExistingRecordingProcessor.process_matching_recording',
+     'existing.process_matching_recording'),
+    ('process_existing_recordings', 'ExistingRecordingProcessor.find_source_transcript',
+     'existing.find_source_transcript'),
+    ('process_existing_recordings', 'ExistingRecordingProcessor.find_matching_recordings',
+     'existing.find_matching_recordings'),
+    ('webhook_handler', 'WebhookHandler.find_lead_folders', 'webhook.find_lead_folders'),
+    ('webhook_handler', 'WebhookHandler.process_recording', 'webhook.process_recording'),
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'total': round(sum(values), 4),
+        'mean': round(sum(values) / len(values), 4) if values else 0.0,
+        'p50': round(percentile(values, 0.5), 4),
+        'p95': round(percentile(values, 0.95), 4),
+        'max': round(max(values), 4) if values else 0.0
+    }
+
+
+class StageTimer:
+    """Collects wall time per stage by wrapping the functions listed in STAGES"""
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, label, seconds):
+        with self.lock:
+            self.samples.setdefault(label, []).append(seconds)
+
+    def wrap(self, owner, name, label):
+        original = getattr(owner, name)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                stage = label or f"pipeline.{args[0].name}"
+                self.record(stage, time.perf_counter() - started)
+
+        setattr(owner, name, timed)
+
+    def install(self, stages=STAGES):
+        import importlib
+        for module_name, path, label in stages:
+            try:
+                owner = importlib.import_module(module_name)
+            except ImportError:
+                continue
+            *parents, name = path.split('.')
+            for parent in parents:
+                owner = getattr(owner, parent)
+            self.wrap(owner, name, label)
+
+    def summary(self):
+        with self.lock:
+            return {label: summarize(values) for label, values in sorted(self.samples.items())}
+
+
+def workflow_calls(name, scenario):
+    """(description, callable) for every unit of work the workflow performs"""
+    calls = scenario.calls()
+    work = []
+    if name == 'backfill_existing_recordings':
+        # Every lead in one unit, so the crawl is shared
+        from process_existing_recordings import backfill_existing_recordings
+        leads = [scenario.lead(index) for index in range(scenario.leads)]
+        pairs = [(lead['phone'], f"{LEADS_ROOT}/{lead['last_name']}") for lead in leads]
+        return [('backfill', functools.partial(backfill_existing_recordings, pairs))]
+    for index in range(scenario.leads):
+        lead = scenario.lead(index)
+        folder = f"{LEADS_ROOT}/{lead['last_name']}"
+        if name == 'process_new_lead':
+            from lead_processor import process_new_lead
+            work.append((lead['last_name'], functools.partial(process_new_lead, lead['last_name'], lead['phone'])))
+        elif name == 'process_lead_recordings':
+            from process_recording import process_lead_recordings
+            work.append((lead['last_name'], functools.partial(process_lead_recordings, lead['phone'], folder)))
+        elif name == 'process_existing_lead_recordings':
+            from process_existing_recordings import process_existing_lead_recordings
+            work.append((lead['last_name'], functools.partial(process_existing_lead_recordings, lead['phone'], folder)))
+        elif name == 'handle_new_recording':
+            from webhook_handler import handle_new_recording
+            for call in calls:
+                if lead['phone'] not in (call['from']['phoneNumber'], call['to']['phoneNumber']):
+                    continue
+                event = {'body': {'sessionId': call['recording']['id'], 'parties': [{
+                    'from': call['from'], 'to': call['to'], 'status': {'code': 'Disconnected'}
+                }]}}
+                work.append((call['recording']['id'], functools.partial(handle_new_recording, event)))
+        else:
+            raise ValueError(f"Unknown workflow {name}")
+    return work
+
+
+def run_workflow(name, env, scenario, concurrency, results):
+    """Child process: run one workflow over every lead and report its measurements"""
+    import resource
+    import tracemalloc
+
+    os.environ.update(env)
+    sys.path.insert(0, REPO_ROOT)
+    try:
+        work = workflow_calls(name, scenario)
+        if name in TRANSCRIBING_WORKFLOWS:
+            # The backend is otherwise only imported inside the pool workers,
+            # where a missing dependency shows up as a broken pool instead
+            from transcription_backends import get_backend
+            get_backend()
+    except ImportError as e:
+        results.put({'skipped': f"missing dependency: {str(e)}"})
+        return
+
+    timer = StageTimer()
+    timer.install()
+    tracemalloc.start()
+
+    latencies, errors = [], []
+
+    def run(item):
+        label, func = item
+        started = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            errors.append(f"{label}: {str(e)}")
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run, work))
+    wall = time.perf_counter() - started
+
+    _, traced_peak = tracemalloc.get_traced_memory()
+    import metrics
+    snapshot = metrics.registry.snapshot()
+    results.put({
+        'wall_seconds': round(wall, 4),
+        'units': len(work),
+        'throughput_per_second': round(len(work) / wall, 3) if wall else None,
+        'latency': summarize(latencies),
+        'stages': timer.summary(),
+        'errors': errors,
+        # Errors stages logged and skipped rather than raised
+        'stage_errors': sum(
+            counter['value'] for counter in snapshot['counters'] if counter['name'] == 'stage_errors_total'
+        ),
+        'metrics': snapshot,
+        'peak_python_heap_mb': round(traced_peak / 2 ** 20, 2),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        'peak_child_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 2)
+    })
+
+
+def run_benchmarks(args):
+    scenario = Scenario(args.leads, args.calls_per_lead, args.audio_seconds, args.existing_per_lead,
+                        args.speech_ratio)
+    services = FakeServices(scenario, latency_ms=args.latency_ms,
+                            rate_limits=parse_rate_limits(args.rate_limit)).start()
+    state_dir = tempfile.mkdtemp(prefix='rc_bench_')
+    env = {
+        'RC_SERVER_URL': services.ringcentral_url,
+        'RC_ACCESS_TOKEN': 'benchmark',
+        'RC_JWT_TOKEN': '',
+        'SHAREPOINT_SITE_URL': services.sharepoint_site_url,
+        'SHAREPOINT_ACCESS_TOKEN': 'benchmark',
+        'LOCAL_STATE_DIR': state_dir,
+        'WHISPER_MODEL': args.model,
+        # Process each webhook session inline so its work falls inside the measurement
+        'WEBHOOK_COALESCE_SECONDS': '0'
+    }
+    env.update(dict(value.split('=', 1) for value in args.env or []))
+
+    report = {
+        'started_at': datetime.now().isoformat(),
+        'scenario': scenario.to_dict(),
+        'settings': {
+            'latency_ms': args.latency_ms,
+            'rate_limits': args.rate_limit or [],
+            'concurrency': args.concurrency,
+            'model': args.model,
+            'env': args.env or [],
+            'state_dir': state_dir
+        },
+        'workflows': {}
+    }
+
+    # Workflows share the state directory and the fake tenant, in this order,
+    # like a lead going through the system
+    context = multiprocessing.get_context('spawn')
+    try:
+        for name in args.workflow or WORKFLOWS:
+            services.stats.reset()
+            results = context.Queue()
+            process = context.Process(target=run_workflow, args=(name, env, scenario, args.concurrency, results))
+            process.start()
+            try:
+                result = results.get(timeout=args.timeout)
+            except Exception:
+                result = {'skipped': f"no result within {args.timeout}s"}
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+            result['requests'] = services.stats.snapshot()
+            report['workflows'][name] = result
+            print_result(name, result)
+    finally:
+        services.stop()
+        if not args.keep_state:
+            shutil.rmtree(state_dir, ignore_errors=True)
+    return report
+
+
+def print_result(name, result):
+    print(f"\n== {name}")
+    if 'skipped' in result:
+        print(f"   skipped: {result['skipped']}")
+        return
+    requests = result['requests']
+    print(f"   wall {result['wall_seconds']:.2f}s for {result['units']} units "
+          f"(p50 {result['latency']['p50']:.3f}s, p95 {result['latency']['p95']:.3f}s), "
+          f"errors {len(result['errors'])}, handled in stages {result['stage_errors']}")
+    print(f"   requests {requests['total_requests']} ({requests['throttled']} throttled), "
+          f"{requests['bytes_out'] / 2 ** 20:.1f} MB down, {requests['bytes_in'] / 2 ** 20:.1f} MB up")
+    print(f"   peak rss {result['peak_rss_mb']} MB, python heap {result['peak_python_heap_mb']} MB, "
+          f"children {result['peak_child_rss_mb']} MB")
+    for label, stage in result['stages'].items():
+        print(f"   {label:<42} n={stage['count']:<5} total={stage['total']:<9} p95={stage['p95']}")
+
+
+def compare(report, baseline):
+    """Print the relative change of the headline numbers against a baseline report"""
+    print("\n== change against baseline")
+    for name, result in report['workflows'].items():
+        before = baseline.get('workflows', {}).get(name)
+        if not before or 'skipped' in result or 'skipped' in before:
+            continue
+        for label, now, then in (
+            ('wall_seconds', result['wall_seconds'], before['wall_seconds']),
+            ('requests', result['requests']['total_requests'], before['requests']['total_requests']),
+            ('peak_rss_mb', result['peak_rss_mb'], before['peak_rss_mb'])
+        ):
+            change = (now - then) / then * 100 if then else 0.0
+            print(f"   {name:<34} {label:<13} {then:>10} -> {now:<10} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--workflow', action='append', choices=WORKFLOWS, help="run only these (repeatable)")
+    parser.add_argument('--leads', type=int, default=5)
+    parser.add_argument('--calls-per-lead', type=int, default=4)
+    parser.add_argument('--existing-per-lead', type=int, default=2,
+                        help="recordings already filed under other leads, per lead")
+    parser.add_argument('--audio-seconds', type=float, default=60)
+    parser.add_argument('--speech-ratio', type=float, default=0.6, help="share of each recording that is speech")
+    parser.add_argument('--latency-ms', type=float, default=0, help="added to every fake request")
+    parser.add_argument('--rate-limit', action='append', help="RingCentral group limit, e.g. Heavy=10/60")
+    parser.add_argument('--concurrency', type=int, default=1, help="leads processed at the same time")
+    parser.add_argument('--model', default='tiny', help="Whisper model for transcribing workflows")
+    parser.add_argument('--env', action='append', help="extra NAME=value for the workflows, e.g. VAD_ENABLED=1")
+    parser.add_argument('--timeout', type=float, default=3600, help="seconds allowed per workflow")
+    parser.add_argument('--keep-state', action='store_true', help="keep the local state directory for inspection")
+    parser.add_argument('--output', help="write the report as JSON")
+    parser.add_argument('--baseline', help="earlier --output to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            compare(report, json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
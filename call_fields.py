@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+from urllib.parse import quote
+from dotenv import load_dotenv
+from office365.sharepoint.files.file import File
+from phone_index import normalize_phone, normalize_folder, PROJECT_LEADS_ROOT
+from sharepoint_io import queue_item_fields
+from transcript_format import is_transcript_file, read_transcript_metadata
+import metrics
+
+# Load environment variables
+load_dotenv()
+
+# Title of the document library holding ProjectLeads ("Shared Documents")
+LIBRARY_TITLE = os.getenv('SHAREPOINT_LIBRARY_TITLE', 'Documents')
+
+# 'crawl' walks the lead folders as before and works on any library;
+# 'list' answers phone lookups with a filtered query on the call columns below,
+# and is only switched on once `python call_fields.py setup` and `tag-existing`
+# have run, since untagged files are invisible to it;
+# 'manifest' answers them from the local copy of the lead tree that
+# lead_manifest.py keeps current from the library's change log
+METADATA_LOOKUP = os.getenv('METADATA_LOOKUP', 'crawl')
+
+# Library column (internal name) -> call_metadata key. All are text columns
+# holding the values as written in transcripts, phone numbers in E.164
+CALL_FIELDS = {
+    'CallFrom': 'from',
+    'CallTo': 'to',
+    'RecordingId': 'recording_id',
+    'CallStartTime': 'start_time',
+    'CallDirection': 'direction',
+    'CallDuration': 'duration'
+}
+
+# Columns lookups filter on; a list can have at most 20 indexed columns
+INDEXED_FIELDS = ('CallFrom', 'CallTo', 'RecordingId')
+
+# Numbers per list query, keeping the $filter (two clauses per number) well
+# under the URL length limit
+PHONES_PER_QUERY = int(os.getenv('PHONES_PER_QUERY', '10'))
+
+PAGE_SIZE = 1000
+
+
+def call_field_values(call_metadata, recording_id=None):
+    """Column values for a file belonging to a call, ready for upload_content/upload_file"""
+    call_metadata = call_metadata or {}
+    values = {
+        'CallFrom': normalize_phone(call_metadata.get('from')),
+        'CallTo': normalize_phone(call_metadata.get('to')),
+        'RecordingId': recording_id or call_metadata.get('recording_id'),
+        'CallStartTime': call_metadata.get('start_time'),
+        'CallDirection': call_metadata.get('direction'),
+        'CallDuration': call_metadata.get('duration')
+    }
+    return {name: str(value) for name, value in values.items() if value not in (None, '')}
+
+
+def call_metadata_from_item(item):
+    """call_metadata rebuilt from a list item's call columns"""
+    metadata = {key: item.get(name) for name, key in CALL_FIELDS.items() if item.get(name)}
+    duration = metadata.get('duration')
+    if duration and duration.isdigit():
+        metadata['duration'] = int(duration)
+    return metadata
+
+
+def lead_folder_of(path):
+    """'Shared Documents/ProjectLeads/<lead>' for any path inside a lead folder"""
+    depth = len(PROJECT_LEADS_ROOT.split('/')) + 1
+    return '/'.join(normalize_folder(path).split('/')[:depth])
+
+
+@metrics.timed('call_fields.find_call_files')
+def find_call_files(ctx, phone_numbers):
+    """List items of every file whose caller or callee is one of the numbers
+
+    One query on the indexed CallFrom/CallTo columns per PHONES_PER_QUERY
+    numbers, paged on the server, instead of walking folders and reading
+    files. Items are dicts with FileRef, FileLeafRef, FileDirRef and the
+    call columns.
+    """
+    phones = sorted({phone for phone in map(normalize_phone, phone_numbers) if phone})
+    items = []
+    for start in range(0, len(phones), PHONES_PER_QUERY):
+        # The client puts $filter into the URL as is, where a bare "+" would read as a space
+        expression = ' or '.join(
+            f"{name} eq '{quote(phone)}'"
+            for phone in phones[start:start + PHONES_PER_QUERY]
+            for name in ('CallFrom', 'CallTo')
+        )
+        result = ctx.web.lists.get_by_title(LIBRARY_TITLE).items.filter(expression).select(
+            ['FileRef', 'FileLeafRef', 'FileDirRef'] + list(CALL_FIELDS)
+        ).get_all(PAGE_SIZE)
+        ctx.execute_query()
+        items.extend(item.properties for item in result)
+    return items
+
+
+def lead_folders_for_phones(ctx, phone_numbers):
+    """Lead folders holding a recording or transcript of a call with any of these numbers"""
+    return sorted({lead_folder_of(item['FileDirRef']) for item in find_call_files(ctx, phone_numbers)
+                   if item.get('FileDirRef')})
+
+
+def ensure_call_fields(ctx):
+    """Create whichever call columns the library is missing, indexing the ones lookups filter on"""
+    library = ctx.web.lists.get_by_title(LIBRARY_TITLE)
+    fields = library.fields.select(['InternalName']).get().execute_query()
+    existing = {field.properties.get('InternalName') for field in fields}
+
+    missing = [name for name in CALL_FIELDS if name not in existing]
+    for name in missing:
+        indexed = 'TRUE' if name in INDEXED_FIELDS else 'FALSE'
+        library.fields.create_field_as_xml(
+            f'<Field Type="Text" Name="{name}" StaticName="{name}" DisplayName="{name}" Indexed="{indexed}" />'
+        )
+    if missing:
+        ctx.execute_query()
+    print(f"Created {len(missing)} call columns on {LIBRARY_TITLE}")
+    return missing
+
+
+def tag_existing_files(ctx, root_folder=PROJECT_LEADS_ROOT):
+    """Set the call columns on files uploaded before they existed, with one crawl
+
+    Transcripts are tagged from their call_metadata and recordings from their
+    metadata sidecar, or else from a transcript naming the same recording id.
+    """
+    root = ctx.web.get_folder_by_server_relative_url(root_folder)
+    lead_folders = root.folders
+    ctx.load(lead_folders)
+    ctx.execute_query()
+
+    tagged = 0
+    for lead_folder in lead_folders:
+        lead_url = lead_folder.properties['ServerRelativeUrl']
+        try:
+            by_recording = {}
+            transcripts = ctx.web.get_folder_by_server_relative_url(f"{lead_url}/Transcripts_JSON").files
+            ctx.load(transcripts)
+            ctx.execute_query()
+            for file in transcripts:
+                if not is_transcript_file(file.properties['Name']):
+                    continue
+                metadata = read_transcript_metadata(ctx, file.properties['ServerRelativeUrl'])
+                call_metadata = dict(metadata.get('call_metadata') or {})
+                if metadata.get('recording_id'):
+                    call_metadata.setdefault('recording_id', metadata['recording_id'])
+                fields = call_field_values(call_metadata)
+                if fields:
+                    queue_item_fields(ctx, file.properties['ServerRelativeUrl'], fields)
+                    ctx.execute_query()
+                    by_recording[fields.get('RecordingId')] = fields
+                    tagged += 1
+
+            recordings = ctx.web.get_folder_by_server_relative_url(f"{lead_url}/Sources/RingCentral").files
+            ctx.load(recordings)
+            ctx.execute_query()
+            names = {file.properties['Name'] for file in recordings}
+            for file in recordings:
+                name = file.properties['Name']
+                if not name.endswith('.mp3'):
+                    continue
+                if f"{name}.json" in names:
+                    sidecar = File.open_binary(ctx, f"{file.properties['ServerRelativeUrl']}.json")
+                    fields = call_field_values(json.loads(sidecar.content.decode('utf-8')))
+                else:
+                    # Recordings are named ..._<recording id>.mp3
+                    fields = by_recording.get(os.path.splitext(name)[0].rsplit('_', 1)[-1])
+                if fields:
+                    queue_item_fields(ctx, file.properties['ServerRelativeUrl'], fields)
+                    ctx.execute_query()
+                    tagged += 1
+
+        except Exception as e:
+            print(f"Error tagging folder {lead_folder.properties['Name']}: {str(e)}")
+            continue
+
+    print(f"Tagged {tagged} files across {len(lead_folders)} lead folders")
+    return tagged
+
+
+if __name__ == "__main__":
+    # python call_fields.py setup         create the columns
+    # python call_fields.py tag-existing  fill them in on files uploaded earlier
+    from client_holder import get_sharepoint_context
+    command = sys.argv[1] if len(sys.argv) > 1 else 'setup'
+    if command == 'setup':
+        ensure_call_fields(get_sharepoint_context())
+    elif command == 'tag-existing':
+        tag_existing_files(get_sharepoint_context())
+    else:
+        sys.exit(f"Unknown command {command}; use setup or tag-existing")
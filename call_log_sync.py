@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from local_state import StateDB
+from phone_index import normalize_phone
+import metrics
+
+CALL_LOG_PATH = '/restapi/v1.0/account/~/call-log'
+
+# Page size for call-log requests (RingCentral allows up to 1000)
+PER_PAGE = int(os.getenv('CALL_LOG_PER_PAGE', '1000'))
+
+# How much history the first sync pulls. It runs inline (in the Function,
+# within its request), so it is kept to the window lookups cover; older
+# history is pulled once with `python call_log_sync.py [days]`
+INITIAL_DAYS = int(os.getenv('CALL_LOG_INITIAL_DAYS', '30'))
+
+# History the backfill command pulls by default
+BACKFILL_DAYS = int(os.getenv('CALL_LOG_BACKFILL_DAYS', '365'))
+
+# Minimum seconds between two syncs of the same store
+SYNC_INTERVAL = int(os.getenv('CALL_LOG_SYNC_INTERVAL', '300'))
+
+# Calls only appear in the log once they end, so each sync re-reads this
+# much history before the previous one to pick up long or late calls
+SYNC_OVERLAP = timedelta(minutes=int(os.getenv('CALL_LOG_SYNC_OVERLAP_MINUTES', '240')))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS calls (
+    id TEXT PRIMARY KEY,
+    start_time TEXT,
+    recording_id TEXT,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS call_phones (
+    phone TEXT NOT NULL,
+    call_id TEXT NOT NULL,
+    PRIMARY KEY (phone, call_id)
+);
+CREATE INDEX IF NOT EXISTS calls_by_recording ON calls (recording_id);
+'''
+
+_sync_lock = threading.Lock()
+
+
+def format_timestamp(moment):
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def call_phone_numbers(call):
+    """Every normalized phone number on a call record, including its legs"""
+    parties = [call] + list(call.get('legs') or [])
+    phones = set()
+    for party in parties:
+        for side in ('from', 'to'):
+            phone = normalize_phone((party.get(side) or {}).get('phoneNumber'))
+            if phone:
+                phones.add(phone)
+    return phones
+
+
+class CallLogSync:
+    """Mirrors the account-wide call log into a local store, one incremental pass per interval
+
+    Each pass starts from a persisted dateFrom checkpoint and follows the
+    navigation links until the last page, so per-lead queries are answered
+    locally instead of with one call-log request per phone number.
+    """
+
+    def __init__(self, platform, filename='call_log.db', sync_interval=SYNC_INTERVAL):
+        self.platform = platform
+        self.sync_interval = sync_interval
+        self.db = StateDB(filename, SCHEMA)
+
+    @metrics.timed('call_log.sync')
+    def sync(self, force=False):
+        """Pull new call-log records unless the store was synced within the interval"""
+        with _sync_lock:
+            last_sync = self.db.get_meta('last_sync')
+            started = datetime.now(timezone.utc)
+            if not force and last_sync:
+                if (started - datetime.fromisoformat(last_sync)).total_seconds() < self.sync_interval:
+                    return 0
+
+            date_from = self.db.get_meta('date_from') or format_timestamp(started - timedelta(days=INITIAL_DAYS))
+            synced = self.pull(date_from)
+
+            self.db.set_meta('date_from', format_timestamp(started - SYNC_OVERLAP))
+            self.db.set_meta('last_sync', started.isoformat())
+            print(f"Synced {synced} call-log records since {date_from}")
+            return synced
+
+    @metrics.timed('call_log.backfill')
+    def backfill(self, days=BACKFILL_DAYS):
+        """Pull the last days of history into the store, leaving the sync checkpoint as it is"""
+        with _sync_lock:
+            date_from = format_timestamp(datetime.now(timezone.utc) - timedelta(days=days))
+            synced = self.pull(date_from)
+            print(f"Backfilled {synced} call-log records since {date_from}")
+            return synced
+
+    def pull(self, date_from):
+        """Store every call-log record since date_from, following the pages to the last one"""
+        url = CALL_LOG_PATH
+        params = {
+            'type': 'Voice',
+            'view': 'Detailed',
+            'dateFrom': date_from,
+            'perPage': PER_PAGE
+        }
+
+        synced = 0
+        while url:
+            data = self.platform.get(url, params).json()
+            records = data.get('records', [])
+            self.store(records)
+            synced += len(records)
+
+            # Next page URIs already carry the query
+            url = ((data.get('navigation') or {}).get('nextPage') or {}).get('uri')
+            params = None
+        return synced
+
+    def store(self, records):
+        """Insert or update call records and their phone-number index"""
+        with self.db.transaction() as conn:
+            for call in records:
+                call_id = call.get('id')
+                if not call_id:
+                    continue
+                recording_id = (call.get('recording') or {}).get('id')
+                conn.execute(
+                    'INSERT OR REPLACE INTO calls (id, start_time, recording_id, record) VALUES (?, ?, ?, ?)',
+                    (call_id, call.get('startTime'), str(recording_id) if recording_id else None, json.dumps(call))
+                )
+                conn.executemany(
+                    'INSERT OR IGNORE INTO call_phones (phone, call_id) VALUES (?, ?)',
+                    [(phone, call_id) for phone in call_phone_numbers(call)]
+                )
+
+    def calls_for_phone(self, phone_number, with_recording=False, date_from=None):
+        """Return stored call records involving a phone number, newest first"""
+        sql = '''
+            SELECT calls.record FROM calls
+            JOIN call_phones ON call_phones.call_id = calls.id
+            WHERE call_phones.phone = ?
+        '''
+        params = [normalize_phone(phone_number)]
+        if with_recording:
+            sql += ' AND calls.recording_id IS NOT NULL'
+        if date_from:
+            sql += ' AND calls.start_time >= ?'
+            params.append(format_timestamp(date_from))
+        sql += ' ORDER BY calls.start_time DESC'
+        return [json.loads(row[0]) for row in self.db.query(sql, params)]
+
+
+if __name__ == "__main__":
+    # Pull older history once, outside the Function: python call_log_sync.py [days]
+    from client_holder import get_client
+    CallLogSync(get_client()).backfill(int(sys.argv[1]) if len(sys.argv) > 1 else BACKFILL_DAYS)
@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+from office365.runtime.auth.providers.acs_token_provider import ACSTokenProvider
+from office365.runtime.auth.token_response import TokenResponse
+from office365.sharepoint.client_context import ClientContext
+from rc_client import RingCentralClient
+import metrics
+
+# Load environment variables
+load_dotenv()
+
+# Tokens are renewed this many seconds before they expire
+REFRESH_MARGIN_SECONDS = int(os.getenv('TOKEN_REFRESH_MARGIN_SECONDS', '300'))
+
+
+class ClientHolder:
+    """Authenticated RingCentral and SharePoint clients, shared by everything in this process
+
+    Each token is fetched once and reused until it is within
+    REFRESH_MARGIN_SECONDS of expiring, then renewed by the next caller
+    before it is used. In a warm Function instance only the first
+    invocation pays for authentication.
+
+    Pre-issued tokens (RC_ACCESS_TOKEN without RC_JWT_TOKEN, or
+    SHAREPOINT_ACCESS_TOKEN) are used as they are and never renewed, so that
+    mode only lasts as long as the token does; it is meant for short runs
+    and local stand-ins, not for a long-lived deployment.
+    """
+
+    def __init__(self):
+        self.rc_lock = threading.Lock()
+        self.rc_token = None
+        self.rc_expires_at = 0
+        self.rc_client = RingCentralClient(token_provider=self.ringcentral_token)
+
+        self.sharepoint_site = os.getenv('SHAREPOINT_SITE_URL')
+        self.sp_lock = threading.Lock()
+        self.sp_token = None
+        self.sp_expires_at = 0
+        self.sp_generation = 0
+        self.local = threading.local()
+
+    def ringcentral_token(self):
+        """Current RingCentral access token, exchanging RC_JWT_TOKEN again shortly before it expires"""
+        jwt = os.getenv('RC_JWT_TOKEN')
+        if not jwt:
+            # A pre-issued token cannot be renewed here; RingCentralClient
+            # raises a clear error once it is rejected
+            return os.getenv('RC_ACCESS_TOKEN')
+
+        with self.rc_lock:
+            if self.rc_token is None or time.time() >= self.rc_expires_at - REFRESH_MARGIN_SECONDS:
+                token = self.rc_client.exchange_jwt(jwt)
+                self.rc_token = token['access_token']
+                self.rc_expires_at = time.time() + int(token.get('expires_in') or 3600)
+            return self.rc_token
+
+    def sharepoint_token(self):
+        """Current SharePoint app-only token response, fetched again shortly before it expires"""
+        with self.sp_lock:
+            access_token = os.getenv('SHAREPOINT_ACCESS_TOKEN')
+            if access_token and self.sp_token is None:
+                # A pre-issued token (e.g. for a local SharePoint stand-in) is used as is
+                self.sp_token = TokenResponse(access_token, 'Bearer')
+                self.sp_expires_at = float('inf')
+                self.sp_generation += 1
+            if self.sp_token is None or time.time() >= self.sp_expires_at - REFRESH_MARGIN_SECONDS:
+                provider = ACSTokenProvider(
+                    self.sharepoint_site,
+                    os.getenv('SHAREPOINT_CLIENT_ID'),
+                    os.getenv('SHAREPOINT_CLIENT_SECRET')
+                )
+                self.sp_token = provider.get_app_only_access_token()
+                self.sp_expires_at = time.time() + int(getattr(self.sp_token, 'expiresIn', None) or 3600)
+                self.sp_generation += 1
+            return self.sp_token, self.sp_generation
+
+    def sharepoint_context(self):
+        """SharePoint context for the calling thread (ClientContext is not thread-safe)
+
+        A context keeps the token it was first given, so the thread gets a
+        new one whenever the shared token has been renewed.
+        """
+        token, generation = self.sharepoint_token()
+        if getattr(self.local, 'generation', None) != generation:
+            self.local.ctx = ClientContext(self.sharepoint_site).with_access_token(lambda: token)
+            self.local.ctx.pending_request().beforeExecute += count_sharepoint_request
+            self.local.generation = generation
+        return self.local.ctx
+
+
+def count_sharepoint_request(request):
+    """Count each request a SharePoint context sends, including batches and upload chunks"""
+    metrics.inc('api_requests_total', service='sharepoint', method=request.method)
+    if isinstance(request.data, bytes):
+        metrics.record_transfer('sharepoint', 'up', len(request.data))
+
+
+_holder = None
+_holder_lock = threading.Lock()
+
+
+def get_client_holder():
+    """Return the process-wide client holder"""
+    global _holder
+    with _holder_lock:
+        if _holder is None:
+            _holder = ClientHolder()
+        return _holder
+
+
+def get_client():
+    """Return the RingCentral client shared by every module in this process"""
+    return get_client_holder().rc_client
+
+
+def get_sharepoint_context():
+    """Return this thread's SharePoint context, authenticated with the shared token"""
+    return get_client_holder().sharepoint_context()
@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import threading
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from office365.runtime.client_request_exception import ClientRequestException
+from office365.sharepoint.changes.query import ChangeQuery
+from office365.sharepoint.changes.token import ChangeToken
+from office365.sharepoint.changes.type import ChangeType
+from local_state import StateDB
+from phone_index import normalize_phone, normalize_folder, PROJECT_LEADS_ROOT
+from call_fields import CALL_FIELDS, LIBRARY_TITLE, PAGE_SIZE, lead_folder_of
+import metrics
+
+# Load environment variables
+load_dotenv()
+
+# Minimum seconds between two delta syncs; lookups in between read the manifest as is
+SYNC_INTERVAL = int(os.getenv('MANIFEST_SYNC_INTERVAL', '60'))
+
+# Changes fetched per GetChanges request
+CHANGE_PAGE_SIZE = int(os.getenv('MANIFEST_CHANGE_PAGE_SIZE', '1000'))
+
+# Changed items re-read per list query, keeping the ID filter under the URL length limit
+ITEMS_PER_QUERY = 50
+
+ITEM_FIELDS = ['ID', 'FileRef', 'FileLeafRef', 'FileDirRef', 'FSObjType', 'Modified'] + list(CALL_FIELDS)
+
+# Change types after which an item is no longer in the library
+REMOVED = (ChangeType.DeleteObject, ChangeType.MoveAway)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    lead TEXT NOT NULL,
+    is_folder INTEGER NOT NULL,
+    modified TEXT,
+    call_from TEXT,
+    call_to TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_by_path ON items (path);
+CREATE INDEX IF NOT EXISTS items_by_lead ON items (lead);
+CREATE INDEX IF NOT EXISTS items_by_call_from ON items (call_from);
+CREATE INDEX IF NOT EXISTS items_by_call_to ON items (call_to);
+'''
+
+INSERT = '''
+INSERT OR REPLACE INTO items (id, path, lead, is_folder, modified, call_from, call_to, record)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def manifest_row(item):
+    """The items row for a list item under the lead tree, or None for anything outside it"""
+    path = normalize_folder(item.get('FileRef') or '')
+    if not path.startswith(PROJECT_LEADS_ROOT + '/'):
+        return None
+    # Same shape as the items call_fields.find_call_files returns
+    record = {
+        name: item[name] for name in ['FileRef', 'FileLeafRef', 'FileDirRef'] + list(CALL_FIELDS)
+        if item.get(name) not in (None, '')
+    }
+    return (
+        int(item.get('ID') or item.get('Id')),
+        path,
+        lead_folder_of(path),
+        1 if str(item.get('FSObjType')) == '1' else 0,
+        item.get('Modified'),
+        normalize_phone(item.get('CallFrom')),
+        normalize_phone(item.get('CallTo')),
+        json.dumps(record)
+    )
+
+
+def is_rejected_token(error):
+    """Whether GetChanges turned the change token down, as it does once the token outlives the change log"""
+    message = str(error).lower()
+    return 'changetoken' in message or 'argumentoutofrange' in message
+
+
+class LeadManifest:
+    """Local copy of the folders and files under ProjectLeads, kept current from the library's change log
+
+    The first sync lists the library once and stores the change token it
+    started from. Every later sync asks GetChanges for what was added,
+    changed or deleted since that token and re-reads only those items, so
+    it costs requests in proportion to the changes, not to the size of the
+    tree. Lookups by lead folder or phone number are then answered locally.
+    """
+
+    def __init__(self, filename='lead_manifest.db', sync_interval=SYNC_INTERVAL):
+        self.sync_interval = sync_interval
+        self.db = StateDB(filename, SCHEMA)
+        self.lock = threading.Lock()
+
+    @metrics.timed('manifest.sync')
+    def sync(self, ctx, force=False):
+        """Apply the library's changes unless the manifest was synced within the interval; returns items changed"""
+        with self.lock:
+            last_sync = self.db.get_meta('last_sync')
+            started = datetime.now(timezone.utc)
+            if not force and last_sync:
+                if (started - datetime.fromisoformat(last_sync)).total_seconds() < self.sync_interval:
+                    return 0
+
+            token = self.db.get_meta('change_token')
+            if token:
+                try:
+                    changed = self.apply_changes(ctx, token)
+                except ClientRequestException as e:
+                    if not is_rejected_token(e):
+                        raise
+                    print(f"Change token rejected, listing the library again: {str(e)}")
+                    changed = self.rebuild(ctx)
+            else:
+                changed = self.rebuild(ctx)
+
+            self.db.set_meta('last_sync', started.isoformat())
+            return changed
+
+    def rebuild(self, ctx):
+        """List every item in the library once, keeping those under the lead tree"""
+        # The token is read before listing, so changes made meanwhile are replayed by the next sync
+        library = ctx.web.lists.get_by_title(LIBRARY_TITLE).select(['CurrentChangeToken']).get()
+        ctx.execute_query()
+        token = library.current_change_token.StringValue
+
+        items = ctx.web.lists.get_by_title(LIBRARY_TITLE).items.select(ITEM_FIELDS).get_all(PAGE_SIZE)
+        ctx.execute_query()
+        rows = [row for row in (manifest_row(item.properties) for item in items) if row]
+
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM items')
+            conn.executemany(INSERT, rows)
+        self.db.set_meta('change_token', token)
+        metrics.inc('manifest_changes_total', len(rows), kind='listed')
+        print(f"Listed {len(rows)} items under {PROJECT_LEADS_ROOT}")
+        return len(rows)
+
+    def apply_changes(self, ctx, token):
+        """Fetch the item changes since token page by page and apply them to the manifest"""
+        changed, removed = set(), set()
+        while True:
+            query = ChangeQuery(
+                item=True, add=True, update=True, system_update=True, delete_object=True,
+                role_assignment_add=False, role_assignment_delete=False,
+                change_token_start=ChangeToken(token), fetch_limit=CHANGE_PAGE_SIZE
+            )
+            # Not constructor arguments in this client version, but part of SP.ChangeQuery
+            query.Rename = True
+            query.Move = True
+            query.Restore = True
+            changes = ctx.web.lists.get_by_title(LIBRARY_TITLE).get_changes(query)
+            ctx.execute_query()
+
+            # Only the last change to an item matters: it is either gone or re-read as it is now
+            for change in changes:
+                item_id = change.properties.get('ItemId')
+                if item_id is not None:
+                    if change.change_type in REMOVED:
+                        changed.discard(item_id)
+                        removed.add(item_id)
+                    else:
+                        removed.discard(item_id)
+                        changed.add(item_id)
+                token = change.change_token.StringValue or token
+
+            if len(changes) < CHANGE_PAGE_SIZE:
+                break
+
+        rows = self.read_items(ctx, changed)
+
+        # Renaming or moving a folder logs one change for the folder only,
+        # so whatever the manifest holds beneath it is re-read as well
+        moved = set()
+        for item_id, row in rows.items():
+            old_path = self.path_of(item_id)
+            if row[3] and old_path and old_path != row[1]:
+                moved.update(self.descendants(old_path))
+        rows.update(self.read_items(ctx, moved - set(rows)))
+
+        with self.db.transaction() as conn:
+            for item_id in removed | ((changed | moved) - set(rows)):
+                # Deleted, moved out of the lead tree, or gone again before it could be read
+                self.remove(conn, item_id)
+            conn.executemany(INSERT, rows.values())
+        self.db.set_meta('change_token', token)
+
+        metrics.inc('manifest_changes_total', len(rows), kind='updated')
+        metrics.inc('manifest_changes_total', len(removed), kind='removed')
+        if rows or removed:
+            print(f"Applied {len(rows)} updated and {len(removed)} removed items to the lead manifest")
+        return len(rows) + len(removed)
+
+    def read_items(self, ctx, item_ids):
+        """Current rows for the given item ids, keyed by id; items outside the lead tree are left out"""
+        item_ids = sorted(item_ids)
+        rows = {}
+        for start in range(0, len(item_ids), ITEMS_PER_QUERY):
+            expression = ' or '.join(f"ID eq {item_id}" for item_id in item_ids[start:start + ITEMS_PER_QUERY])
+            items = ctx.web.lists.get_by_title(LIBRARY_TITLE).items.filter(expression).select(
+                ITEM_FIELDS
+            ).get_all(PAGE_SIZE)
+            ctx.execute_query()
+            for item in items:
+                row = manifest_row(item.properties)
+                if row:
+                    rows[row[0]] = row
+        return rows
+
+    def path_of(self, item_id):
+        rows = self.db.query('SELECT path FROM items WHERE id = ?', (item_id,))
+        return rows[0][0] if rows else None
+
+    def descendants(self, folder_path):
+        """Ids of everything the manifest holds beneath a folder"""
+        prefix = folder_path + '/'
+        rows = self.db.query('SELECT id FROM items WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def remove(conn, item_id):
+        """Drop an item and, for a folder, everything beneath it (a folder delete is logged once)"""
+        row = conn.execute('SELECT path, is_folder FROM items WHERE id = ?', (item_id,)).fetchone()
+        if row is None:
+            return
+        conn.execute('DELETE FROM items WHERE id = ?', (item_id,))
+        if row[1]:
+            prefix = row[0] + '/'
+            conn.execute('DELETE FROM items WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))
+
+    def find_call_files(self, phone_numbers):
+        """Items of every file whose caller or callee is one of the numbers, as call_fields.find_call_files"""
+        phones = sorted({phone for phone in map(normalize_phone, phone_numbers) if phone})
+        if not phones:
+            return []
+        placeholders = ', '.join('?' * len(phones))
+        rows = self.db.query(
+            f'SELECT record FROM items WHERE is_folder = 0 '
+            f'AND (call_from IN ({placeholders}) OR call_to IN ({placeholders})) ORDER BY path',
+            phones + phones
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def lead_folders_for_phones(self, phone_numbers):
+        """Lead folders holding a recording or transcript of a call with any of these numbers"""
+        phones = sorted({phone for phone in map(normalize_phone, phone_numbers) if phone})
+        if not phones:
+            return []
+        placeholders = ', '.join('?' * len(phones))
+        rows = self.db.query(
+            f'SELECT DISTINCT lead FROM items WHERE is_folder = 0 '
+            f'AND (call_from IN ({placeholders}) OR call_to IN ({placeholders})) ORDER BY lead',
+            phones + phones
+        )
+        return [row[0] for row in rows]
+
+
+_lead_manifest = None
+_lead_manifest_lock = threading.Lock()
+
+
+def get_lead_manifest():
+    """Return the process-wide lead manifest"""
+    global _lead_manifest
+    with _lead_manifest_lock:
+        if _lead_manifest is None:
+            _lead_manifest = LeadManifest()
+        return _lead_manifest
+
+
+if __name__ == "__main__":
+    # python lead_manifest.py         apply the changes since the last sync
+    # python lead_manifest.py --full  list the whole library again
+    from client_holder import get_sharepoint_context
+    manifest = get_lead_manifest()
+    if '--full' in sys.argv[1:]:
+        manifest.db.set_meta('change_token', '')
+    manifest.sync(get_sharepoint_context(), force=True)
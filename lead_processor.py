@@ -1,52 +1,36 @@
-from ringcentral import SDK
-import os
-import json
-import requests
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from office365.runtime.auth.client_credential import ClientCredential
-from office365.sharepoint.client_context import ClientContext
-from office365.sharepoint.files.file import File
+from client_holder import get_client, get_sharepoint_context
+from phone_index import get_phone_index
+from sharepoint_io import ensure_folders, upload_content
+from transcript_format import dumps_transcript, transcript_extension
+from call_log_sync import CallLogSync
+from call_fields import call_field_values
+import metrics
 
 # Load environment variables
 load_dotenv()
 
 class LeadProcessor:
     def __init__(self):
-        # Initialize RingCentral SDK
-        self.rcsdk = SDK(
-            os.getenv('RC_CLIENT_ID'),
-            os.getenv('RC_CLIENT_SECRET'),
-            os.getenv('RC_SERVER_URL', 'https://platform.ringcentral.com')
-        )
-        self.platform = self.rcsdk.platform()
+        # Shared RingCentral client with pooled connections and rate limiting
+        self.platform = get_client()
         
-        # Set the access token
-        self.access_token = os.getenv('RC_ACCESS_TOKEN')
-        self.platform.auth().set_data({
-            'access_token': self.access_token,
-            'token_type': 'bearer',
-            'expires_in': 3600,
-            'scope': 'ReadContacts SubscriptionWebSocket ReadAccounts RingSense ReadCallLog ReadCallRecording SubscriptionWebhook Analytics WebSocket'
-        })
-        
-        # Initialize SharePoint context
-        self.sharepoint_site = os.getenv('SHAREPOINT_SITE_URL')
-        self.client_id = os.getenv('SHAREPOINT_CLIENT_ID')
-        self.client_secret = os.getenv('SHAREPOINT_CLIENT_SECRET')
-        self.ctx = ClientContext(self.sharepoint_site).with_credentials(
-            ClientCredential(self.client_id, self.client_secret)
-        )
+        # Local mirror of the account call log
+        self.call_log = CallLogSync(self.platform)
+
+    @property
+    def ctx(self):
+        """SharePoint context for the calling thread, sharing the process-wide cached token"""
+        return get_sharepoint_context()
 
+    @metrics.timed('lead.create_folders')
     def create_folder_structure(self, address_lastName):
         """Create the required folder structure in SharePoint"""
         try:
             base_path = f"Shared Documents/ProjectLeads/{address_lastName}"
             
-            # Create main folder
-            self.ensure_folder_exists(base_path)
-            
-            # Create subfolders
+            # Subfolders to create under the lead folder
             subfolders = [
                 "Sources/RingCentral",
                 "Sources/Walkthroughs",
@@ -60,41 +44,40 @@ class LeadProcessor:
                 "AI_Outputs/Decks"
             ]
             
-            for subfolder in subfolders:
-                folder_path = f"{base_path}/{subfolder}"
-                self.ensure_folder_exists(folder_path)
+            # Create the main folder and all subfolders in one batch, skipping
+            # folders already known to exist
+            ensure_folders(self.ctx, [base_path] + [f"{base_path}/{subfolder}" for subfolder in subfolders])
             
             print(f"Created folder structure for {address_lastName}")
             return base_path
             
         except Exception as e:
             print(f"Error creating folder structure: {str(e)}")
+            metrics.stage_error('lead.create_folders')
             return None
 
     def ensure_folder_exists(self, folder_path):
         """Create a folder if it doesn't exist"""
         try:
-            folder = self.ctx.web.ensure_folder_path(folder_path).execute_query()
-            return folder
+            ensure_folders(self.ctx, [folder_path])
+            return folder_path
         except Exception as e:
             print(f"Error creating folder {folder_path}: {str(e)}")
+            metrics.stage_error('lead.ensure_folder')
             return None
 
-    def get_ringsense_transcripts(self, phone_number, days_back=30):
-        """Get RingSense transcripts for a phone number"""
+    @metrics.timed('lead.get_ringsense_transcripts')
+    def get_ringsense_transcripts(self, phone_number, days_back=None):
+        """Get RingSense transcripts for a phone number, optionally limited to the last days_back days"""
         try:
             # Format phone number to E.164 format
             formatted_phone = self.format_phone_number(phone_number)
             
-            # Get call recordings with transcripts
-            response = self.platform.get('/restapi/v1.0/account/~/call-log', {
-                'type': 'Voice',
-                'phoneNumber': formatted_phone,
-                'view': 'Detailed',
-                'dateFrom': (datetime.now() - timedelta(days=days_back)).isoformat() + 'Z'
-            })
+            # Get calls from the locally synced call log, pulling new records first
+            self.call_log.sync()
+            date_from = datetime.now() - timedelta(days=days_back) if days_back else None
+            calls = self.call_log.calls_for_phone(formatted_phone, date_from=date_from)
             
-            calls = response.json().get('records', [])
             print(f"Found {len(calls)} calls for {phone_number}")
             
             transcripts = []
@@ -125,13 +108,16 @@ class LeadProcessor:
                         
                     except Exception as e:
                         print(f"Error getting transcript for recording {recording_id}: {str(e)}")
+                        metrics.stage_error('lead.get_ringsense_transcripts')
             
             return transcripts
             
         except Exception as e:
             print(f"Error getting RingSense transcripts: {str(e)}")
+            metrics.stage_error('lead.get_ringsense_transcripts')
             return []
 
+    @metrics.timed('lead.save_transcripts')
     def save_transcripts(self, transcripts, lead_folder_path):
         """Save transcripts to SharePoint"""
         try:
@@ -146,19 +132,20 @@ class LeadProcessor:
                 recording_id = transcript['recording_id']
                 direction = transcript['call_metadata']['direction']
                 
-                filename = f"transcript_{timestamp}_{direction}_{recording_id}.json"
+                filename = f"transcript_{timestamp}_{direction}_{recording_id}{transcript_extension()}"
                 file_path = f"{transcripts_folder}/{filename}"
                 
                 # Save transcript
-                File.save_content(
-                    self.ctx,
-                    file_path,
-                    json.dumps(transcript, indent=2)
-                )
+                upload_content(self.ctx, file_path, dumps_transcript(transcript),
+                               fields=call_field_values(transcript['call_metadata'], recording_id),
+                               ensure_folder=True)
+                get_phone_index().add_transcript(transcript, lead_folder_path)
+                metrics.record_transcript_saved('ringsense', transcript['call_metadata'])
                 print(f"Saved transcript: {file_path}")
             
         except Exception as e:
             print(f"Error saving transcripts: {str(e)}")
+            metrics.stage_error('lead.save_transcripts')
 
     @staticmethod
     def format_phone_number(phone):
@@ -170,6 +157,7 @@ class LeadProcessor:
             return f"+{digits}"
         return f"+{digits}"
 
+@metrics.timed('lead.process_new_lead')
 def process_new_lead(address_lastName, phone_number):
     """Process a new lead: create folders and get transcripts"""
     processor = LeadProcessor()
@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+META_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def get_state_dir():
+    """Directory holding local indexes and caches (override with LOCAL_STATE_DIR)"""
+    state_dir = os.getenv('LOCAL_STATE_DIR', os.path.join(os.path.expanduser('~'), '.rc_recordings'))
+    os.makedirs(state_dir, exist_ok=True)
+    return state_dir
+
+
+class StateDB:
+    """Thread-safe SQLite database stored in the local state directory"""
+
+    def __init__(self, filename, schema):
+        self.path = os.path.join(get_state_dir(), filename)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(META_SCHEMA + schema)
+        self.conn.commit()
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            cursor = self.conn.execute(sql, params)
+            self.conn.commit()
+            return cursor.rowcount
+
+    def executemany(self, sql, rows):
+        with self.lock:
+            self.conn.executemany(sql, rows)
+            self.conn.commit()
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    @contextmanager
+    def transaction(self):
+        """Run several statements atomically on the underlying connection"""
+        with self.lock:
+            with self.conn:
+                yield self.conn
+
+    def get_meta(self, key, default=None):
+        rows = self.query('SELECT value FROM meta WHERE key = ?', (key,))
+        return rows[0][0] if rows else default
+
+    def set_meta(self, key, value):
+        self.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import bisect
+import logging
+import functools
+import threading
+from datetime import datetime, timezone
+
+# METRICS_ENABLED=0 turns every call below into a no-op
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+
+# Also write one JSON log line per timed stage, for log-based dashboards
+METRICS_LOG_EVENTS = os.getenv('METRICS_LOG_EVENTS', '0') == '1'
+
+PREFIX = 'rc_recordings_'
+
+# Upper bounds in seconds, wide enough for a Whisper pass over a long call
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Call end to saved transcript, from webhooks (seconds) to backfills (days)
+LAG_BUCKETS = (10, 30, 60, 120, 300, 600, 1800, 3600, 4 * 3600, 24 * 3600, 7 * 24 * 3600)
+
+HELP = {
+    'stage_duration_seconds': "Wall time of a processing stage",
+    'stage_errors_total': "Errors raised or handled inside a stage",
+    'api_requests_total': "HTTP requests sent to RingCentral and SharePoint",
+    'api_request_duration_seconds': "Time from sending an API request to its response headers",
+    'api_retries_total': "API requests sent again after a throttling response",
+    'transferred_bytes_total': "Bytes downloaded and uploaded",
+    'transcript_lag_seconds': "Time from the end of a call to its transcript being saved",
+    'transcripts_saved_total': "Transcripts written to SharePoint",
+    'webhook_events_total': "Webhook notifications queued or turned away by the receiver",
+    'webhook_session_events_total': "Telephony-session events by what the session coalescer did with them",
+    'manifest_changes_total': "Library items listed, updated or removed in the local lead manifest"
+}
+
+logger = logging.getLogger('metrics')
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Counters and histograms keyed by name and label values
+
+    Recording is a dict lookup and an addition under one lock, so stages can
+    stay instrumented in production. Label values should come from a small
+    set (stage names, rate-limit groups, status codes), never from ids.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """Counters and histogram count/sum as plain data, for structured logs and reports"""
+        with self.lock:
+            return {
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                'histograms': [
+                    {'name': name, 'labels': dict(labels), 'count': histogram.count,
+                     'sum': round(histogram.sum, 6)}
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                ]
+            }
+
+    def render(self):
+        """Everything recorded so far in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, (histogram.buckets, list(histogram.counts), histogram.sum, histogram.count))
+                for key, histogram in self.histograms.items()
+            )
+
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f"{PREFIX}{name}{format_labels(labels)} {value}")
+
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f"{PREFIX}{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{PREFIX}{name}_count{format_labels(labels)} {count}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+registry = Registry()
+
+
+def inc(name, value=1, **labels):
+    """Add value to a counter"""
+    if METRICS_ENABLED:
+        registry.inc(name, value, **labels)
+
+
+def observe(name, value, buckets=DURATION_BUCKETS, **labels):
+    """Record one value in a histogram"""
+    if METRICS_ENABLED:
+        registry.observe(name, value, buckets, **labels)
+
+
+def record_stage(stage, seconds, outcome='ok', **fields):
+    """Record a finished stage; fields only go to the event log"""
+    if not METRICS_ENABLED:
+        return
+    registry.observe('stage_duration_seconds', seconds, stage=stage, outcome=outcome)
+    if outcome != 'ok':
+        registry.inc('stage_errors_total', stage=stage)
+    if METRICS_LOG_EVENTS:
+        logger.info(json.dumps(dict(
+            fields, event='stage', stage=stage, outcome=outcome, seconds=round(seconds, 6)
+        ), default=str))
+
+
+def stage_error(stage):
+    """Count an error a stage handled itself (logged and skipped rather than raised)"""
+    inc('stage_errors_total', stage=stage)
+
+
+class timed:
+    """Time a block or a function as a stage
+
+        with metrics.timed('webhook.find_lead_folders'):
+            ...
+
+        @metrics.timed('lead.save_transcripts')
+        def save_transcripts(self, ...):
+            ...
+
+    An exception escaping the block is recorded with outcome="error" and re-raised.
+    """
+
+    def __init__(self, stage, **fields):
+        self.stage = stage
+        self.fields = fields
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record_stage(self.stage, time.perf_counter() - self.started,
+                     'ok' if exc_type is None else 'error', **self.fields)
+        return False
+
+    def __call__(self, func):
+        stage = self.stage
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def record_transfer(service, direction, size):
+    """Count bytes moved to (up) or from (down) a service"""
+    if size:
+        inc('transferred_bytes_total', size, service=service, direction=direction)
+
+
+def call_end_time(call_metadata):
+    """When a call ended, from its end time or its start time plus duration; None if unknown"""
+    try:
+        end_time = call_metadata.get('end_time')
+        if end_time:
+            return datetime.fromisoformat(end_time.replace('Z', '+00:00')).timestamp()
+        start_time = call_metadata.get('start_time')
+        if start_time:
+            started = datetime.fromisoformat(start_time.replace('Z', '+00:00')).timestamp()
+            return started + float(call_metadata.get('duration') or 0)
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return None
+
+
+def record_transcript_saved(source, call_metadata):
+    """Count a saved transcript and the lag since its call ended"""
+    if not METRICS_ENABLED:
+        return
+    registry.inc('transcripts_saved_total', source=source)
+    ended = call_end_time(call_metadata or {})
+    if ended is not None:
+        lag = max(0.0, datetime.now(timezone.utc).timestamp() - ended)
+        registry.observe('transcript_lag_seconds', lag, LAG_BUCKETS, source=source)
+
+
+def render_prometheus():
+    return registry.render()
+
+
+def log_snapshot(message='metrics'):
+    """Write the current counters and histograms as one JSON log line"""
+    if METRICS_ENABLED:
+        logger.info(json.dumps({'event': message, **registry.snapshot()}))
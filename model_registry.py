@@ -0,0 +1,63 @@
+import os
+import threading
+from collections import OrderedDict
+from transcription_backends import get_backend
+
+DEFAULT_MODEL = os.getenv('WHISPER_MODEL', 'base')
+
+
+class ModelRegistry:
+    """Loads models of the transcription backend lazily and keeps the most recently used ones within a memory budget"""
+
+    def __init__(self, memory_budget_mb=None):
+        if memory_budget_mb is None:
+            memory_budget_mb = int(os.getenv('WHISPER_MODEL_MEMORY_MB', '2048'))
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.models = OrderedDict()  # backend cache name -> (model, size in bytes), least recently used first
+        self.load_locks = {}
+        self.lock = threading.Lock()
+
+    def get(self, name=DEFAULT_MODEL):
+        """Return the named model, loading it on first use"""
+        backend = get_backend()
+        key = backend.cache_name(name)
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                return self.models[key][0]
+            load_lock = self.load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given model; the others wait for it
+        with load_lock:
+            with self.lock:
+                if key in self.models:
+                    self.models.move_to_end(key)
+                    return self.models[key][0]
+
+            print(f"Loading {backend.name} model '{name}'...")
+            model = backend.load_model(name)
+
+            with self.lock:
+                self.models[key] = (model, backend.model_size(model, name))
+                self.evict()
+            return model
+
+    def evict(self):
+        """Drop least recently used models until the budget is met, always keeping the newest"""
+        total = sum(size for _, size in self.models.values())
+        while total > self.memory_budget and len(self.models) > 1:
+            name, (_, size) = self.models.popitem(last=False)
+            total -= size
+            print(f"Evicted model '{name}' ({size // (1024 * 1024)} MB)")
+
+    def clear(self):
+        with self.lock:
+            self.models.clear()
+
+
+_registry = ModelRegistry()
+
+
+def get_model(name=DEFAULT_MODEL):
+    """Return a model of the configured backend, shared by every processor in this process"""
+    return _registry.get(name)
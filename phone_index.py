@@ -0,0 +1,156 @@
+import os
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+from local_state import StateDB
+from transcript_format import is_transcript_file, read_transcript_metadata
+import metrics
+
+# Load environment variables
+load_dotenv()
+
+PROJECT_LEADS_ROOT = "Shared Documents/ProjectLeads"
+
+# Seconds before the index is crawled again, picking up transcripts other
+# hosts wrote and folders that were renamed or deleted; 0 never re-crawls
+MAX_AGE = int(os.getenv('PHONE_INDEX_MAX_AGE', '3600'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS phone_folders (
+    phone TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    PRIMARY KEY (phone, folder)
+);
+'''
+
+
+def normalize_phone(phone):
+    """Normalize a phone number to E.164 format, or None if it has no digits"""
+    if not phone:
+        return None
+    digits = ''.join(filter(str.isdigit, phone))
+    if not digits:
+        return None
+    if len(digits) == 10:
+        return f"+1{digits}"
+    return f"+{digits}"
+
+
+def normalize_folder(folder_path):
+    """Reduce a server or site relative lead folder URL to 'Shared Documents/ProjectLeads/<lead>'"""
+    folder_path = folder_path.strip('/')
+    marker = folder_path.find(PROJECT_LEADS_ROOT)
+    if marker > 0:
+        folder_path = folder_path[marker:]
+    return folder_path
+
+
+class PhoneIndex:
+    """Persistent index from normalized phone number to lead folders"""
+
+    def __init__(self, filename='phone_index.db', max_age=MAX_AGE):
+        self.db = StateDB(filename, SCHEMA)
+        self.max_age = max_age
+        self.lock = threading.Lock()
+
+    def is_built(self):
+        """Whether a full crawl has populated the index"""
+        return self.db.get_meta('built_at') is not None
+
+    def is_stale(self):
+        """Whether the index was never built or its last crawl is older than max_age"""
+        built_at = self.db.get_meta('built_at')
+        if built_at is None:
+            return True
+        age = (datetime.now() - datetime.fromisoformat(built_at)).total_seconds()
+        return self.max_age > 0 and age > self.max_age
+
+    def refresh(self, ctx):
+        """Crawl again if the index is stale; concurrent callers wait for one crawl"""
+        with self.lock:
+            if self.is_stale():
+                self.rebuild(ctx)
+
+    def add(self, phone_numbers, lead_folder):
+        """Record that the given phone numbers appear in a lead folder"""
+        folder = normalize_folder(lead_folder)
+        rows = {(phone, folder) for phone in map(normalize_phone, phone_numbers) if phone}
+        if rows:
+            self.db.executemany(
+                'INSERT OR IGNORE INTO phone_folders (phone, folder) VALUES (?, ?)', rows
+            )
+
+    def add_transcript(self, transcript, lead_folder):
+        """Index the caller and callee of a transcript written to a lead folder"""
+        call_metadata = transcript.get('call_metadata') or {}
+        self.add([call_metadata.get('from'), call_metadata.get('to')], lead_folder)
+
+    def lookup(self, phone_number):
+        """Return the lead folders that have this phone number in their records"""
+        phone = normalize_phone(phone_number)
+        if not phone:
+            return []
+        rows = self.db.query(
+            'SELECT folder FROM phone_folders WHERE phone = ? ORDER BY folder', (phone,)
+        )
+        return [row[0] for row in rows]
+
+    @metrics.timed('phone_index.rebuild')
+    def rebuild(self, ctx, root_folder=PROJECT_LEADS_ROOT):
+        """Populate the index with one full crawl of every lead's Transcripts_JSON folder"""
+        root = ctx.web.get_folder_by_server_relative_url(root_folder)
+        folders = root.folders
+        ctx.load(folders)
+        ctx.execute_query()
+
+        entries = set()
+        for folder in folders:
+            lead_folder = normalize_folder(folder.properties['ServerRelativeUrl'])
+            try:
+                transcripts_folder = ctx.web.get_folder_by_server_relative_url(
+                    f"{folder.properties['ServerRelativeUrl']}/Transcripts_JSON"
+                )
+                files = transcripts_folder.files
+                ctx.load(files)
+                ctx.execute_query()
+
+                for file in files:
+                    if not is_transcript_file(file.properties['Name']):
+                        continue
+                    metadata = read_transcript_metadata(ctx, file.properties['ServerRelativeUrl'])
+                    call_metadata = metadata.get('call_metadata') or {}
+                    for phone in (call_metadata.get('from'), call_metadata.get('to')):
+                        phone = normalize_phone(phone)
+                        if phone:
+                            entries.add((phone, lead_folder))
+
+            except Exception as e:
+                print(f"Error indexing folder {folder.properties['Name']}: {str(e)}")
+                continue
+
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM phone_folders')
+            conn.executemany(
+                'INSERT OR IGNORE INTO phone_folders (phone, folder) VALUES (?, ?)', entries
+            )
+        self.db.set_meta('built_at', datetime.now().isoformat())
+        print(f"Indexed {len(entries)} phone/folder pairs across {len(folders)} lead folders")
+
+
+_phone_index = None
+_phone_index_lock = threading.Lock()
+
+
+def get_phone_index():
+    """Return the process-wide phone index"""
+    global _phone_index
+    with _phone_index_lock:
+        if _phone_index is None:
+            _phone_index = PhoneIndex()
+        return _phone_index
+
+
+if __name__ == "__main__":
+    # Rebuild the index with a full crawl
+    from client_holder import get_sharepoint_context
+    get_phone_index().rebuild(get_sharepoint_context())
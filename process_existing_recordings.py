@@ -1,116 +1,254 @@
-from office365.runtime.auth.client_credential import ClientCredential
-from office365.sharepoint.client_context import ClientContext
 from office365.sharepoint.files.file import File
-from office365.sharepoint.folders.folder import Folder
-import whisper
+from client_holder import get_sharepoint_context
+from model_registry import DEFAULT_MODEL
+from transcription import transcribe_audio
 import json
-import tempfile
 import os
 from datetime import datetime
 from dotenv import load_dotenv
-import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from phone_index import get_phone_index, normalize_phone, normalize_folder
+from sharepoint_io import (
+    download_spooled, ensure_folders, queue_item_fields, read_spooled, retry_missing_folder, upload_file, upload_content
+)
+from call_fields import call_field_values, call_metadata_from_item, find_call_files, lead_folder_of, METADATA_LOOKUP
+from lead_manifest import get_lead_manifest
+from transcript_format import (
+    dumps_transcript, read_transcript, read_transcript_metadata, transcript_extension, is_transcript_file,
+    transcript_stem
+)
+import metrics
 
 # Load environment variables
 load_dotenv()
 
+# Lead folders scanned, and recordings copied, at the same time during a backfill
+BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', '4'))
+
 class ExistingRecordingProcessor:
-    def __init__(self):
-        # Initialize SharePoint context
-        self.sharepoint_site = os.getenv('SHAREPOINT_SITE_URL')
-        self.client_id = os.getenv('SHAREPOINT_CLIENT_ID')
-        self.client_secret = os.getenv('SHAREPOINT_CLIENT_SECRET')
-        self.ctx = ClientContext(self.sharepoint_site).with_credentials(
-            ClientCredential(self.client_id, self.client_secret)
-        )
-        
-        # Initialize Whisper model for transcription
-        self.transcription_model = whisper.load_model("base")
+    def __init__(self, copy_mode=None):
+        # Whisper model is loaded on first use and shared across processors
+        self.model_name = DEFAULT_MODEL
         
         # Root folder for all project leads
         self.root_folder = "Shared Documents/ProjectLeads"
         
+        # 'server' copies recordings inside SharePoint and reuses existing transcripts,
+        # 'download' downloads, transcribes and re-uploads every recording
+        self.copy_mode = copy_mode or os.getenv('RECORDING_COPY_MODE', 'server')
+        self.transcript_listings = {}
+        
+    @property
+    def ctx(self):
+        """SharePoint context for the calling thread, sharing the process-wide cached token"""
+        return get_sharepoint_context()
+
+    @metrics.timed('existing.search_recordings_by_phone')
     def search_recordings_by_phone(self, phone_number, target_lead_folder):
         """
         Search for recordings containing the phone number across all leads
         and copy them to the new lead's folder if found
         """
+        return self.backfill([(phone_number, target_lead_folder)]).get(target_lead_folder, [])
+
+    @metrics.timed('existing.backfill')
+    def backfill(self, leads):
+        """Copy existing recordings for many (phone_number, target_lead_folder) pairs with one crawl
+
+        Every lead folder is listed once and each recording's caller and callee
+        are looked up among all the new leads' numbers at once, so the cost
+        of a backfill stays that of a single crawl however many leads it
+        covers. Returns the recordings copied, keyed by target folder.
+        """
+        targets = {}
+        for phone_number, target_lead_folder in leads:
+            phone = normalize_phone(phone_number)
+            if phone and target_lead_folder not in targets.setdefault(phone, []):
+                targets[phone].append(target_lead_folder)
+        results = {target_lead_folder: [] for _, target_lead_folder in leads}
+        if not targets:
+            return results
+
+        print(f"Searching for recordings of {len(targets)} phone numbers")
+        matches = self.find_matching_recordings(targets)
+        
+        # Leads may not have their folders yet when they are backfilled first
+        try:
+            ensure_folders(self.ctx, [
+                f"{target_lead_folder}/{subfolder}"
+                for target_lead_folder in dict.fromkeys(target for _, _, target in matches)
+                for subfolder in ('Sources/RingCentral', 'Transcripts_JSON')
+            ])
+        except Exception as e:
+            print(f"Error creating lead folders: {str(e)}")
+            metrics.stage_error('existing.backfill')
+
+        # Copies run in parallel; each worker thread has its own SharePoint context
+        with ThreadPoolExecutor(max_workers=BACKFILL_WORKERS) as pool:
+            copies = [
+                (target_lead_folder, pool.submit(self.process_matching_recording, file, metadata, target_lead_folder))
+                for file, metadata, target_lead_folder in matches
+            ]
+            for target_lead_folder, copy in copies:
+                recording_info = copy.result()
+                if recording_info:
+                    results[target_lead_folder].append(recording_info)
+
+        print(f"Found {len(matches)} matching recordings for {len(leads)} leads")
+        return results
+
+    @metrics.timed('existing.find_matching_recordings')
+    def find_matching_recordings(self, targets):
+        """Find every lead's recordings of the target numbers; returns (file, metadata, target folder) per match
+
+        targets maps normalized phone numbers to the lead folders that want
+        their recordings. With METADATA_LOOKUP=list the library's call
+        columns are queried, with METADATA_LOOKUP=manifest the local lead
+        manifest; otherwise every lead folder is crawled once.
+        """
+        if METADATA_LOOKUP in ('list', 'manifest'):
+            return self.query_matching_recordings(targets)
+        
         try:
-            # Format phone number for search (remove special characters)
-            search_number = ''.join(filter(str.isdigit, phone_number))
-            if len(search_number) == 10:  # Add +1 prefix if 10 digits
-                search_patterns = [f"+1{search_number}", search_number]
-            else:
-                search_patterns = [f"+{search_number}", search_number]
-                
-            print(f"Searching for recordings with phone numbers: {search_patterns}")
-            
             # Get all lead folders
             root = self.ctx.web.get_folder_by_server_relative_url(self.root_folder)
             lead_folders = root.folders
             self.ctx.load(lead_folders)
             self.ctx.execute_query()
+        except Exception as e:
+            print(f"Error searching recordings: {str(e)}")
+            metrics.stage_error('existing.find_matching_recordings')
+            return []
+
+        lead_folder_urls = [lead_folder.properties['ServerRelativeUrl'] for lead_folder in lead_folders]
+        matches = []
+        with ThreadPoolExecutor(max_workers=BACKFILL_WORKERS) as pool:
+            for folder_matches in pool.map(lambda url: self.scan_lead_folder(url, targets), lead_folder_urls):
+                matches.extend(folder_matches)
+        return matches
+
+    def query_matching_recordings(self, targets):
+        """Match recordings through the call columns, without reading any file"""
+        matches = []
+        try:
+            if METADATA_LOOKUP == 'manifest':
+                manifest = get_lead_manifest()
+                manifest.sync(self.ctx)
+                items = manifest.find_call_files(list(targets))
+            else:
+                items = find_call_files(self.ctx, list(targets))
+            
+            for item in items:
+                if not item.get('FileLeafRef', '').endswith('.mp3'):
+                    continue
+                metadata = call_metadata_from_item(item)
+                phones = {normalize_phone(metadata.get('from')), normalize_phone(metadata.get('to'))}
+                wanted_by = self.targets_for(phones, lead_folder_of(item['FileDirRef']), targets)
+                if wanted_by:
+                    file = self.ctx.web.get_file_by_server_relative_url(item['FileRef'])
+                    file.set_property('Name', item['FileLeafRef'], False)
+                    file.set_property('ServerRelativeUrl', item['FileRef'], False)
+                    matches.extend((file, metadata, target_lead_folder) for target_lead_folder in wanted_by)
+        
+        except Exception as e:
+            print(f"Error querying recordings: {str(e)}")
+            metrics.stage_error('existing.find_matching_recordings')
+        
+        return matches
+
+    @staticmethod
+    def targets_for(phones, lead_folder_url, targets):
+        """Target folders wanting a recording with these numbers that sits in lead_folder_url"""
+        wanted_by = []
+        for phone in phones:
+            for target_lead_folder in targets.get(phone, ()):
+                # A lead's own recordings are not copied back into it
+                if (target_lead_folder not in wanted_by
+                        and normalize_folder(target_lead_folder) != normalize_folder(lead_folder_url)):
+                    wanted_by.append(target_lead_folder)
+        return wanted_by
+
+    def scan_lead_folder(self, lead_folder_url, targets):
+        """Match the recordings in one lead's Sources/RingCentral folder against the target numbers
+
+        A recording's numbers come from its metadata sidecar when there is one,
+        else from the lead's transcript of the same recording id (see
+        transcript_metadata_by_recording). Recordings with neither are skipped.
+        """
+        matches = []
+        try:
+            ctx = self.ctx
+            rc_folder = ctx.web.get_folder_by_server_relative_url(f"{lead_folder_url}/Sources/RingCentral")
+            files = rc_folder.files
+            ctx.load(files)
+            ctx.execute_query()
+            names = {file.properties['Name'] for file in files}
+            by_recording = None
             
-            recordings_found = []
-            
-            # Search through each lead folder
-            for lead_folder in lead_folders:
-                try:
-                    # Check RingCentral folder
-                    rc_folder_path = f"{lead_folder.properties['ServerRelativeUrl']}/Sources/RingCentral"
-                    rc_folder = self.ctx.web.get_folder_by_server_relative_url(rc_folder_path)
-                    files = rc_folder.files
-                    self.ctx.load(files)
-                    self.ctx.execute_query()
-                    
-                    # Search through recordings and their metadata
-                    for file in files:
-                        if file.properties['Name'].endswith('.mp3'):
-                            # Try to find matching metadata file
-                            metadata_path = f"{file.properties['ServerRelativeUrl']}.json"
-                            try:
-                                metadata_content = File.open_binary(self.ctx, metadata_path)
-                                metadata = json.loads(metadata_content.decode('utf-8'))
-                                
-                                # Check if phone number matches
-                                phone_matches = any(
-                                    pattern in metadata.get('from', '') or pattern in metadata.get('to', '')
-                                    for pattern in search_patterns
-                                )
-                                
-                                if phone_matches:
-                                    recording_info = self.process_matching_recording(
-                                        file, metadata, target_lead_folder
-                                    )
-                                    if recording_info:
-                                        recordings_found.append(recording_info)
-                                        
-                            except Exception as e:
-                                print(f"Error processing metadata for {file.properties['Name']}: {str(e)}")
-                                # If no metadata file, try to extract date from filename
-                                filename = file.properties['Name']
-                                if any(pattern in filename for pattern in search_patterns):
-                                    recording_info = self.process_matching_recording(
-                                        file, None, target_lead_folder
-                                    )
-                                    if recording_info:
-                                        recordings_found.append(recording_info)
-                    
-                except Exception as e:
-                    print(f"Error accessing folder {lead_folder.properties['Name']}: {str(e)}")
+            for file in files:
+                filename = file.properties['Name']
+                if not filename.endswith('.mp3'):
+                    continue
+                
+                metadata = None
+                if f"{filename}.json" in names:
+                    try:
+                        metadata_content = File.open_binary(ctx, f"{file.properties['ServerRelativeUrl']}.json")
+                        metadata = json.loads(metadata_content.content.decode('utf-8'))
+                    except Exception as e:
+                        print(f"Error processing metadata for {filename}: {str(e)}")
+                if not metadata:
+                    if by_recording is None:
+                        by_recording = self.transcript_metadata_by_recording(lead_folder_url)
+                    # Recordings are named ..._<recording id>.mp3
+                    metadata = by_recording.get(os.path.splitext(filename)[0].rsplit('_', 1)[-1])
+                if not metadata:
                     continue
+                
+                phones = {normalize_phone(metadata.get('from')), normalize_phone(metadata.get('to'))}
+                wanted_by = self.targets_for(phones, lead_folder_url, targets)
+                matches.extend((file, metadata, target_lead_folder) for target_lead_folder in wanted_by)
             
-            print(f"Found {len(recordings_found)} matching recordings")
-            return recordings_found
+        except Exception as e:
+            print(f"Error accessing folder {lead_folder_url}: {str(e)}")
+            metrics.stage_error('existing.find_matching_recordings')
+        
+        return matches
+
+    def transcript_metadata_by_recording(self, lead_folder_url):
+        """Call metadata of a lead's transcripts keyed by recording id, read from their headers only"""
+        ctx = self.ctx
+        transcripts_folder = f"{lead_folder_url}/Transcripts_JSON"
+        by_recording = {}
+        try:
+            files = ctx.web.get_folder_by_server_relative_url(transcripts_folder).files
+            ctx.load(files)
+            ctx.execute_query()
+            names = [f.properties['Name'] for f in files if is_transcript_file(f.properties['Name'])]
+            # find_source_transcript looks in the same listing
+            self.transcript_listings[transcripts_folder] = names
             
+            for name in names:
+                data = read_transcript_metadata(ctx, f"{transcripts_folder}/{name}")
+                call_metadata = dict(data.get('call_metadata') or {})
+                if data.get('recording_id'):
+                    call_metadata.setdefault('recording_id', data['recording_id'])
+                if call_metadata.get('recording_id'):
+                    by_recording[str(call_metadata['recording_id'])] = call_metadata
+        
         except Exception as e:
-            print(f"Error searching recordings: {str(e)}")
-            return []
+            print(f"Error reading transcripts in {transcripts_folder}: {str(e)}")
+            metrics.stage_error('existing.find_matching_recordings')
+        
+        return by_recording
             
+    @metrics.timed('existing.process_matching_recording')
     def process_matching_recording(self, file, existing_metadata, target_lead_folder):
         """Process a matching recording: copy to new location and generate transcript"""
+        audio = None
         try:
-            # Download the recording
-            file_content = File.open_binary(self.ctx, file.properties['ServerRelativeUrl'])
+            source_url = file.properties['ServerRelativeUrl']
             
             # Generate new filename with timestamp
             original_filename = file.properties['Name']
@@ -131,38 +269,73 @@ class ExistingRecordingProcessor:
             transcripts_folder = f"{target_lead_folder}/Transcripts_JSON"
             recording_path = f"{recordings_folder}/{new_filename}"
             
-            # Save recording temporarily for transcription
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
-                temp_file.write(file_content)
-                temp_path = temp_file.name
+            source_transcript = None
+            if self.copy_mode == 'server':
+                # Copy the recording inside SharePoint, without moving audio bytes through this host
+                source = self.ctx.web.get_file_by_server_relative_url(source_url)
+                with metrics.timed('existing.copy_recording'):
+                    retry_missing_folder(
+                        self.ctx, recordings_folder,
+                        lambda: source.copyto(recordings_folder, overwrite=True, file_name=new_filename).execute_query()
+                    )
+                print(f"Recording copied to: {recording_path}")
+                
+                # Reuse the source lead's transcript of this recording when there is one
+                source_transcript = self.find_source_transcript(file, existing_metadata)
             
-            # Transcribe the audio
-            print(f"Transcribing {new_filename}...")
-            transcript_result = self.transcription_model.transcribe(temp_path)
+            if source_transcript:
+                print(f"Reusing transcript from {source_transcript['location']}")
+                transcript_result = source_transcript['data']['transcript']
+                call_metadata = existing_metadata or source_transcript['data'].get('call_metadata') or {}
+            else:
+                # Spool the recording (memory, then disk past AUDIO_SPOOL_MB) and transcribe it from there
+                with metrics.timed('existing.download_recording'):
+                    audio = download_spooled(self.ctx, source_url)
+                print(f"Transcribing {new_filename}...")
+                with metrics.timed('existing.transcribe'):
+                    transcript_result = transcribe_audio(read_spooled(audio), self.model_name)
+                call_metadata = existing_metadata if existing_metadata else {}
             
-            # Clean up temporary file
-            os.unlink(temp_path)
+            # The recording id, for the RecordingId column: from the metadata, the
+            # source transcript, or the file name, which ends in _<recording id>
+            recording_id = call_metadata.get('recording_id')
+            if not recording_id and source_transcript:
+                recording_id = source_transcript['data'].get('recording_id')
+            stem = os.path.splitext(original_filename)[0]
+            if not recording_id and stem.rsplit('_', 1)[-1].isdigit():
+                recording_id = stem.rsplit('_', 1)[-1]
             
             # Prepare transcript data
             transcript_data = {
+                "recording_id": recording_id,
                 "original_file": original_filename,
-                "original_location": file.properties['ServerRelativeUrl'],
-                "call_metadata": existing_metadata if existing_metadata else {},
+                "original_location": source_url,
+                "call_metadata": call_metadata,
                 "transcript": {
                     "text": transcript_result["text"],
                     "segments": transcript_result["segments"],
                     "language": transcript_result["language"]
                 }
             }
+            if source_transcript:
+                transcript_data["original_transcript"] = source_transcript['location']
             
-            # Upload recording to new location
-            File.save_content(self.ctx, recording_path, file_content)
-            print(f"Recording copied to: {recording_path}")
+            # The recording and transcript carry the call's columns so lookups can query them
+            fields = call_field_values(call_metadata, recording_id)
+            if self.copy_mode != 'server':
+                # Upload recording to new location
+                upload_file(self.ctx, recording_path, audio, fields=fields, ensure_folder=True)
+                print(f"Recording copied to: {recording_path}")
+            elif fields:
+                queue_item_fields(self.ctx, recording_path, fields)
+                self.ctx.execute_query()
             
             # Save transcript
-            transcript_filename = f"transcript_{timestamp}_{os.path.splitext(new_filename)[0]}.json"
+            transcript_filename = f"transcript_{timestamp}_{os.path.splitext(new_filename)[0]}{transcript_extension()}"
             transcript_path = f"{transcripts_folder}/{transcript_filename}"
-            File.save_content(self.ctx, transcript_path, json.dumps(transcript_data, indent=2))
+            upload_content(self.ctx, transcript_path, dumps_transcript(transcript_data), fields=fields, ensure_folder=True)
+            get_phone_index().add_transcript(transcript_data, target_lead_folder)
+            metrics.record_transcript_saved('existing', call_metadata)
             print(f"Transcript saved to: {transcript_path}")
             
             return {
@@ -180,7 +353,54 @@ class ExistingRecordingProcessor:
             
         except Exception as e:
             print(f"Error processing recording {file.properties['Name']}: {str(e)}")
+            metrics.stage_error('existing.process_matching_recording')
             return None
+        finally:
+            if audio is not None:
+                audio.close()
+
+    @metrics.timed('existing.find_source_transcript')
+    def find_source_transcript(self, file, existing_metadata):
+        """Find the transcript the source lead already has for a recording
+
+        Transcripts are named after the recording id (process_recording) or
+        after the recording's file name (process_matching_recording). The
+        recording id comes from the metadata sidecar when there is one, else
+        from the file name, which process_recording ends in _<recording id>.
+        """
+        source_url = file.properties['ServerRelativeUrl']
+        lead_folder = source_url.rsplit('/Sources/RingCentral/', 1)[0]
+        transcripts_folder = f"{lead_folder}/Transcripts_JSON"
+        
+        try:
+            if transcripts_folder not in self.transcript_listings:
+                files = self.ctx.web.get_folder_by_server_relative_url(transcripts_folder).files
+                self.ctx.load(files)
+                self.ctx.execute_query()
+                self.transcript_listings[transcripts_folder] = [
+                    f.properties['Name'] for f in files if is_transcript_file(f.properties['Name'])
+                ]
+            
+            stem = os.path.splitext(file.properties['Name'])[0]
+            markers = [f"_{stem}"]
+            recording_id = (existing_metadata or {}).get('recording_id')
+            if not recording_id and stem.rsplit('_', 1)[-1].isdigit():
+                recording_id = stem.rsplit('_', 1)[-1]
+            if recording_id:
+                markers.append(f"_{recording_id}")
+            
+            for name in self.transcript_listings[transcripts_folder]:
+                if any(transcript_stem(name).endswith(marker) for marker in markers):
+                    location = f"{transcripts_folder}/{name}"
+                    data = read_transcript(self.ctx, location)
+                    if (data.get('transcript') or {}).get('text') is not None:
+                        return {'location': location, 'data': data}
+            
+        except Exception as e:
+            print(f"Error looking up transcript for {file.properties['Name']}: {str(e)}")
+            metrics.stage_error('existing.find_source_transcript')
+        
+        return None
 
 def process_existing_lead_recordings(phone_number, lead_folder_path):
     """Main function to process existing recordings for a new lead"""
@@ -188,8 +408,22 @@ def process_existing_lead_recordings(phone_number, lead_folder_path):
     recordings = processor.search_recordings_by_phone(phone_number, lead_folder_path)
     return recordings
 
+def backfill_existing_recordings(leads):
+    """Process existing recordings for many leads, given as (phone_number, lead_folder_path) pairs, in one crawl"""
+    processor = ExistingRecordingProcessor()
+    return processor.backfill(leads)
+
 if __name__ == "__main__":
-    # Example usage
-    test_phone = "+1234567890"
-    test_folder = "/sites/YourSite/Shared Documents/ProjectLeads/Smith_123MainSt"
-    recordings = process_existing_lead_recordings(test_phone, test_folder) 
\ No newline at end of file
+    if len(sys.argv) > 1:
+        # Backfill: python process_existing_recordings.py leads.json, where the
+        # file holds [{"phone_number": ..., "folder_path": ...}, ...]
+        with open(sys.argv[1]) as leads_file:
+            leads = [(lead['phone_number'], lead['folder_path']) for lead in json.load(leads_file)]
+        results = backfill_existing_recordings(leads)
+        for folder_path, recordings in results.items():
+            print(f"{folder_path}: {len(recordings)} recordings")
+    else:
+        # Example usage
+        test_phone = "+1234567890"
+        test_folder = "/sites/YourSite/Shared Documents/ProjectLeads/Smith_123MainSt"
+        recordings = process_existing_lead_recordings(test_phone, test_folder) 
\ No newline at end of file
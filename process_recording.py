@@ -1,197 +1,259 @@
-from ringcentral import SDK
 import os
-import json
-import requests
-from datetime import datetime, timedelta
+from datetime import datetime
 from dotenv import load_dotenv
-import time
-from office365.runtime.auth.client_credential import ClientCredential
-from office365.sharepoint.client_context import ClientContext
-from office365.sharepoint.files.file import File
-import whisper
-import tempfile
+from client_holder import get_client, get_sharepoint_context
+from model_registry import DEFAULT_MODEL
+from phone_index import get_phone_index
+from call_log_sync import CallLogSync
+from retry_scheduler import get_scheduler, backoff_delay, NotReady
+from sharepoint_io import spool_stream, spooled_size, read_spooled, upload_file, upload_content
+from transcript_format import dumps_transcript, transcript_extension
+from recording_pipeline import Pipeline, Stage
+from call_fields import call_field_values
+from transcription import transcribe_audio, get_transcription_pool, TRANSCRIBE_WORKERS, TRANSCRIBE_CHUNK_SECONDS
+import metrics
 
 # Load environment variables
 load_dotenv()
 
 class CallRecordingProcessor:
-    def __init__(self):
-        self.rcsdk = SDK(
-            os.getenv('RC_CLIENT_ID'),
-            os.getenv('RC_CLIENT_SECRET'),
-            os.getenv('RC_SERVER_URL', 'https://platform.ringcentral.com')
-        )
-        self.platform = self.rcsdk.platform()
+    def __init__(self, pipeline_workers=None):
+        # Shared RingCentral client with pooled connections and rate limiting
+        self.platform = get_client()
         
-        # Set the access token
-        self.access_token = 'SUFENDFQMTRQQVMwMHxBQUM1QlEzd1QxTDdfTEVmWENUNkRkanM1bjJPRE96cFFJQjRWNWc3SXA0S21Gb1p0UGRzc3ZjTXNiaFlLVlJVTEJST2J5YWIxd2JjTXpWNDZTdG5qNENabGZRNUNWSk5Mblk4NnhXSDRIZU1JLXJZRURGWmRQQ3Z0NHZxbkpCN0JaRUpYdDhobmlHdEEwNl96a0l3dHYwaUh6WGs5NlNFWGpGd1RiRUJPWEFDeEcyUjZCcF9XNTk0ZWlmTlBuYVBfN01ES3VZbk1qSUZnSTBfeVFDLURDbTZKMjc1UHd8SnY0T19BfDFUVzJnOEdjXzE3TGp6U0hTMHA1ZVF8QVF8QUF8QUFBQUFPLVlmWkE'
-        self.platform.auth().set_data({
-            'access_token': self.access_token,
-            'token_type': 'bearer',
-            'expires_in': 3600,
-            'scope': 'ReadContacts SubscriptionWebSocket ReadAccounts RingSense ReadCallLog ReadCallRecording SubscriptionWebhook Analytics WebSocket'
-        })
+        # Local mirror of the account call log
+        self.call_log = CallLogSync(self.platform)
         
-        # Initialize SharePoint context
-        self.sharepoint_site = os.getenv('SHAREPOINT_SITE_URL')
-        self.client_id = os.getenv('SHAREPOINT_CLIENT_ID')
-        self.client_secret = os.getenv('SHAREPOINT_CLIENT_SECRET')
-        self.ctx = ClientContext(self.sharepoint_site).with_credentials(
-            ClientCredential(self.client_id, self.client_secret)
-        )
+        # Whisper model is loaded on first use and shared across processors
+        self.model_name = DEFAULT_MODEL
         
-        # Initialize Whisper model for transcription
-        self.transcription_model = whisper.load_model("base")
+        # Worker counts and queue size for the download/transcribe/upload pipeline
+        self.pipeline_workers = {
+            'metadata': int(os.getenv('PIPELINE_METADATA_WORKERS', '4')),
+            'download': int(os.getenv('PIPELINE_DOWNLOAD_WORKERS', '4')),
+            'transcribe': TRANSCRIBE_WORKERS,
+            'upload': int(os.getenv('PIPELINE_UPLOAD_WORKERS', '4'))
+        }
+        if pipeline_workers:
+            self.pipeline_workers.update(pipeline_workers)
+        self.pipeline_queue_size = int(os.getenv('PIPELINE_QUEUE_SIZE', '4'))
 
+    @metrics.timed('recordings.search_recordings_by_phone')
     def search_recordings_by_phone(self, phone_number, lead_folder_path):
         """Search for call recordings by phone number and save to SharePoint"""
         try:
             # Format phone number to E.164 format if needed
             formatted_phone = self.format_phone_number(phone_number)
             
-            # Get call log records with recordings for this phone number
-            response = self.platform.get('/restapi/v1.0/account/~/call-log', {
-                'type': 'Voice',
-                'withRecording': True,
-                'phoneNumber': formatted_phone,
-                'view': 'Detailed',
-                'dateFrom': (datetime.now() - timedelta(days=30)).isoformat() + 'Z'  # Last 30 days
-            })
-            
-            # Parse the response
-            data = response.json()
-            if isinstance(data, dict):
-                calls = data.get('records', [])
-            else:
-                calls = []
+            # Answer from the locally synced call log, pulling new records first
+            self.call_log.sync()
+            calls = self.call_log.calls_for_phone(formatted_phone, with_recording=True)
                 
             print(f"Found {len(calls)} calls with recordings for phone number {phone_number}")
             
-            recordings_found = []
+            jobs = []
             for call in calls:
                 if isinstance(call, dict) and call.get('recording'):
-                    recording = call['recording']
-                    recording_id = recording.get('id')
+                    recording_id = call['recording'].get('id')
                     if recording_id:
-                        print(f"Processing recording ID: {recording_id}")
-                        
-                        # Get recording metadata
-                        recording_response = self.platform.get(f'/restapi/v1.0/account/~/recording/{recording_id}')
-                        recording_data = recording_response.json()
-                        
-                        # Download and upload if available
-                        if recording_data.get('status') == 'Available':
-                            content_uri = recording_data.get('contentUri')
-                            if content_uri:
-                                recording_info = self.process_recording(
-                                    content_uri, 
-                                    recording_id, 
-                                    recording_data,
-                                    lead_folder_path,
-                                    call
-                                )
-                                if recording_info:
-                                    recordings_found.append(recording_info)
-                            else:
-                                print(f"No content URI found for recording {recording_id}")
-                        else:
-                            status = recording_data.get('status', 'Unknown')
-                            print(f"Recording {recording_id} not yet available. Status: {status}")
+                        jobs.append({
+                            'recording_id': recording_id,
+                            'call': call,
+                            'lead_folder_path': lead_folder_path,
+                            'model_name': self.model_name
+                        })
+            
+            if not jobs:
+                return []
+            
+            # Metadata, download and upload overlap on threads while
+            # transcription runs on the shared process pool. With chunking,
+            # transcribe threads split each recording and fan its chunks out
+            # to the pool themselves, so one long call uses every worker.
+            pipeline = Pipeline([
+                Stage('metadata', self.check_recording, self.pipeline_workers['metadata']),
+                Stage('download', self.download_recording, self.pipeline_workers['download'],
+                      on_error=self.discard_download),
+                Stage('transcribe', self.transcribe_recording, self.pipeline_workers['transcribe'],
+                      on_error=self.discard_download),
+                Stage('upload', self.upload_recording, self.pipeline_workers['upload'],
+                      on_error=self.discard_download)
+            ], queue_size=self.pipeline_queue_size)
             
-            return recordings_found
+            return pipeline.run(jobs)
 
         except Exception as e:
             print(f"Error searching recordings by phone: {str(e)}")
+            metrics.stage_error('recordings.search_recordings_by_phone')
             return []
 
+    @metrics.timed('recordings.process_recording')
     def process_recording(self, content_uri, recording_id, recording_data, lead_folder_path, call_data):
         """Download recording, transcribe, and upload to SharePoint"""
+        job = {
+            'recording_id': recording_id,
+            'call': call_data,
+            'lead_folder_path': lead_folder_path,
+            'model_name': self.model_name,
+            'recording_data': recording_data,
+            'content_uri': content_uri
+        }
         try:
-            # Get recording content
-            response = requests.get(
-                content_uri,
-                headers={'Authorization': f'Bearer {self.access_token}'},
-                stream=True
-            )
-            
-            if response.status_code == 200:
-                # Generate filename with call details
-                call_date = datetime.fromisoformat(call_data.get('startTime', '').replace('Z', '+00:00'))
-                date_str = call_date.strftime('%Y%m%d_%H%M%S')
-                direction = call_data.get('direction', 'Unknown')
-                duration = call_data.get('duration', 0)
-                filename = f"call_{date_str}_{direction}_{duration}sec_{recording_id}.mp3"
-                
-                # Define folder paths
-                recordings_folder = f"{lead_folder_path}/Sources/RingCentral"
-                transcripts_folder = f"{lead_folder_path}/Transcripts_JSON"
-                
-                try:
-                    # Save recording temporarily for transcription
-                    with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
-                        temp_file.write(response.content)
-                        temp_path = temp_file.name
-                    
-                    # Transcribe the audio
-                    print("Transcribing audio...")
-                    transcript_result = self.transcription_model.transcribe(temp_path)
-                    
-                    # Clean up temporary file
-                    os.unlink(temp_path)
-                    
-                    # Prepare transcript data
-                    transcript_data = {
-                        "recording_id": recording_id,
-                        "call_metadata": {
-                            "direction": direction,
-                            "duration": duration,
-                            "start_time": call_data.get('startTime'),
-                            "end_time": call_data.get('endTime'),
-                            "from": call_data.get('from', {}).get('phoneNumber'),
-                            "to": call_data.get('to', {}).get('phoneNumber')
-                        },
-                        "transcript": {
-                            "text": transcript_result["text"],
-                            "segments": transcript_result["segments"],
-                            "language": transcript_result["language"]
-                        }
-                    }
-                    
-                    # Upload recording to SharePoint
-                    recording_path = f"{recordings_folder}/{filename}"
-                    File.save_content(self.ctx, recording_path, response.content)
-                    print(f"Recording uploaded to SharePoint: {recording_path}")
-                    
-                    # Upload transcript to SharePoint
-                    transcript_filename = f"transcript_{date_str}_{recording_id}.json"
-                    transcript_path = f"{transcripts_folder}/{transcript_filename}"
-                    File.save_content(self.ctx, transcript_path, json.dumps(transcript_data, indent=2))
-                    print(f"Transcript uploaded to SharePoint: {transcript_path}")
-                    
-                    return {
-                        "recording": {
-                            "filename": filename,
-                            "path": recording_path
-                        },
-                        "transcript": {
-                            "filename": transcript_filename,
-                            "path": transcript_path
-                        },
-                        "metadata": transcript_data
-                    }
-                    
-                except Exception as e:
-                    print(f"Error processing and uploading files: {str(e)}")
-                    return None
-                
-            else:
-                print(f"Failed to download recording {recording_id}. Status code: {response.status_code}")
+            if not self.download_recording(job):
                 return None
+            return self.upload_recording(transcribe_job(job))
 
         except Exception as e:
             print(f"Error processing recording: {str(e)}")
+            metrics.stage_error('recordings.process_recording')
+            self.discard_download(job)
             return None
 
+    def check_recording(self, job):
+        """Pipeline stage: keep recordings that are available and schedule a retry for the rest"""
+        try:
+            return self.fetch_recording_metadata(job)
+        except NotReady as e:
+            print(f"{str(e)}. Scheduling a retry")
+            get_scheduler().schedule(
+                'lead_recording',
+                {key: job[key] for key in ('recording_id', 'call', 'lead_folder_path')},
+                delay=backoff_delay(0),
+                key=f"lead:{job['recording_id']}:{job['lead_folder_path']}"
+            )
+            return None
+
+    def fetch_recording_metadata(self, job):
+        """Look up a recording's metadata, raising NotReady until it can be downloaded"""
+        recording_id = job['recording_id']
+        print(f"Processing recording ID: {recording_id}")
+        
+        recording_response = self.platform.get(f'/restapi/v1.0/account/~/recording/{recording_id}')
+        recording_data = recording_response.json()
+        
+        if recording_data.get('status') != 'Available':
+            status = recording_data.get('status', 'Unknown')
+            raise NotReady(f"Recording {recording_id} not yet available. Status: {status}")
+        
+        content_uri = recording_data.get('contentUri')
+        if not content_uri:
+            raise NotReady(f"No content URI found for recording {recording_id}")
+        
+        job['recording_data'] = recording_data
+        job['content_uri'] = content_uri
+        return job
+
+    def download_recording(self, job):
+        """Pipeline stage: stream a recording's audio into a spooled file (memory up to AUDIO_SPOOL_MB, then disk)"""
+        with self.platform.stream(job['content_uri']) as response:
+            if response.status_code != 200:
+                print(f"Failed to download recording {job['recording_id']}. Status code: {response.status_code}")
+                return None
+            
+            job['audio'] = spool_stream(response)
+        metrics.record_transfer('ringcentral', 'down', spooled_size(job['audio']))
+        return job
+
+    def transcribe_recording(self, job):
+        """Pipeline stage: transcribe a downloaded recording on the shared process pool
+
+        Only the audio goes to the worker and only the transcript comes back,
+        instead of the whole job both ways; the audio is read out of its
+        spooled file just for this call. With chunking, this thread runs
+        transcribe_audio itself, which fans the chunks out to the pool.
+        """
+        if TRANSCRIBE_CHUNK_SECONDS:
+            return transcribe_job(job)
+        pool = get_transcription_pool(self.pipeline_workers['transcribe'], job['model_name'])
+        job['transcript'] = pool.submit(transcribe_audio, read_spooled(job['audio']), job['model_name']).result()
+        return job
+
+    def upload_recording(self, job):
+        """Pipeline stage: upload a transcribed recording and its transcript to the lead folder"""
+        try:
+            recording_id = job['recording_id']
+            call_data = job['call']
+            lead_folder_path = job['lead_folder_path']
+            transcript_result = job['transcript']
+            ctx = self.ctx
+            
+            # Generate filename with call details
+            call_date = datetime.fromisoformat(call_data.get('startTime', '').replace('Z', '+00:00'))
+            date_str = call_date.strftime('%Y%m%d_%H%M%S')
+            direction = call_data.get('direction', 'Unknown')
+            duration = call_data.get('duration', 0)
+            filename = f"call_{date_str}_{direction}_{duration}sec_{recording_id}.mp3"
+            
+            # Define folder paths
+            recordings_folder = f"{lead_folder_path}/Sources/RingCentral"
+            transcripts_folder = f"{lead_folder_path}/Transcripts_JSON"
+            
+            # Prepare transcript data
+            transcript_data = {
+                "recording_id": recording_id,
+                "call_metadata": {
+                    "direction": direction,
+                    "duration": duration,
+                    "start_time": call_data.get('startTime'),
+                    "end_time": call_data.get('endTime'),
+                    "from": call_data.get('from', {}).get('phoneNumber'),
+                    "to": call_data.get('to', {}).get('phoneNumber')
+                },
+                "transcript": {
+                    "text": transcript_result["text"],
+                    "segments": transcript_result["segments"],
+                    "language": transcript_result["language"]
+                }
+            }
+            
+            # Both files carry the call's columns so lookups can query them
+            fields = call_field_values(transcript_data['call_metadata'], recording_id)
+            
+            # Upload recording to SharePoint
+            recording_path = f"{recordings_folder}/{filename}"
+            upload_file(ctx, recording_path, job['audio'], fields=fields)
+            print(f"Recording uploaded to SharePoint: {recording_path}")
+            
+            # Upload transcript to SharePoint
+            transcript_filename = f"transcript_{date_str}_{recording_id}{transcript_extension()}"
+            transcript_path = f"{transcripts_folder}/{transcript_filename}"
+            upload_content(ctx, transcript_path, dumps_transcript(transcript_data), fields=fields)
+            get_phone_index().add_transcript(transcript_data, lead_folder_path)
+            metrics.record_transcript_saved('recording', transcript_data['call_metadata'])
+            print(f"Transcript uploaded to SharePoint: {transcript_path}")
+            
+            return {
+                "recording": {
+                    "filename": filename,
+                    "path": recording_path
+                },
+                "transcript": {
+                    "filename": transcript_filename,
+                    "path": transcript_path
+                },
+                "metadata": transcript_data
+            }
+            
+        except Exception as e:
+            print(f"Error processing and uploading files: {str(e)}")
+            metrics.stage_error('recordings.upload_recording')
+            return None
+            
+        finally:
+            self.discard_download(job)
+
+    @staticmethod
+    def discard_download(job):
+        """Close a job's spooled audio, removing it from memory or disk, as soon as it is no longer needed"""
+        audio = job.pop('audio', None)
+        if audio is not None:
+            audio.close()
+
+    @property
+    def ctx(self):
+        """SharePoint context for the calling thread, sharing the process-wide cached token"""
+        return get_sharepoint_context()
+
     @staticmethod
     def format_phone_number(phone):
         """Format phone number to E.164 format"""
@@ -207,6 +269,26 @@ class CallRecordingProcessor:
         # Otherwise return as is with + prefix
         return f"+{digits}"
 
+def transcribe_job(job):
+    """Transcribe a downloaded recording in the calling thread"""
+    job['transcript'] = transcribe_audio(read_spooled(job['audio']), job['model_name'])
+    return job
+
+def retry_lead_recording(payload):
+    """Retry handler for recordings that were not available when their lead was processed"""
+    processor = CallRecordingProcessor()
+    job = dict(payload, model_name=processor.model_name)
+    processor.fetch_recording_metadata(job)
+    recording_info = processor.process_recording(
+        job['content_uri'],
+        job['recording_id'],
+        job['recording_data'],
+        job['lead_folder_path'],
+        job['call']
+    )
+    if not recording_info:
+        raise RuntimeError(f"Failed to process recording {job['recording_id']}")
+
 def process_lead_recordings(phone_number, lead_folder_path):
     """Main function to process recordings for a new lead"""
     processor = CallRecordingProcessor()
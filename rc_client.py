@@ -0,0 +1,202 @@
+import os
+import re
+import time
+import base64
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+import metrics
+
+# Load environment variables
+load_dotenv()
+
+TOKEN_PATH = '/restapi/oauth/token'
+
+# Documented defaults per rate-limit group (requests, window seconds); replaced
+# by the X-Rate-Limit-* headers as soon as RingCentral reports them
+DEFAULT_LIMITS = {
+    'Heavy': (10, 60),
+    'Medium': (40, 60),
+    'Light': (50, 60),
+    'Auth': (5, 60)
+}
+
+MAX_ATTEMPTS = int(os.getenv('RC_MAX_ATTEMPTS', '5'))
+REQUEST_TIMEOUT = int(os.getenv('RC_REQUEST_TIMEOUT', '60'))
+POOL_SIZE = int(os.getenv('RC_POOL_SIZE', '20'))
+
+
+class TokenBucket:
+    """Request budget for one rate-limit group; callers wait for a token before sending"""
+
+    def __init__(self, limit, window):
+        self.capacity = float(limit)
+        self.rate = limit / float(window)
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Take one token, waiting until the group has budget again"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def update(self, limit, remaining, window):
+        """Align the bucket with the limits RingCentral reported on a response"""
+        with self.lock:
+            self.refill(time.monotonic())
+            self.capacity = float(limit)
+            self.rate = limit / float(window)
+            self.tokens = min(self.tokens, float(remaining))
+
+    def pause(self, seconds):
+        """Stop handing out tokens for a while after a 429"""
+        with self.lock:
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def endpoint_template(method, url):
+    """Collapse ids in a URL so every call to the same endpoint shares one key"""
+    path = url.split('?', 1)[0]
+    path = re.sub(r'^https?://[^/]+', '', path)
+    return method + ' ' + re.sub(r'/[^/]*\d{3}[^/]*', '/{id}', path)
+
+
+def guess_group(method, url):
+    """Rate-limit group for an endpoint RingCentral has not reported on yet"""
+    if TOKEN_PATH in url:
+        return 'Auth'
+    if '/call-log' in url or '/content' in url or 'media.' in url:
+        return 'Heavy'
+    if method == 'GET':
+        return 'Light'
+    return 'Medium'
+
+
+class RingCentralClient:
+    """RingCentral REST client with a pooled keep-alive session and per-group rate limiting
+
+    Every request first takes a token from its group's bucket (Heavy, Medium,
+    Light or Auth), so bursts are spread out before RingCentral rejects them.
+    Buckets follow the X-Rate-Limit-* headers of each response, and a 429
+    pauses the group for Retry-After seconds before the request is retried.
+    """
+
+    def __init__(self, server_url=None, client_id=None, client_secret=None, token_provider=None):
+        self.server_url = (server_url or os.getenv('RC_SERVER_URL', 'https://platform.ringcentral.com')).rstrip('/')
+        self.client_id = client_id or os.getenv('RC_CLIENT_ID')
+        self.client_secret = client_secret or os.getenv('RC_CLIENT_SECRET')
+        self.token_provider = token_provider or (lambda: os.getenv('RC_ACCESS_TOKEN'))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.buckets = {group: TokenBucket(*limits) for group, limits in DEFAULT_LIMITS.items()}
+        self.endpoint_groups = {}
+        self.lock = threading.Lock()
+
+    def exchange_jwt(self, assertion):
+        """Exchange a JWT credential for an access token; returns the token response"""
+        basic_auth = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
+        response = self.request('POST', TOKEN_PATH, data={
+            'grant_type': 'urn:ietf:params:oauth:grant-type:jwt-bearer',
+            'assertion': assertion
+        }, headers={'Authorization': f"Basic {basic_auth}"}, authenticate=False)
+        return response.json()
+
+    def group_for(self, method, url):
+        return self.endpoint_groups.get(endpoint_template(method, url)) or guess_group(method, url)
+
+    def observe(self, method, url, response):
+        """Learn the endpoint's group and remaining budget from the rate-limit headers"""
+        group = response.headers.get('X-Rate-Limit-Group')
+        if not group:
+            return
+        self.endpoint_groups[endpoint_template(method, url)] = group
+        bucket = self.buckets.get(group)
+        if bucket is None:
+            bucket = self.buckets.setdefault(group, TokenBucket(*DEFAULT_LIMITS['Light']))
+        try:
+            bucket.update(
+                int(response.headers['X-Rate-Limit-Limit']),
+                int(response.headers['X-Rate-Limit-Remaining']),
+                int(response.headers['X-Rate-Limit-Window'])
+            )
+        except (KeyError, ValueError):
+            pass
+
+    def request(self, method, url, params=None, json=None, data=None, headers=None,
+                stream=False, authenticate=True, raise_for_status=True):
+        """Send a request once its group has budget, retrying after 429s"""
+        if not url.startswith('http'):
+            url = self.server_url + url
+
+        headers = dict(headers or {})
+        if authenticate:
+            headers['Authorization'] = f"Bearer {self.token_provider()}"
+
+        for attempt in range(MAX_ATTEMPTS):
+            group = self.group_for(method, url)
+            self.buckets[group].acquire()
+
+            started = time.perf_counter()
+            response = self.session.request(
+                method, url, params=params, json=json, data=data, headers=headers,
+                stream=stream, timeout=REQUEST_TIMEOUT
+            )
+            metrics.observe('api_request_duration_seconds', time.perf_counter() - started,
+                            service='ringcentral', group=group)
+            metrics.inc('api_requests_total', service='ringcentral', group=group, status=response.status_code)
+            if not stream:
+                metrics.record_transfer('ringcentral', 'down', len(response.content))
+            self.observe(method, url, response)
+
+            if response.status_code != 429 or attempt == MAX_ATTEMPTS - 1:
+                break
+
+            group = self.group_for(method, url)
+            retry_after = int(response.headers.get('Retry-After') or response.headers.get('X-Rate-Limit-Window') or 60)
+            print(f"Rate limited on {group} group, waiting {retry_after}s")
+            metrics.inc('api_retries_total', service='ringcentral', group=group)
+            self.buckets[group].pause(retry_after)
+            response.close()
+
+        if response.status_code == 401 and authenticate and not os.getenv('RC_JWT_TOKEN'):
+            response.close()
+            raise requests.HTTPError(
+                "RingCentral rejected RC_ACCESS_TOKEN (401 Unauthorized). A pre-issued access token is not "
+                "renewed and has probably expired; issue a new one, or set RC_JWT_TOKEN so tokens are renewed "
+                "automatically",
+                response=response
+            )
+        if raise_for_status:
+            response.raise_for_status()
+        return response
+
+    def get(self, url, query_params=None):
+        """GET a JSON endpoint; call .json() on the result for a dict"""
+        return self.request('GET', url, params=query_params)
+
+    def post(self, url, body=None, query_params=None):
+        return self.request('POST', url, params=query_params, json=body)
+
+    def stream(self, url):
+        """Open a streamed GET (e.g. recording content); the caller checks status_code"""
+        return self.request('GET', url, stream=True, raise_for_status=False)
+
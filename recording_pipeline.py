@@ -0,0 +1,93 @@
+import queue
+import threading
+import metrics
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+class Stage:
+    """One pipeline stage: a function run by a number of worker threads
+
+    The function receives an item and returns the item for the next stage,
+    or None to drop it. CPU-bound stages pass an executor (e.g. a process
+    pool) and a picklable function; each worker thread then hands its item
+    to the executor and waits for the result. on_error is called with the
+    item when the function raises, so stages can release its resources.
+    Every run is timed as the "pipeline.<name>" stage.
+    """
+
+    def __init__(self, name, func, workers=1, executor=None, on_error=None):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.executor = executor
+        self.on_error = on_error
+        self.metric_stage = f"pipeline.{name}"
+
+    def run(self, item):
+        with metrics.timed(self.metric_stage):
+            if self.executor is not None:
+                return self.executor.submit(self.func, item).result()
+            return self.func(item)
+
+
+class Pipeline:
+    """Runs items through stages connected by bounded queues"""
+
+    def __init__(self, stages, queue_size=4):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items):
+        """Process every item and return the outputs of the last stage in input order"""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = []
+        results_lock = threading.Lock()
+
+        def worker(index, stage):
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            while True:
+                entry = inbox.get()
+                if entry is _DONE:
+                    return
+                position, item = entry
+                try:
+                    output = stage.run(item)
+                except Exception as e:
+                    print(f"Error in {stage.name} stage: {str(e)}")
+                    metrics.stage_error(f"pipeline.{stage.name}")
+                    if stage.on_error is not None:
+                        stage.on_error(item)
+                    continue
+                if output is None:
+                    continue
+                if outbox is not None:
+                    outbox.put((position, output))
+                else:
+                    with results_lock:
+                        results.append((position, output))
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            stage_threads = [
+                threading.Thread(target=worker, args=(index, stage), name=f"{stage.name}-{n}", daemon=True)
+                for n in range(stage.workers)
+            ]
+            for thread in stage_threads:
+                thread.start()
+            threads.append(stage_threads)
+
+        # Feeding blocks whenever the first queue is full
+        for position, item in enumerate(items):
+            queues[0].put((position, item))
+
+        # Shut stages down in order so nothing is left in flight
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                queues[index].put(_DONE)
+            for thread in threads[index]:
+                thread.join()
+
+        return [output for _, output in sorted(results, key=lambda result: result[0])]
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import random
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from local_state import StateDB
+import metrics
+
+# Backoff between attempts: base * 2^attempt, capped, with jitter
+RETRY_BASE_SECONDS = float(os.getenv('RETRY_BASE_SECONDS', '30'))
+RETRY_MAX_SECONDS = float(os.getenv('RETRY_MAX_SECONDS', '3600'))
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '10'))
+
+# Jobs left 'running' longer than this are assumed lost (e.g. the worker died)
+RUNNING_TIMEOUT_SECONDS = int(os.getenv('RETRY_RUNNING_TIMEOUT_SECONDS', '1800'))
+
+# Job kinds and the 'module:function' that handles them; resolved lazily so
+# the modules that schedule jobs can import this one without a cycle
+JOB_HANDLERS = {
+    'webhook_recording': 'webhook_handler:retry_webhook_recording',
+    'lead_recording': 'process_recording:retry_lead_recording'
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    job_key TEXT UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    due_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_due ON jobs (status, due_at);
+'''
+
+
+class NotReady(Exception):
+    """Raised by a job handler when its work cannot be done yet (e.g. recording not Available)"""
+
+
+class PartialFailure(Exception):
+    """Raised by a job handler that did part of its work; payload_updates record that part for the retry"""
+
+    def __init__(self, message, payload_updates):
+        super().__init__(message)
+        self.payload_updates = payload_updates
+
+
+def backoff_delay(attempt, base=RETRY_BASE_SECONDS, cap=RETRY_MAX_SECONDS):
+    """Exponential backoff with jitter: half the delay is fixed, the other half random"""
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def resolve_handler(kind):
+    module_name, function_name = JOB_HANDLERS[kind].split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class RetryScheduler:
+    """Persistent delayed-job queue; jobs are retried with backoff until their handler succeeds
+
+    Nothing sleeps inline: a handler that is not ready raises NotReady and
+    the job is rescheduled, while run_forever only waits for the next due
+    time between batches.
+    """
+
+    def __init__(self, filename='retry_jobs.db', max_attempts=RETRY_MAX_ATTEMPTS):
+        self.db = StateDB(filename, SCHEMA)
+        self.max_attempts = max_attempts
+
+    def schedule(self, kind, payload, delay=0, key=None):
+        """Queue a job; a job with the same key that is still pending or running is kept as is"""
+        now = time.time()
+        if key is not None:
+            self.db.execute(
+                "DELETE FROM jobs WHERE job_key = ? AND status IN ('done', 'failed')", (key,)
+            )
+        return self.db.execute(
+            'INSERT OR IGNORE INTO jobs (kind, job_key, payload, due_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+            (kind, key, json.dumps(payload), now + delay, now)
+        ) > 0
+
+    def coalesce(self, kind, payload, key, delay, merge):
+        """Queue a keyed job to run after delay, or fold payload into the job already queued under key
+
+        merge(queued_payload, payload) returns the combined payload. A
+        pending job takes it on its next attempt without moving its due time.
+        A running job has already read its payload, so it is marked 'rerun'
+        and runs once more with the merged payload even if this attempt
+        succeeds. A job that already succeeded is left alone and one that
+        failed for good starts over. Returns 'queued', 'merged' or 'done'.
+        """
+        now = time.time()
+        with self.db.transaction() as conn:
+            row = conn.execute('SELECT id, status, payload FROM jobs WHERE job_key = ?', (key,)).fetchone()
+            if row is not None:
+                job_id, status, queued_payload = row
+                if status == 'done':
+                    return 'done'
+                if status in ('pending', 'running', 'rerun'):
+                    conn.execute(
+                        "UPDATE jobs SET payload = ?, status = CASE WHEN status = 'running' THEN 'rerun' "
+                        "ELSE status END WHERE id = ?",
+                        (json.dumps(merge(json.loads(queued_payload), payload)), job_id)
+                    )
+                    return 'merged'
+                conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+            conn.execute(
+                'INSERT INTO jobs (kind, job_key, payload, due_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (kind, key, json.dumps(payload), now + delay, now)
+            )
+            return 'queued'
+
+    def claim_due(self, limit=10, key=None):
+        """Mark up to limit due jobs (optionally only the one with this key) as running and return them"""
+        now = time.time()
+
+        # Requeue jobs whose worker disappeared
+        self.db.execute(
+            "UPDATE jobs SET status = 'pending', updated_at = ? WHERE status IN ('running', 'rerun') "
+            "AND updated_at < ?",
+            (now, now - RUNNING_TIMEOUT_SECONDS)
+        )
+
+        sql = "SELECT id, kind, job_key, payload, attempts FROM jobs WHERE status = 'pending' AND due_at <= ?"
+        params = [now]
+        if key is not None:
+            sql += " AND job_key = ?"
+            params.append(key)
+        rows = self.db.query(sql + " ORDER BY due_at LIMIT ?", params + [limit])
+        claimed = []
+        for job_id, kind, job_key, payload, attempts in rows:
+            # Another process may have claimed the same job in the meantime
+            if self.db.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'pending'",
+                (now, job_id)
+            ):
+                claimed.append({
+                    'id': job_id, 'kind': kind, 'key': job_key, 'payload': json.loads(payload), 'attempts': attempts
+                })
+        return claimed
+
+    def run_job(self, job):
+        """Run one claimed job and record its outcome"""
+        now = time.time()
+        try:
+            # A handler may return payload updates, kept for a rerun like those of a PartialFailure
+            with metrics.timed(f"retry.{job['kind']}"):
+                payload_updates = resolve_handler(job['kind'])(job['payload'])
+            if self.db.execute(
+                "UPDATE jobs SET status = 'done', attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                (now, job['id'])
+            ):
+                return True
+
+            # Payload merged in while this attempt ran: run again with it
+            self.update_payload(job['id'], payload_updates)
+            self.db.execute(
+                "UPDATE jobs SET status = 'pending', due_at = ?, updated_at = ? WHERE id = ? AND status = 'rerun'",
+                (now, now, job['id'])
+            )
+            if job['key'] is not None:
+                self.run_due(key=job['key'])
+            return True
+
+        except Exception as e:
+            if isinstance(e, PartialFailure):
+                self.update_payload(job['id'], e.payload_updates)
+            attempts = job['attempts'] + 1
+            if attempts >= self.max_attempts:
+                print(f"Giving up on {job['kind']} job {job['id']} after {attempts} attempts: {str(e)}")
+                self.db.execute(
+                    "UPDATE jobs SET status = 'failed', attempts = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                    (attempts, str(e), now, job['id'])
+                )
+            else:
+                delay = backoff_delay(attempts - 1)
+                print(f"Retrying {job['kind']} job {job['id']} in {delay:.0f}s: {str(e)}")
+                self.db.execute(
+                    "UPDATE jobs SET status = 'pending', attempts = ?, last_error = ?, due_at = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (attempts, str(e), now + delay, now, job['id'])
+                )
+            return False
+
+    def update_payload(self, job_id, updates):
+        """Set keys of a job's stored payload, keeping anything merged into it since it was claimed"""
+        if not updates:
+            return
+        with self.db.transaction() as conn:
+            row = conn.execute('SELECT payload FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is not None:
+                payload = dict(json.loads(row[0]), **updates)
+                conn.execute('UPDATE jobs SET payload = ? WHERE id = ?', (json.dumps(payload), job_id))
+
+    def run_due(self, limit=10, key=None):
+        """Run the jobs that are due now in the calling thread; returns how many ran"""
+        jobs = self.claim_due(limit, key)
+        for job in jobs:
+            self.run_job(job)
+        return len(jobs)
+
+    def seconds_until_next(self, default=60):
+        rows = self.db.query("SELECT MIN(due_at) FROM jobs WHERE status = 'pending'")
+        if not rows or rows[0][0] is None:
+            return default
+        return max(0, rows[0][0] - time.time())
+
+    def run_forever(self, workers=4, stop_event=None, poll_seconds=60):
+        """Dispatch due jobs to a pool of workers until stop_event is set"""
+        stop_event = stop_event or threading.Event()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while not stop_event.is_set():
+                jobs = self.claim_due(limit=workers)
+                if jobs:
+                    list(pool.map(self.run_job, jobs))
+                    continue
+                stop_event.wait(min(poll_seconds, self.seconds_until_next(poll_seconds)))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide retry scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RetryScheduler()
+        return _scheduler
+
+
+if __name__ == "__main__":
+    # Run scheduled retries until interrupted
+    get_scheduler().run_forever(workers=int(os.getenv('RETRY_WORKERS', '4')))
@@ -0,0 +1,105 @@
+import os
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from retry_scheduler import get_scheduler
+import metrics
+
+# Load environment variables
+load_dotenv()
+
+# Seconds a completed session is held before processing, so the rest of its
+# notifications fold into the same job; 0 processes it on the first one
+COALESCE_SECONDS = float(os.getenv('WEBHOOK_COALESCE_SECONDS', '15'))
+
+# Sessions remembered in memory; older ones are deduped by the job table alone
+MEMORY_SESSIONS = int(os.getenv('WEBHOOK_COALESCE_SESSIONS', '10000'))
+
+
+def merge_phone_numbers(queued, payload):
+    """Payload of a queued recording job with another event's phone numbers added"""
+    phone_numbers = set(queued.get('phone_numbers') or []) | set(payload.get('phone_numbers') or [])
+    return dict(queued, phone_numbers=sorted(phone_numbers))
+
+
+class SessionCoalescer:
+    """Turns the several notifications RingCentral sends per call into one recording job
+
+    Each telephony session is remembered in memory with the phone numbers of
+    all its parties so far. When a party disconnects, one webhook_recording
+    job is queued in the retry scheduler under webhook:<sessionId>, due
+    after the hold window. Later events for the session only merge numbers
+    it has not seen into that job, and events bringing nothing new are
+    dropped without touching the database. The job row outlives the process,
+    so a session that was processed is not processed again after a restart.
+    """
+
+    def __init__(self, scheduler=None, window=COALESCE_SECONDS, max_sessions=MEMORY_SESSIONS):
+        self.scheduler = scheduler or get_scheduler()
+        self.window = window
+        self.max_sessions = max_sessions
+        self.lock = threading.Lock()
+        # sessionId -> {'phones': set of numbers, 'queued': bool}, least recently seen first
+        self.sessions = OrderedDict()
+
+    def add_event(self, session_id, phone_numbers, completed):
+        """Record one notification; returns 'held', 'duplicate', 'queued', 'merged' or 'done'"""
+        with self.lock:
+            session = self.sessions.pop(session_id, None) or {'phones': set(), 'queued': False}
+            self.sessions[session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+            new_phones = set(phone_numbers) - session['phones']
+            session['phones'] |= new_phones
+            if not (completed or session['queued']):
+                # Call still in progress: only its numbers are kept for now
+                outcome = 'held'
+            elif session['queued'] and not new_phones:
+                outcome = 'duplicate'
+            else:
+                outcome = None
+                session['queued'] = True
+                phones = sorted(session['phones'])
+
+        key = f"webhook:{session_id}"
+        if outcome is None:
+            outcome = self.scheduler.coalesce(
+                'webhook_recording',
+                {'session_id': session_id, 'phone_numbers': phones},
+                key=key,
+                delay=self.window,
+                merge=merge_phone_numbers
+            )
+            if outcome == 'queued':
+                self.run_after_window(key)
+
+        metrics.inc('webhook_session_events_total', outcome=outcome)
+        return outcome
+
+    def run_after_window(self, key):
+        """Run the session's first attempt in this process once the window ends
+
+        run_forever would pick the job up as well; whichever claims it first
+        runs it.
+        """
+        if self.window <= 0:
+            self.scheduler.run_due(key=key)
+            return
+        # A moment past the window, so the job is due when the timer fires
+        timer = threading.Timer(self.window + 1, self.scheduler.run_due, kwargs={'key': key})
+        timer.daemon = True
+        timer.start()
+
+
+_session_coalescer = None
+_session_coalescer_lock = threading.Lock()
+
+
+def get_session_coalescer():
+    """Return the process-wide session coalescer"""
+    global _session_coalescer
+    with _session_coalescer_lock:
+        if _session_coalescer is None:
+            _session_coalescer = SessionCoalescer()
+        return _session_coalescer
@@ -80,7 +80,8 @@ def setup_webhook():
         
         # Generate tokens - use a simpler format for validation token
         validation_token = generate_verification_token()  # Use same format for both tokens
-        verification_token = generate_verification_token()
+        # Reuse the verification token webhook_server.py checks, if one is configured
+        verification_token = os.getenv('RC_WEBHOOK_VERIFICATION_TOKEN') or generate_verification_token()
         print(f"Generated validation token: {validation_token}")
         print(f"Generated verification token: {verification_token}")
         
@@ -129,6 +130,8 @@ def setup_webhook():
         if resp.status_code == 200:
             print("Webhook setup successful!")
             print("Response:", resp.json())
+            if not os.getenv('RC_WEBHOOK_VERIFICATION_TOKEN'):
+                print(f"Set RC_WEBHOOK_VERIFICATION_TOKEN={verification_token} for webhook_server.py")
         else:
             print(f"Error: HTTP {resp.status_code} {resp.text}")
         
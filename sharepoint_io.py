@@ -0,0 +1,280 @@
+import os
+import uuid
+import tempfile
+import threading
+from urllib.parse import quote
+from office365.runtime.client_request_exception import ClientRequestException
+from office365.runtime.http.request_options import RequestOptions
+from local_state import StateDB
+import metrics
+
+MB = 1024 * 1024
+
+# Chunk sizes keep memory per transfer constant regardless of recording length
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_MB', '1')) * MB
+UPLOAD_CHUNK_SIZE = int(os.getenv('SHAREPOINT_UPLOAD_CHUNK_MB', '10')) * MB
+
+# Files above this size go through an upload session (a single add is limited to 4 MB)
+LARGE_FILE_THRESHOLD = int(os.getenv('SHAREPOINT_LARGE_FILE_MB', '4')) * MB
+
+# Downloads are held in memory up to this size and spill to a temporary file
+# beyond it, so a queued recording never costs more memory than this
+SPOOL_MAX_SIZE = int(os.getenv('AUDIO_SPOOL_MB', '8')) * MB
+
+FOLDER_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS known_folders (
+    path TEXT PRIMARY KEY
+);
+'''
+
+
+def split_path(file_path):
+    """Split a SharePoint file path into its folder and file name"""
+    folder_path, file_name = file_path.rsplit('/', 1)
+    return folder_path, file_name
+
+
+def spool_stream(response, chunk_size=DOWNLOAD_CHUNK_SIZE, max_size=SPOOL_MAX_SIZE):
+    """Copy a streamed HTTP response chunk by chunk into a spooled file, returned rewound; the caller closes it"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_size)
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            spooled.write(chunk)
+    except Exception:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled
+
+
+def download_spooled(ctx, server_relative_url, chunk_size=DOWNLOAD_CHUNK_SIZE, max_size=SPOOL_MAX_SIZE):
+    """Stream a SharePoint file into a spooled file, returned rewound; the caller closes it"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_size)
+    try:
+        source = ctx.web.get_file_by_server_relative_url(server_relative_url)
+        source.download_session(spooled, chunk_size=chunk_size).execute_query()
+    except Exception:
+        spooled.close()
+        raise
+    metrics.record_transfer('sharepoint', 'down', spooled.tell())
+    spooled.seek(0)
+    return spooled
+
+
+def spooled_size(spooled):
+    """Size in bytes of a file object's content"""
+    spooled.seek(0, os.SEEK_END)
+    size = spooled.tell()
+    spooled.seek(0)
+    return size
+
+
+def read_spooled(spooled):
+    """The whole content of a spooled file, for the moment it is needed in memory (e.g. to decode it)"""
+    spooled.seek(0)
+    return spooled.read()
+
+
+def download_head(ctx, server_relative_url, max_bytes):
+    """Read at most the first max_bytes of a SharePoint file, leaving the rest undownloaded"""
+    # Quotes are doubled inside the OData string literal, and the rest percent-encoded for the URL
+    decoded_url = quote(server_relative_url.replace("'", "''"))
+    request = RequestOptions(
+        f"{ctx.service_root_url()}/web/getFileByServerRelativePath(DecodedUrl='{decoded_url}')/$value"
+    )
+    request.set_header('Range', f"bytes=0-{max_bytes - 1}")
+    request.stream = True
+    response = ctx.pending_request().execute_request_direct(request)
+    try:
+        head = b''
+        for chunk in response.iter_content(chunk_size=max_bytes):
+            head += chunk
+            if len(head) >= max_bytes:
+                break
+        metrics.record_transfer('sharepoint', 'down', len(head))
+        return head[:max_bytes]
+    finally:
+        response.close()
+
+
+def upload_file(ctx, file_path, source, chunk_size=UPLOAD_CHUNK_SIZE, threshold=LARGE_FILE_THRESHOLD,
+                fields=None, ensure_folder=False):
+    """Upload a recording from a binary file object, switching to an upload session above the threshold
+
+    fields, if given, are list-item column values set on the uploaded file.
+    With ensure_folder, a folder that turns out to be gone is created again
+    (see retry_missing_folder).
+    """
+    size = spooled_size(source)
+
+    def upload():
+        source.seek(0)
+        if size > threshold:
+            # Session chunks go one request at a time, so the columns are set
+            # once the session has finished
+            upload_session(ctx, file_path, source, size, chunk_size)
+        else:
+            folder_path, file_name = split_path(file_path)
+            ctx.web.get_folder_by_server_relative_url(folder_path).files.add(file_name, source.read(), True)
+        queue_item_fields(ctx, file_path, fields)
+        ctx.execute_query()
+        return file_path
+
+    return retry_missing_folder(ctx, split_path(file_path)[0], upload) if ensure_folder else upload()
+
+
+def upload_session(ctx, file_path, source, size, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Upload a file object through a StartUpload/ContinueUpload/FinishUpload session, one chunk in memory at a time"""
+    folder_path, file_name = split_path(file_path)
+    folder = ctx.web.get_folder_by_server_relative_url(folder_path)
+    if size < 2:
+        # Too small to split into a start and a finish
+        folder.files.add(file_name, source.read(), True)
+        return
+    folder.files.add(file_name, None, True)
+    ctx.execute_query()
+
+    # A session takes at least a start and a finish, so content of one chunk
+    # or less goes up in two halves
+    chunk_size = max(1, min(chunk_size, (size + 1) // 2))
+    upload_id = str(uuid.uuid4())
+    target = ctx.web.get_file_by_server_relative_url(file_path)
+    offset = 0
+    while offset < size:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if offset == 0:
+            target.start_upload(upload_id, chunk)
+        elif offset + len(chunk) < size:
+            target.continue_upload(upload_id, offset, chunk)
+        else:
+            target.finish_upload(upload_id, offset, chunk)
+        ctx.execute_query()
+        offset += len(chunk)
+
+
+def upload_content(ctx, file_path, content, fields=None, ensure_folder=False):
+    """Upload small in-memory content such as a transcript, overwriting any existing file
+
+    fields, if given, are list-item column values set on the uploaded file.
+    With ensure_folder, a folder that turns out to be gone is created again
+    (see retry_missing_folder).
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    folder_path, file_name = split_path(file_path)
+
+    def upload():
+        folder = ctx.web.get_folder_by_server_relative_url(folder_path)
+        folder.files.add(file_name, content, True)
+        queue_item_fields(ctx, file_path, fields)
+        ctx.execute_query()
+        return file_path
+
+    return retry_missing_folder(ctx, folder_path, upload) if ensure_folder else upload()
+
+
+def queue_item_fields(ctx, file_path, fields):
+    """Queue setting list-item column values on a file, to run with the next execute_query"""
+    if fields:
+        item = ctx.web.get_file_by_server_relative_url(file_path).listItemAllFields
+        item.validate_update_list_item(fields, new_document_update=True)
+
+
+class FolderCache:
+    """Persistent set of SharePoint folders known to exist"""
+
+    def __init__(self, filename='folders.db'):
+        self.db = StateDB(filename, FOLDER_SCHEMA)
+
+    def missing(self, folder_paths):
+        """Return the folders not yet known to exist, keeping their order"""
+        keys = [path.strip('/') for path in folder_paths]
+        if not keys:
+            return []
+        placeholders = ', '.join('?' for _ in keys)
+        known = {row[0] for row in self.db.query(
+            f'SELECT path FROM known_folders WHERE path IN ({placeholders})', keys
+        )}
+        return [path for path in folder_paths if path.strip('/') not in known]
+
+    def add(self, folder_paths):
+        self.db.executemany(
+            'INSERT OR IGNORE INTO known_folders (path) VALUES (?)',
+            [(path.strip('/'),) for path in folder_paths]
+        )
+
+    def discard(self, folder_paths):
+        self.db.executemany(
+            'DELETE FROM known_folders WHERE path = ?',
+            [(path.strip('/'),) for path in folder_paths]
+        )
+
+
+_folder_cache = None
+_folder_cache_lock = threading.Lock()
+
+
+def get_folder_cache():
+    """Return the process-wide folder cache"""
+    global _folder_cache
+    with _folder_cache_lock:
+        if _folder_cache is None:
+            _folder_cache = FolderCache()
+        return _folder_cache
+
+
+def folder_hierarchy(folder_paths):
+    """Expand folder paths into every ancestor below the library root, parents first"""
+    expanded = []
+    for folder_path in folder_paths:
+        names = [name for name in folder_path.split('/') if name]
+        for depth in range(2, len(names) + 1):
+            path = '/'.join(names[:depth])
+            if path not in expanded:
+                expanded.append(path)
+    return expanded
+
+
+def is_not_found(error):
+    """Whether a SharePoint request failed because its file or folder does not exist"""
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code == 404
+
+
+def retry_missing_folder(ctx, folder_path, action):
+    """Run action(); if its folder is gone (deleted or renamed since it was cached), create it again and retry once
+
+    For writes into folders the caller provisions with ensure_folders, whose
+    cache would otherwise keep skipping a folder that no longer exists.
+    """
+    try:
+        return action()
+    except ClientRequestException as e:
+        if not is_not_found(e):
+            raise
+        # Drop what the failed request left queued before running it again
+        ctx.clear()
+        print(f"Folder {folder_path} not found, creating it again")
+        get_folder_cache().discard(folder_hierarchy([folder_path]))
+        ensure_folders(ctx, [folder_path])
+        return action()
+
+
+def ensure_folders(ctx, folder_paths):
+    """Create whichever folders are not known to exist, in a single batched request
+
+    Folders are added parents first; SharePoint runs batch parts in order and
+    adding an existing folder is a no-op, so a partially created tree is fine.
+    """
+    cache = get_folder_cache()
+    missing = cache.missing(folder_hierarchy(folder_paths))
+    if not missing:
+        return folder_paths
+
+    for path in missing:
+        ctx.web.folders.add(path)
+    ctx.execute_batch()
+    cache.add(missing)
+    return folder_paths
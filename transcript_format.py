@@ -0,0 +1,158 @@
+import os
+import gzip
+import json
+import zlib
+from office365.sharepoint.files.file import File
+from sharepoint_io import download_head
+import metrics
+
+# 'json' writes the original indented JSON; 'compact' a metadata header line
+# followed by a minified body with columnar segments; 'compact-gzip' the same
+# gzip-compressed. Compact files are two JSON documents, not one, so they get
+# their own extension and nothing mistakes them for plain JSON
+TRANSCRIPT_FORMAT = os.getenv('TRANSCRIPT_FORMAT', 'json')
+
+COMPACT_MARKER = 'rc-transcript-compact'
+COMPACT_VERSION = 1
+
+# Per-segment Whisper fields not worth storing (token ids are only useful for decoding)
+DROPPED_SEGMENT_FIELDS = ('tokens',)
+
+# Bytes fetched when only the header of a compact transcript is needed
+HEADER_READ_BYTES = 16 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+SEPARATORS = (',', ':')
+
+
+EXTENSIONS = {'json': '.json', 'compact': '.tjson', 'compact-gzip': '.tjson.gz'}
+
+# Every extension a transcript may have, longest first; .json.gz is what
+# compact-gzip files were written as before they had their own extension
+TRANSCRIPT_EXTENSIONS = ('.tjson.gz', '.json.gz', '.tjson', '.json')
+
+
+def transcript_extension(fmt=None):
+    return EXTENSIONS[fmt or TRANSCRIPT_FORMAT]
+
+
+def is_transcript_file(name):
+    return name.endswith(TRANSCRIPT_EXTENSIONS)
+
+
+def transcript_stem(name):
+    """File name without its transcript extension"""
+    for extension in TRANSCRIPT_EXTENSIONS:
+        if name.endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+
+def pack_body(body):
+    """Store a Whisper-style segment list as one list per field"""
+    if not isinstance(body, dict) or not isinstance(body.get('segments'), list):
+        return body
+    segments = body['segments']
+    fields = []
+    for segment in segments:
+        for field in segment:
+            if field not in fields and field not in DROPPED_SEGMENT_FIELDS:
+                fields.append(field)
+    packed = {key: value for key, value in body.items() if key != 'segments'}
+    packed['segment_columns'] = {field: [segment.get(field) for segment in segments] for field in fields}
+    return packed
+
+
+def unpack_body(body):
+    if not isinstance(body, dict) or 'segment_columns' not in body:
+        return body
+    columns = body['segment_columns']
+    unpacked = {key: value for key, value in body.items() if key != 'segment_columns'}
+    count = len(next(iter(columns.values()), []))
+    unpacked['segments'] = [{field: values[i] for field, values in columns.items()} for i in range(count)]
+    return unpacked
+
+
+def dumps_transcript(transcript, fmt=None):
+    """Serialize a transcript dict to the bytes written to SharePoint"""
+    fmt = fmt or TRANSCRIPT_FORMAT
+    if fmt == 'json':
+        return json.dumps(transcript, indent=2).encode('utf-8')
+
+    header = {
+        'format': COMPACT_MARKER,
+        'version': COMPACT_VERSION,
+        'metadata': {key: value for key, value in transcript.items() if key != 'transcript'}
+    }
+    content = (
+        json.dumps(header, separators=SEPARATORS) + '\n' +
+        json.dumps(pack_body(transcript.get('transcript')), separators=SEPARATORS)
+    ).encode('utf-8')
+    if fmt == 'compact-gzip':
+        return gzip.compress(content, mtime=0)
+    return content
+
+
+def parse_header(line):
+    """The header of a compact transcript, or None if this line is not one"""
+    try:
+        header = json.loads(line)
+    except ValueError:
+        return None
+    if isinstance(header, dict) and header.get('format') == COMPACT_MARKER:
+        return header
+    return None
+
+
+def loads_transcript(content):
+    """Load a transcript written in any format"""
+    if content[:2] == GZIP_MAGIC:
+        content = gzip.decompress(content)
+    text = content.decode('utf-8') if isinstance(content, bytes) else content
+
+    first_line, _, rest = text.partition('\n')
+    header = parse_header(first_line)
+    if header is None:
+        return json.loads(text)
+
+    transcript = dict(header['metadata'])
+    transcript['transcript'] = unpack_body(json.loads(rest)) if rest else None
+    return transcript
+
+
+def metadata_from_head(head):
+    """Transcript metadata from the first bytes of a compact file, or None if they do not hold it"""
+    if head[:2] == GZIP_MAGIC:
+        try:
+            head = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(head)
+        except zlib.error:
+            return None
+    line, newline, _ = head.partition(b'\n')
+    if not newline:
+        return None
+    header = parse_header(line.decode('utf-8', errors='replace'))
+    return header['metadata'] if header else None
+
+
+def read_transcript(ctx, server_relative_url):
+    """Download and load a transcript from SharePoint"""
+    content = File.open_binary(ctx, server_relative_url).content
+    metrics.record_transfer('sharepoint', 'down', len(content))
+    return loads_transcript(content)
+
+
+def read_transcript_metadata(ctx, server_relative_url):
+    """Everything but the transcript body; compact files are only read up to their header"""
+    if server_relative_url.endswith('.json'):
+        # Indented JSON has no header, so there is nothing to gain from a ranged read
+        transcript = read_transcript(ctx, server_relative_url)
+    else:
+        head = download_head(ctx, server_relative_url, HEADER_READ_BYTES)
+        metadata = metadata_from_head(head)
+        if metadata is not None:
+            return metadata
+        # A head shorter than asked for is the whole file
+        transcript = loads_transcript(head) if len(head) < HEADER_READ_BYTES \
+            else read_transcript(ctx, server_relative_url)
+    transcript.pop('transcript', None)
+    return transcript
@@ -0,0 +1,172 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from model_registry import get_model, DEFAULT_MODEL
+from transcription_backends import get_backend
+from vad import (
+    SAMPLE_RATE, MEL_FRAMES_PER_SECOND, VAD_ENABLED, VAD_MIN_SAVING, vad_settings, speech_regions, trim_silence,
+    remap_segments, split_points
+)
+from transcription_cache import get_transcription_cache, cache_key, content_hash, file_hash
+
+# Number of worker processes in the shared transcription pool
+TRANSCRIBE_WORKERS = int(os.getenv('TRANSCRIBE_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+
+# Split recordings into chunks of about this many seconds and transcribe
+# them in parallel on the pool; 0 transcribes each recording in one piece
+TRANSCRIBE_CHUNK_SECONDS = int(os.getenv('TRANSCRIBE_CHUNK_SECONDS', '0'))
+
+# (workers, model name) -> pool of workers warmed on that model
+_pools = {}
+_pool_lock = threading.Lock()
+
+# Set in pool workers, which must not submit chunks to a pool of their own
+_in_worker = False
+
+
+def transcribe_audio(audio, model_name=DEFAULT_MODEL, **options):
+    """Transcribe a recording and return its text, segments and language
+
+    audio is the recording's encoded content (e.g. MP3 bytes), decoded in
+    memory without a temporary file, or a path to it.
+
+    Results are cached by audio content, model and options, so audio that
+    was already transcribed (e.g. a recording copied between leads) skips
+    Whisper entirely. With VAD_ENABLED, only the speech regions are given
+    to Whisper and segment times are mapped back to the full recording.
+    Whisper runs on the backend TRANSCRIBE_BACKEND selects.
+    """
+    cache = get_transcription_cache()
+    key_options = dict(options, vad=vad_settings()) if VAD_ENABLED else options
+    audio_hash = content_hash(audio) if isinstance(audio, (bytes, bytearray)) else file_hash(audio)
+    key = cache_key(audio_hash, get_backend().cache_name(model_name), key_options)
+    cached = cache.get(key)
+    if cached is not None:
+        print("Using cached transcript")
+        return cached
+
+    # A path can go to the model as is when nothing needs the samples first
+    if isinstance(audio, (bytes, bytearray)) or VAD_ENABLED or chunking_enabled():
+        audio = get_backend().load_audio(audio)
+    result = transcribe_speech(audio, model_name, **options) if VAD_ENABLED \
+        else transcribe_pcm(audio, model_name, **options)
+    transcript = {
+        "text": result["text"],
+        "segments": result["segments"],
+        "language": result["language"]
+    }
+    cache.put(key, transcript)
+    return transcript
+
+
+def transcribe_speech(audio, model_name=DEFAULT_MODEL, **options):
+    """Run Whisper over the speech regions of decoded 16 kHz audio only"""
+    regions = speech_regions(audio)
+    if len(regions) == 0:
+        return {"text": "", "segments": [], "language": options.get("language")}
+
+    kept = int((regions[:, 1] - regions[:, 0]).sum())
+    if kept > len(audio) * (1 - VAD_MIN_SAVING):
+        return transcribe_pcm(audio, model_name, **options)
+
+    print(f"Transcribing {kept / len(audio):.0%} of the recording after removing silence")
+    result = transcribe_pcm(trim_silence(audio, regions), model_name, **options)
+    remap_segments(result["segments"], regions)
+    return result
+
+
+def chunking_enabled():
+    """Chunks go to the pool from the parent process only, never from inside a worker"""
+    return TRANSCRIBE_CHUNK_SECONDS > 0 and not _in_worker
+
+
+def transcribe_pcm(audio, model_name=DEFAULT_MODEL, **options):
+    """Transcribe decoded audio (or a file path), in parallel chunks when chunking is on"""
+    if chunking_enabled():
+        return transcribe_chunks(audio, model_name, **options)
+    return get_backend().transcribe(get_model(model_name), audio, **options)
+
+
+def transcribe_chunks(audio, model_name=DEFAULT_MODEL, **options):
+    """Split audio at pauses, transcribe the chunks on the pool and stitch the results
+
+    Segment times, seeks and ids are shifted so the result looks like a
+    single transcribe() call over the whole audio. Unless a language is
+    given, it is detected once from the start of the audio so every chunk
+    is decoded in the same language.
+    """
+    pool = get_transcription_pool(model_name=model_name)
+    bounds = [0] + split_points(audio, TRANSCRIBE_CHUNK_SECONDS) + [len(audio)]
+    if len(bounds) > 2 and not options.get('language'):
+        options = dict(options, language=pool.submit(detect_language, audio, model_name).result())
+    if len(bounds) > 2:
+        print(f"Transcribing {len(bounds) - 1} chunks in parallel")
+
+    futures = [
+        pool.submit(transcribe_chunk, audio[start:end], model_name, options)
+        for start, end in zip(bounds, bounds[1:])
+    ]
+
+    text, segments, language = [], [], None
+    for start, future in zip(bounds, futures):
+        result = future.result()
+        offset = start / SAMPLE_RATE
+        language = language or result["language"]
+        text.append(result["text"])
+        for segment in result["segments"]:
+            segment["id"] = len(segments)
+            segment["seek"] = segment.get("seek", 0) + round(offset * MEL_FRAMES_PER_SECOND)
+            segment["start"] = round(segment["start"] + offset, 3)
+            segment["end"] = round(segment["end"] + offset, 3)
+            for word in segment.get("words") or []:
+                word["start"] = round(word["start"] + offset, 3)
+                word["end"] = round(word["end"] + offset, 3)
+            segments.append(segment)
+
+    return {"text": "".join(text), "segments": segments, "language": language}
+
+
+def transcribe_chunk(audio, model_name, options):
+    """Pool task: transcribe one chunk of decoded audio"""
+    result = get_backend().transcribe(get_model(model_name), audio, **options)
+    return {"text": result["text"], "segments": result["segments"], "language": result["language"]}
+
+
+def detect_language(audio, model_name):
+    """Pool task: most likely language of the first 30 seconds of audio"""
+    return get_backend().detect_language(get_model(model_name), audio)
+
+
+def init_worker(model_name):
+    """Pool initializer: mark the process as a worker and load the model"""
+    global _in_worker
+    _in_worker = True
+    get_model(model_name)
+
+
+def get_transcription_pool(workers=TRANSCRIBE_WORKERS, model_name=DEFAULT_MODEL):
+    """Return the process-wide pool of transcription workers for these settings, creating it on first use
+
+    Workers are spawned (torch does not survive fork well) and load the model
+    once at startup, so every task after the first runs on a warm model.
+    Pools are kept per worker count and model, so a caller asking for other
+    settings gets workers warmed on its own model rather than someone else's.
+    A pool that broke (a worker died, or could not load the model) is
+    replaced, so one failure does not fail every later recording.
+    """
+    key = (workers, model_name)
+    with _pool_lock:
+        pool = _pools.get(key)
+        if pool is not None and pool._broken:
+            print(f"Transcription pool broke ({pool._broken}), starting a new one")
+            pool.shutdown(wait=False, cancel_futures=True)
+            pool = None
+        if pool is None:
+            _pools[key] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(model_name,)
+            )
+        return _pools[key]
@@ -0,0 +1,187 @@
+import io
+import os
+import threading
+import subprocess
+import numpy as np
+
+# Models take 16 kHz mono float32 PCM
+SAMPLE_RATE = 16000
+
+# 'whisper' runs the reference PyTorch implementation; 'faster-whisper' runs
+# the same models converted for CTranslate2, int8-quantized on CPU by default
+TRANSCRIBE_BACKEND = os.getenv('TRANSCRIBE_BACKEND', 'whisper')
+
+# CTranslate2 device and weight type: int8 on CPU, float16 or int8_float16 on GPU
+FASTER_WHISPER_DEVICE = os.getenv('FASTER_WHISPER_DEVICE', 'cpu')
+FASTER_WHISPER_COMPUTE_TYPE = os.getenv('FASTER_WHISPER_COMPUTE_TYPE', 'int8')
+
+# Threads per faster-whisper model, 0 letting CTranslate2 decide. Every pool
+# worker holds its own model, so keep workers * threads near the core count
+FASTER_WHISPER_THREADS = int(os.getenv('FASTER_WHISPER_THREADS', '0'))
+
+# Parameter counts of the Whisper models, for sizing models whose weights
+# cannot be inspected from Python
+MODEL_PARAMETERS = {
+    'tiny': 39e6, 'base': 74e6, 'small': 244e6, 'medium': 769e6, 'large': 1550e6, 'turbo': 809e6
+}
+
+BYTES_PER_WEIGHT = {
+    'int8': 1, 'int8_float32': 1, 'int8_float16': 1, 'int8_bfloat16': 1,
+    'int16': 2, 'float16': 2, 'bfloat16': 2, 'float32': 4
+}
+
+# Whisper transcribe() options faster-whisper spells differently, and those it has no use for
+RENAMED_OPTIONS = {'logprob_threshold': 'log_prob_threshold'}
+DROPPED_OPTIONS = ('fp16', 'verbose')
+
+
+def decode_with_ffmpeg(content, sample_rate=SAMPLE_RATE):
+    """Decode encoded audio bytes (e.g. MP3) to mono float32 PCM, piping them through ffmpeg
+
+    The same conversion as whisper.load_audio, without a file on either side:
+    the bytes go to ffmpeg's stdin and the samples come back on its stdout.
+    """
+    process = subprocess.run(
+        ['ffmpeg', '-nostdin', '-loglevel', 'error', '-threads', '0', '-i', 'pipe:0',
+         '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(sample_rate), 'pipe:1'],
+        input=content, capture_output=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Failed to decode audio: {process.stderr.decode('utf-8', 'replace').strip()}")
+    return np.frombuffer(process.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+class WhisperBackend:
+    """openai-whisper, the reference implementation the transcript format follows"""
+
+    name = 'whisper'
+
+    def __init__(self):
+        import whisper
+        self.whisper = whisper
+
+    def cache_name(self, model_name):
+        """Name of a model in cache keys; plain for Whisper so existing cache entries stay valid"""
+        return model_name
+
+    def load_model(self, model_name):
+        return self.whisper.load_model(model_name)
+
+    def model_size(self, model, model_name):
+        """Approximate resident size of a model's weights in bytes"""
+        return sum(p.numel() * p.element_size() for p in model.parameters())
+
+    def load_audio(self, audio):
+        """Decode a recording, given as encoded bytes or a path, to 16 kHz mono float32"""
+        if isinstance(audio, (bytes, bytearray)):
+            return decode_with_ffmpeg(audio)
+        return self.whisper.load_audio(audio)
+
+    def transcribe(self, model, audio, **options):
+        return model.transcribe(audio, **options)
+
+    def detect_language(self, model, audio):
+        """Most likely language of the first 30 seconds of decoded audio"""
+        mel = self.whisper.log_mel_spectrogram(
+            self.whisper.pad_or_trim(audio), model.dims.n_mels
+        ).to(model.device)
+        _, probs = model.detect_language(mel)
+        return max(probs, key=probs.get)
+
+
+class FasterWhisperBackend:
+    """faster-whisper: Whisper models on CTranslate2, int8-quantized for CPU-only hosts
+
+    Results are converted to the shape Whisper's transcribe() returns, so
+    everything downstream (chunk stitching, VAD remapping, the transcript
+    files) is the same whichever backend produced them.
+    """
+
+    name = 'faster-whisper'
+
+    def __init__(self, device=FASTER_WHISPER_DEVICE, compute_type=FASTER_WHISPER_COMPUTE_TYPE,
+                 cpu_threads=FASTER_WHISPER_THREADS):
+        import faster_whisper
+        self.faster_whisper = faster_whisper
+        self.device = device
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+
+    def cache_name(self, model_name):
+        return f"{self.name}/{self.compute_type}/{model_name}"
+
+    def load_model(self, model_name):
+        return self.faster_whisper.WhisperModel(
+            model_name, device=self.device, compute_type=self.compute_type, cpu_threads=self.cpu_threads
+        )
+
+    def model_size(self, model, model_name):
+        """Approximate size of the quantized weights, from the model's parameter count"""
+        parameters = MODEL_PARAMETERS.get(model_name.split('.')[0].split('-')[0], MODEL_PARAMETERS['large'])
+        return int(parameters * BYTES_PER_WEIGHT.get(self.compute_type, 4))
+
+    def load_audio(self, audio):
+        # PyAV reads from a file object as well as from a path
+        if isinstance(audio, (bytes, bytearray)):
+            audio = io.BytesIO(audio)
+        return self.faster_whisper.decode_audio(audio, sampling_rate=SAMPLE_RATE)
+
+    def transcribe(self, model, audio, **options):
+        """Transcribe with Whisper's option names and defaults, returning Whisper's result shape"""
+        options = {
+            RENAMED_OPTIONS.get(name, name): value for name, value in options.items()
+            if name not in DROPPED_OPTIONS
+        }
+        # Whisper's transcribe() decodes greedily unless asked for a beam
+        options.setdefault('beam_size', 1)
+
+        segments, info = model.transcribe(audio, **options)
+        converted = []
+        for segment in segments:
+            converted.append({
+                'id': len(converted),
+                'seek': segment.seek,
+                'start': segment.start,
+                'end': segment.end,
+                'text': segment.text,
+                'tokens': list(segment.tokens),
+                'temperature': segment.temperature,
+                'avg_logprob': segment.avg_logprob,
+                'compression_ratio': segment.compression_ratio,
+                'no_speech_prob': segment.no_speech_prob
+            })
+            if segment.words is not None:
+                converted[-1]['words'] = [
+                    {'word': word.word, 'start': word.start, 'end': word.end, 'probability': word.probability}
+                    for word in segment.words
+                ]
+        return {
+            'text': ''.join(segment['text'] for segment in converted),
+            'segments': converted,
+            'language': info.language
+        }
+
+    def detect_language(self, model, audio):
+        # Language detection runs before transcribe() returns; the segments are decoded lazily and never are here
+        _, info = model.transcribe(audio[:30 * SAMPLE_RATE], beam_size=1)
+        return info.language
+
+
+BACKENDS = {
+    WhisperBackend.name: WhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name=None):
+    """Return the process-wide instance of the named backend, TRANSCRIBE_BACKEND by default"""
+    name = name or TRANSCRIBE_BACKEND
+    with _backends_lock:
+        if name not in _backends:
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown transcription backend {name}; use one of {', '.join(BACKENDS)}")
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from local_state import get_state_dir
+
+# Total size of cached transcripts before the least recently used are evicted
+MAX_CACHE_BYTES = int(os.getenv('TRANSCRIPTION_CACHE_MB', '1024')) * 1024 * 1024
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_hash(content):
+    """SHA-256 of in-memory content, the same as file_hash of a file holding it"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def cache_key(audio_hash, model_name, options=None):
+    """Key a transcript by audio content, model and transcription options"""
+    material = json.dumps([audio_hash, model_name, options or {}], sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class TranscriptionCache:
+    """On-disk cache of transcripts, evicting the least recently used above a size limit
+
+    Entries are plain JSON files written atomically, so several processes
+    (e.g. the transcription pool workers) can share one cache directory.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir or os.path.join(get_state_dir(), 'transcripts')
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Return the cached transcript for a key, or None"""
+        path = self.path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as entry:
+                transcript = json.load(entry)
+            # Mark as recently used
+            os.utime(path)
+            return transcript
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key, transcript):
+        """Store a transcript and evict old entries if the cache is over its limit"""
+        if self.max_bytes <= 0:
+            return
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as entry:
+                json.dump(transcript, entry)
+            os.replace(temp_path, self.path(key))
+        except Exception:
+            os.unlink(temp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        with self.lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.json'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_transcription_cache():
+    """Return the process-wide transcription cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TranscriptionCache()
+        return _cache
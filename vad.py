@@ -0,0 +1,149 @@
+import os
+import numpy as np
+
+# Whisper decodes everything to 16 kHz mono float32
+SAMPLE_RATE = 16000
+
+# Mel frames per second of audio, the unit of Whisper's 'seek'
+MEL_FRAMES_PER_SECOND = 100
+
+# Trim silence before Whisper; off by default, as it changes the transcription cache key
+VAD_ENABLED = os.getenv('VAD_ENABLED', '0') == '1'
+
+# Analysis frame length and the tuning of what counts as speech
+FRAME_MS = 30
+VAD_THRESHOLD_DB = float(os.getenv('VAD_THRESHOLD_DB', '12'))
+VAD_MIN_SPEECH_MS = int(os.getenv('VAD_MIN_SPEECH_MS', '250'))
+VAD_MIN_SILENCE_MS = int(os.getenv('VAD_MIN_SILENCE_MS', '1000'))
+VAD_PADDING_MS = int(os.getenv('VAD_PADDING_MS', '300'))
+
+# Below this share of non-speech, trimming saves too little to be worth it
+VAD_MIN_SAVING = float(os.getenv('VAD_MIN_SAVING', '0.1'))
+
+
+def vad_settings():
+    """Settings that change the trimmed audio; part of the transcription cache key"""
+    return {
+        'threshold_db': VAD_THRESHOLD_DB,
+        'min_speech_ms': VAD_MIN_SPEECH_MS,
+        'min_silence_ms': VAD_MIN_SILENCE_MS,
+        'padding_ms': VAD_PADDING_MS
+    }
+
+
+def runs(mask):
+    """(start, end) index pairs of the True runs in a boolean array"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def speech_regions(audio, sample_rate=SAMPLE_RATE, threshold_db=VAD_THRESHOLD_DB,
+                   min_speech_ms=VAD_MIN_SPEECH_MS, min_silence_ms=VAD_MIN_SILENCE_MS,
+                   padding_ms=VAD_PADDING_MS):
+    """Sample ranges that contain speech, as an (n, 2) array of [start, end)
+
+    A frame is speech when its energy is threshold_db above the recording's
+    noise floor (its 10th percentile frame). Pauses shorter than
+    min_silence_ms are kept, bursts shorter than min_speech_ms dropped, and
+    every region padded so word onsets and endings are not clipped.
+    """
+    frame = sample_rate * FRAME_MS // 1000
+    count = len(audio) // frame
+    if count == 0:
+        return np.array([[0, len(audio)]]) if len(audio) else np.empty((0, 2), dtype=np.int64)
+
+    frames = audio[:count * frame].reshape(count, frame).astype(np.float32)
+    energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    noise_floor = np.percentile(energy_db, 10)
+    # Digital silence would put the floor at -100 dB; never treat near-silent frames as speech
+    speech = energy_db > max(noise_floor + threshold_db, -60.0)
+
+    # Close short pauses inside speech
+    starts, ends = runs(~speech)
+    short = (ends - starts) * FRAME_MS < min_silence_ms
+    inner = (starts > 0) & (ends < count)
+    for start, end in zip(starts[short & inner], ends[short & inner]):
+        speech[start:end] = True
+
+    # Drop blips too short to be words
+    starts, ends = runs(speech)
+    keep = (ends - starts) * FRAME_MS >= min_speech_ms
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    padding = padding_ms * sample_rate // 1000
+    starts = np.maximum(starts * frame - padding, 0)
+    ends = np.minimum(ends * frame + padding, len(audio))
+
+    # Padding can make neighbouring regions overlap; merge them
+    merged_starts, merged_ends = [starts[0]], [ends[0]]
+    for start, end in zip(starts[1:], ends[1:]):
+        if start <= merged_ends[-1]:
+            merged_ends[-1] = max(merged_ends[-1], end)
+        else:
+            merged_starts.append(start)
+            merged_ends.append(end)
+    return np.stack([merged_starts, merged_ends], axis=1).astype(np.int64)
+
+
+def trim_silence(audio, regions):
+    """Concatenate the speech regions into one shorter clip"""
+    return np.concatenate([audio[start:end] for start, end in regions]) if len(regions) else audio[:0]
+
+
+def remap_time(seconds, regions, sample_rate=SAMPLE_RATE, end=False):
+    """Map a time in the trimmed clip back to the original recording
+
+    A time exactly on the join of two regions belongs to the earlier region
+    when it ends something, and to the later one when it starts something.
+    """
+    lengths = regions[:, 1] - regions[:, 0]
+    trimmed_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    sample = seconds * sample_rate
+    index = max(int(np.searchsorted(trimmed_starts, sample, side='left' if end else 'right')) - 1, 0)
+    offset = min(sample - trimmed_starts[index], lengths[index])
+    return round(float(regions[index, 0] + offset) / sample_rate, 3)
+
+
+def remap_segments(segments, regions, sample_rate=SAMPLE_RATE):
+    """Shift Whisper segment (and word) timestamps from the trimmed clip to the original timeline
+
+    A segment's seek moves by as much as its start, as the chunking path
+    shifts it by the chunk's offset.
+    """
+    for segment in segments:
+        start = remap_time(segment['start'], regions, sample_rate)
+        segment['seek'] = segment.get('seek', 0) + round((start - segment['start']) * MEL_FRAMES_PER_SECOND)
+        segment['start'] = start
+        segment['end'] = remap_time(segment['end'], regions, sample_rate, end=True)
+        for word in segment.get('words') or []:
+            word['start'] = remap_time(word['start'], regions, sample_rate)
+            word['end'] = remap_time(word['end'], regions, sample_rate, end=True)
+    return segments
+
+
+def split_points(audio, chunk_seconds, search_seconds=10, sample_rate=SAMPLE_RATE):
+    """Sample offsets that cut audio into chunks of about chunk_seconds at its quietest moments
+
+    Each cut is placed on the lowest-energy frame within search_seconds of
+    its target, so chunks start and end in pauses rather than mid-word.
+    """
+    frame = sample_rate * FRAME_MS // 1000
+    count = len(audio) // frame
+    chunk_frames = chunk_seconds * 1000 // FRAME_MS
+    if count < chunk_frames * 1.5:
+        return []
+
+    frames = audio[:count * frame].reshape(count, frame).astype(np.float32)
+    energy = np.mean(frames * frames, axis=1)
+    search = search_seconds * 1000 // FRAME_MS
+
+    points = []
+    target = chunk_frames
+    while target < count - chunk_frames // 2:
+        low, high = max(target - search, 1), min(target + search, count - 1)
+        cut = low + int(np.argmin(energy[low:high]))
+        points.append(cut * frame)
+        target = cut + chunk_frames
+    return points
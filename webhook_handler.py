@@ -1,44 +1,36 @@
-from ringcentral import SDK
 import os
 import json
-import requests
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from office365.runtime.auth.client_credential import ClientCredential
-from office365.sharepoint.client_context import ClientContext
-from office365.sharepoint.files.file import File
-from office365.sharepoint.folders.folder import Folder
+from client_holder import get_client, get_sharepoint_context
+from phone_index import get_phone_index
+from retry_scheduler import NotReady, PartialFailure
+from session_coalescer import get_session_coalescer
+from sharepoint_io import upload_content
+from transcript_format import dumps_transcript, transcript_extension
+from call_fields import call_field_values, lead_folders_for_phones, METADATA_LOOKUP
+from lead_manifest import get_lead_manifest
+import metrics
 
 # Load environment variables
 load_dotenv()
 
+# Lead folders a transcript is uploaded to at the same time when a call matches several leads
+FANOUT_WORKERS = int(os.getenv('WEBHOOK_FANOUT_WORKERS', '8'))
+
 class WebhookHandler:
     def __init__(self):
-        # Initialize RingCentral SDK
-        self.rcsdk = SDK(
-            os.getenv('RC_CLIENT_ID'),
-            os.getenv('RC_CLIENT_SECRET'),
-            os.getenv('RC_SERVER_URL', 'https://platform.ringcentral.com')
-        )
-        self.platform = self.rcsdk.platform()
-        
-        # Set the access token
-        self.access_token = os.getenv('RC_ACCESS_TOKEN')
-        self.platform.auth().set_data({
-            'access_token': self.access_token,
-            'token_type': 'bearer',
-            'expires_in': 3600,
-            'scope': 'ReadContacts SubscriptionWebSocket ReadAccounts RingSense ReadCallLog ReadCallRecording SubscriptionWebhook Analytics WebSocket'
-        })
-        
-        # Initialize SharePoint context
-        self.sharepoint_site = os.getenv('SHAREPOINT_SITE_URL')
-        self.client_id = os.getenv('SHAREPOINT_CLIENT_ID')
-        self.client_secret = os.getenv('SHAREPOINT_CLIENT_SECRET')
-        self.ctx = ClientContext(self.sharepoint_site).with_credentials(
-            ClientCredential(self.client_id, self.client_secret)
-        )
+        # Shared RingCentral client with pooled connections and rate limiting
+        self.platform = get_client()
 
+    @property
+    def ctx(self):
+        """SharePoint context for the calling thread, sharing the process-wide cached token"""
+        return get_sharepoint_context()
+
+    @metrics.timed('webhook.handle_webhook')
     def handle_webhook(self, webhook_data):
         """Handle incoming webhook data"""
         try:
@@ -56,24 +48,27 @@ class WebhookHandler:
 
         except Exception as e:
             print(f"Error processing webhook data: {str(e)}")
+            metrics.stage_error('webhook.handle_webhook')
 
     def process_call_event(self, call_data):
-        """Process a call event and check for recordings"""
+        """Pass a call event to the session coalescer, which queues one recording job per completed call"""
         try:
-            # Check if call is completed
-            if any(party.get('status', {}).get('code') == 'Disconnected' for party in call_data['parties']):
-                # Get the phone numbers involved in the call
-                phone_numbers = self.extract_phone_numbers(call_data)
-                
-                if phone_numbers:
-                    # Wait for recording and transcript to be ready
-                    session_id = call_data.get('sessionId')
-                    if session_id:
-                        print(f"Call completed (Session ID: {session_id})")
-                        self.process_recording(session_id, phone_numbers)
+            session_id = call_data.get('sessionId')
+            
+            # Get the phone numbers involved in the call
+            phone_numbers = self.extract_phone_numbers(call_data)
+            
+            if session_id and phone_numbers:
+                # Check if call is completed
+                completed = any(
+                    party.get('status', {}).get('code') == 'Disconnected' for party in call_data['parties']
+                )
+                if get_session_coalescer().add_event(session_id, phone_numbers, completed) == 'queued':
+                    print(f"Call completed (Session ID: {session_id})")
 
         except Exception as e:
             print(f"Error processing call event: {str(e)}")
+            metrics.stage_error('webhook.process_call_event')
 
     def extract_phone_numbers(self, call_data):
         """Extract all phone numbers from the call data"""
@@ -88,120 +83,139 @@ class WebhookHandler:
 
         return list(phone_numbers)
 
-    def find_lead_folders(self, phone_number):
-        """Find all lead folders that have this phone number in their records"""
+    @metrics.timed('webhook.find_lead_folders')
+    def find_lead_folders(self, phone_numbers):
+        """Find all lead folders that have any of these phone numbers in their records"""
         try:
-            # Get the ProjectLeads folder
-            root = self.ctx.web.get_folder_by_server_relative_url("Shared Documents/ProjectLeads")
-            folders = root.folders
-            self.ctx.load(folders)
-            self.ctx.execute_query()
+            if METADATA_LOOKUP == 'list':
+                # One filtered query on the library's call columns
+                return lead_folders_for_phones(self.ctx, phone_numbers)
             
-            matching_folders = []
+            if METADATA_LOOKUP == 'manifest':
+                # Local copy of the lead tree, first brought up to date from the change log
+                manifest = get_lead_manifest()
+                manifest.sync(self.ctx)
+                return manifest.lead_folders_for_phones(phone_numbers)
             
-            # Search through each lead folder
-            for folder in folders:
-                try:
-                    # Check if there's a matching record in Transcripts_JSON
-                    transcripts_path = f"{folder.properties['ServerRelativeUrl']}/Transcripts_JSON"
-                    transcripts_folder = self.ctx.web.get_folder_by_server_relative_url(transcripts_path)
-                    files = transcripts_folder.files
-                    self.ctx.load(files)
-                    self.ctx.execute_query()
-                    
-                    # Check each transcript file
-                    for file in files:
-                        if file.properties['Name'].endswith('.json'):
-                            content = File.open_binary(self.ctx, file.properties['ServerRelativeUrl'])
-                            transcript_data = json.loads(content.decode('utf-8'))
-                            
-                            # Check if phone number matches
-                            call_metadata = transcript_data.get('call_metadata', {})
-                            if (phone_number == call_metadata.get('from') or 
-                                phone_number == call_metadata.get('to')):
-                                matching_folders.append(folder.properties['ServerRelativeUrl'])
-                                break
-                    
-                except Exception as e:
-                    print(f"Error checking folder {folder.properties['Name']}: {str(e)}")
-                    continue
+            # Build the phone index with one full crawl the first time it is
+            # needed, and again once it is older than PHONE_INDEX_MAX_AGE
+            phone_index = get_phone_index()
+            phone_index.refresh(self.ctx)
             
-            return matching_folders
+            return sorted({folder for phone in phone_numbers for folder in phone_index.lookup(phone)})
             
         except Exception as e:
             print(f"Error searching for lead folders: {str(e)}")
+            metrics.stage_error('webhook.find_lead_folders')
             return []
 
-    def process_recording(self, session_id, phone_numbers):
-        """Process recording and save to appropriate lead folders"""
+    @metrics.timed('webhook.process_recording')
+    def process_recording(self, session_id, phone_numbers, saved_folders=()):
+        """Process recording and save to appropriate lead folders
+
+        Raises NotReady while the recording is not Available, so the retry
+        scheduler tries again later instead of this call waiting for it.
+        Folders in saved_folders already have the transcript and are skipped.
+        Returns the folders it was saved to and those it could not be saved to.
+        """
+        # Get call recording details
+        recording_response = self.platform.get(f'/restapi/v1.0/account/~/call-recordings/{session_id}')
+        recording_data = recording_response.json()
+        
+        if recording_data.get('status') != 'Available':
+            raise NotReady(f"Recording not yet available for session {session_id}")
+        
+        # Get RingSense transcript
+        transcript_response = self.platform.get(
+            f'/restapi/v1.0/account/~/call-recordings/{session_id}/ringsense'
+        )
+        transcript_data = transcript_response.json()
+        
+        # Find all matching lead folders
+        matching_folders = self.find_lead_folders(phone_numbers)
+        
+        if not matching_folders:
+            print(f"No matching lead folders found for phone numbers: {phone_numbers}")
+            return [], []
+        
+        matching_folders = [folder_path for folder_path in matching_folders if folder_path not in saved_folders]
+        if not matching_folders:
+            return [], []
+        
+        # Build and serialize the transcript once for every matching folder
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        transcript = {
+            'recording_id': session_id,
+            'call_metadata': {
+                'direction': recording_data.get('direction'),
+                'duration': recording_data.get('duration'),
+                'start_time': recording_data.get('startTime'),
+                'end_time': recording_data.get('endTime'),
+                'from': recording_data.get('from', {}).get('phoneNumber'),
+                'to': recording_data.get('to', {}).get('phoneNumber')
+            },
+            'transcript': transcript_data
+        }
+        content = dumps_transcript(transcript)
+        fields = call_field_values(transcript['call_metadata'], recording_data.get('id'))
+        transcript_filename = f"transcript_{timestamp}_{session_id}{transcript_extension()}"
+        
+        # Upload to all folders at once; each worker thread has its own SharePoint context
+        saved = list(get_fanout_pool().map(
+            lambda folder_path: self.save_transcript(folder_path, transcript_filename, content, fields, transcript),
+            matching_folders
+        ))
+        
+        failed = [folder_path for folder_path, ok in zip(matching_folders, saved) if not ok]
+        if failed:
+            print(f"Transcript for session {session_id} not saved to {len(failed)} of "
+                  f"{len(matching_folders)} folders: {', '.join(failed)}")
+        return [folder_path for folder_path, ok in zip(matching_folders, saved) if ok], failed
+
+    def save_transcript(self, folder_path, transcript_filename, content, fields, transcript):
+        """Upload a serialized transcript to one lead folder; returns False after logging a failure"""
+        transcript_path = f"{folder_path}/Transcripts_JSON/{transcript_filename}"
         try:
-            # Wait a moment for recording to be ready
-            import time
-            time.sleep(5)
-            
-            # Get call recording details
-            recording_response = self.platform.get(f'/restapi/v1.0/account/~/call-recordings/{session_id}')
-            recording_data = recording_response.json()
-            
-            if recording_data.get('status') != 'Available':
-                print(f"Recording not yet available for session {session_id}")
-                return
-            
-            # Get RingSense transcript
-            transcript_response = self.platform.get(
-                f'/restapi/v1.0/account/~/call-recordings/{session_id}/ringsense'
-            )
-            transcript_data = transcript_response.json()
-            
-            # Find all matching lead folders
-            matching_folders = []
-            for phone in phone_numbers:
-                folders = self.find_lead_folders(phone)
-                matching_folders.extend(folders)
-            
-            # Remove duplicates
-            matching_folders = list(set(matching_folders))
-            
-            if not matching_folders:
-                print(f"No matching lead folders found for phone numbers: {phone_numbers}")
-                return
-            
-            # Save transcript to each matching folder
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            
-            for folder_path in matching_folders:
-                try:
-                    # Prepare transcript data
-                    transcript = {
-                        'recording_id': session_id,
-                        'call_metadata': {
-                            'direction': recording_data.get('direction'),
-                            'duration': recording_data.get('duration'),
-                            'start_time': recording_data.get('startTime'),
-                            'end_time': recording_data.get('endTime'),
-                            'from': recording_data.get('from', {}).get('phoneNumber'),
-                            'to': recording_data.get('to', {}).get('phoneNumber')
-                        },
-                        'transcript': transcript_data
-                    }
-                    
-                    # Save transcript
-                    transcript_filename = f"transcript_{timestamp}_{session_id}.json"
-                    transcript_path = f"{folder_path}/Transcripts_JSON/{transcript_filename}"
-                    
-                    File.save_content(
-                        self.ctx,
-                        transcript_path,
-                        json.dumps(transcript, indent=2)
-                    )
-                    print(f"Saved transcript to {transcript_path}")
-                    
-                except Exception as e:
-                    print(f"Error saving to folder {folder_path}: {str(e)}")
-                    continue
+            upload_content(self.ctx, transcript_path, content, fields=fields)
+            get_phone_index().add_transcript(transcript, folder_path)
+            metrics.record_transcript_saved('webhook', transcript['call_metadata'])
+            print(f"Saved transcript to {transcript_path}")
+            return True
             
         except Exception as e:
-            print(f"Error processing recording: {str(e)}")
+            print(f"Error saving to folder {folder_path}: {str(e)}")
+            metrics.stage_error('webhook.save_transcript')
+            return False
+
+_fanout_pool = None
+_fanout_pool_lock = threading.Lock()
+
+def get_fanout_pool():
+    """Return the process-wide upload pool, created on first use
+
+    Shared by every handler so the total number of uploads in flight stays
+    bounded, and long-lived so its threads keep their SharePoint contexts.
+    """
+    global _fanout_pool
+    with _fanout_pool_lock:
+        if _fanout_pool is None:
+            _fanout_pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='fanout')
+        return _fanout_pool
+
+def retry_webhook_recording(payload):
+    """Job handler for recordings queued by the session coalescer
+
+    Folders the transcript reached are kept in the payload, so a retry after
+    a failed upload, or a rerun for numbers merged in meanwhile, only saves
+    it where it is still missing.
+    """
+    handler = WebhookHandler()
+    saved_folders = payload.get('saved_folders', [])
+    saved, failed = handler.process_recording(payload['session_id'], payload['phone_numbers'], saved_folders)
+    updates = {'saved_folders': sorted(set(saved_folders) | set(saved))}
+    if failed:
+        raise PartialFailure(f"Transcript not saved to {', '.join(failed)}", updates)
+    return updates
 
 def handle_new_recording(webhook_data):
     """Main function to handle new recording webhook"""
@@ -0,0 +1,203 @@
+import os
+import json
+import hmac
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from webhook_handler import WebhookHandler
+from retry_scheduler import get_scheduler
+import metrics
+
+# Load environment variables
+load_dotenv()
+
+MAX_BODY_BYTES = 1024 * 1024
+
+# Without RC_WEBHOOK_VERIFICATION_TOKEN the server refuses to start, unless this
+# is set to accept notifications from anyone who can reach it (e.g. behind a
+# proxy that checks them)
+ALLOW_UNVERIFIED = os.getenv('WEBHOOK_ALLOW_UNVERIFIED', '0') == '1'
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    503: 'Service Unavailable'
+}
+
+
+class WebhookServer:
+    """Asyncio HTTP receiver that acknowledges RingCentral webhooks immediately
+
+    Validation requests are answered by echoing the Validation-Token header.
+    Notifications are checked against the subscription's verification token,
+    put on a bounded queue and acknowledged with 200 straight away; a fixed
+    pool of workers drains the queue through WebhookHandler.handle_webhook.
+    When the queue is full the server answers 503 so RingCentral redelivers
+    later, instead of holding connections open. GET /metrics returns the
+    process's metrics in the Prometheus text format.
+
+    Without a verification token the server does not start, unless
+    allow_unverified (WEBHOOK_ALLOW_UNVERIFIED) says so.
+    """
+
+    def __init__(self, host=None, port=None, workers=None, queue_size=None, verification_token=None,
+                 allow_unverified=None):
+        self.host = host or os.getenv('WEBHOOK_HOST', '0.0.0.0')
+        self.port = int(port or os.getenv('WEBHOOK_PORT', '8080'))
+        self.workers = int(workers or os.getenv('WEBHOOK_WORKERS', '4'))
+        self.queue_size = int(queue_size or os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+        self.verification_token = verification_token or os.getenv('RC_WEBHOOK_VERIFICATION_TOKEN')
+        if not self.verification_token and not (ALLOW_UNVERIFIED if allow_unverified is None else allow_unverified):
+            raise ValueError(
+                "RC_WEBHOOK_VERIFICATION_TOKEN is not set; set it to the subscription's verification token, "
+                "or set WEBHOOK_ALLOW_UNVERIFIED=1 to accept unverified notifications"
+            )
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='webhook')
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection until the client closes it"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    await self.respond(writer, 400, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                # Bodies are only read by Content-Length (no chunked encoding)
+                if 'content-length' not in headers:
+                    if method == 'POST':
+                        await self.respond(writer, 411, keep_alive=False)
+                        break
+                    length = 0
+                else:
+                    try:
+                        length = int(headers['content-length'])
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        await self.respond(writer, 400, keep_alive=False)
+                        break
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, 413, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if method == 'GET' and path.split('?', 1)[0] == '/metrics':
+                    await self.respond(writer, 200, {
+                        'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'
+                    }, keep_alive, metrics.render_prometheus().encode('utf-8'))
+                else:
+                    status, extra_headers = self.dispatch(method, headers, body)
+                    await self.respond(writer, status, extra_headers, keep_alive)
+                if not keep_alive:
+                    break
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def dispatch(self, method, headers, body):
+        """Decide the response for a request; never blocks on processing"""
+        if method != 'POST':
+            return 405, {}
+
+        # Subscription validation: echo the token back in the header
+        validation_token = headers.get('validation-token')
+        if validation_token:
+            return 200, {'Validation-Token': validation_token}
+
+        if self.verification_token and not hmac.compare_digest(
+            headers.get('verification-token', ''), self.verification_token
+        ):
+            print("Rejected webhook with invalid verification token")
+            return 403, {}
+
+        try:
+            event = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return 400, {}
+
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            print("Webhook queue full, asking RingCentral to redeliver")
+            metrics.inc('webhook_events_total', outcome='rejected')
+            return 503, {'Retry-After': '30'}
+        metrics.inc('webhook_events_total', outcome='queued')
+        return 200, {}
+
+    async def respond(self, writer, status, headers=None, keep_alive=True, body=b''):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Length: {len(body)}"]
+        lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def worker(self):
+        """Drain queued events through a WebhookHandler owned by this worker"""
+        loop = asyncio.get_running_loop()
+        handler = await loop.run_in_executor(self.executor, WebhookHandler)
+        while True:
+            event = await self.queue.get()
+            try:
+                await loop.run_in_executor(self.executor, handler.handle_webhook, event)
+            except Exception as e:
+                print(f"Error handling queued webhook: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    async def serve(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        print(f"Listening for webhooks on {self.host}:{self.port} with {self.workers} workers")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in workers:
+                task.cancel()
+            self.executor.shutdown(wait=False)
+
+
+def run_server():
+    """Run the webhook receiver, with scheduled retries processed in the background"""
+    stop_event = threading.Event()
+    retries = threading.Thread(
+        target=get_scheduler().run_forever,
+        kwargs={'workers': int(os.getenv('RETRY_WORKERS', '4')), 'stop_event': stop_event},
+        daemon=True
+    )
+    retries.start()
+    try:
+        asyncio.run(WebhookServer().serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+
+
+if __name__ == "__main__":
+    run_server()